@@ -0,0 +1,238 @@
+import os
+import json
+import numpy as np
+
+from vector_index import VectorIndex, normalize_rows, top_k_indices
+
+def spherical_kmeans(vectors, n_clusters, n_iter=15, seed=0):
+    """Cluster unit vectors by cosine similarity, returning normalized centroids"""
+    rng = np.random.default_rng(seed)
+    centroids = vectors[rng.choice(len(vectors), n_clusters, replace=False)].copy()
+
+    for _ in range(n_iter):
+        assignments = assign_to_centroids(vectors, centroids)
+        sums = np.zeros_like(centroids)
+        np.add.at(sums, assignments, vectors)
+        counts = np.bincount(assignments, minlength=n_clusters)
+
+        # Re-seed empty clusters with random points so every list stays useful
+        empty = np.flatnonzero(counts == 0)
+        if len(empty):
+            sums[empty] = vectors[rng.choice(len(vectors), len(empty), replace=False)]
+        centroids = normalize_rows(sums)
+
+    return centroids
+
+def assign_to_centroids(vectors, centroids, block_size=65536):
+    """Index of the most similar centroid for each vector, computed in blocks to bound memory"""
+    assignments = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), block_size):
+        block = vectors[start:start + block_size]
+        assignments[start:start + block_size] = np.argmax(block @ centroids.T, axis=1)
+    return assignments
+
+class IVFIndex(VectorIndex):
+    """Approximate cosine-similarity index using an inverted file (IVF).
+
+    A k-means coarse quantizer splits the embeddings into n_lists clusters.
+    A query only scores the chunks in its nprobe closest clusters; raising
+    nprobe trades latency for recall. Until enough vectors have been added
+    to train the quantizer, searches fall back to exact scoring.
+
+    Each row may carry the content hash of the embedding it holds (see
+    EmbeddingEngine.last_hashes), saved with the index, so a persisted index
+    can tell which rows are stale when it is loaded again.
+    """
+
+    def __init__(self, n_lists=None, nprobe=8, min_train_size=2048, retrain_factor=4, seed=0):
+        super().__init__()
+        self.n_lists = n_lists
+        self.nprobe = nprobe
+        self.min_train_size = min_train_size
+        self.retrain_factor = retrain_factor
+        self.seed = seed
+        self.centroids = None
+        self.trained_size = 0
+        self._assignments = np.empty(0, dtype=np.int32)
+        # chunk_id -> content hash of its embedding, where known
+        self.hashes = {}
+        # (row order, bounds) of the lists, built on first search; one attribute so a reader never sees half of it
+        self._lists_cache = None
+
+    @property
+    def is_trained(self):
+        return self.centroids is not None
+
+    def train(self):
+        """Fit the coarse quantizer on the current embeddings and assign every row"""
+        vectors = self.matrix
+        n_lists = self.n_lists or max(1, int(np.sqrt(len(vectors))))
+        n_lists = min(n_lists, len(vectors))
+
+        # k-means only needs a sample; a few hundred points per list is plenty
+        rng = np.random.default_rng(self.seed)
+        sample_size = min(len(vectors), 256 * n_lists)
+        sample = vectors[rng.choice(len(vectors), sample_size, replace=False)]
+
+        self.centroids = spherical_kmeans(sample, n_lists, seed=self.seed)
+        self._assignments = assign_to_centroids(vectors, self.centroids)
+        self.trained_size = len(vectors)
+        self._lists_cache = None
+
+    def add(self, ids, vectors, hashes=None):
+        """Insert or replace embeddings, assigning them to their nearest list; hashes are their content hashes"""
+        previous_size = self._size
+        super().add(ids, vectors)
+        for chunk_id, digest in zip(ids, hashes or [None] * len(ids)):
+            if digest is None:
+                self.hashes.pop(chunk_id, None)
+            else:
+                self.hashes[chunk_id] = digest
+
+        if not self.is_trained:
+            if self._size >= self.min_train_size:
+                self.train()
+            return
+        if self._size > self.retrain_factor * self.trained_size:
+            self.train()
+            return
+
+        # Replacements may have changed existing rows, so reassign those as well
+        rows = np.array([self.id_to_row[chunk_id] for chunk_id in ids], dtype=np.int64)
+        assignments = np.empty(self._size, dtype=np.int32)
+        assignments[:previous_size] = self._assignments[:previous_size]
+        assignments[rows] = assign_to_centroids(self.matrix[rows], self.centroids)
+        self._assignments = assignments
+        self._lists_cache = None
+
+    def _move_row(self, source, target):
+        super()._move_row(source, target)
+        if self.is_trained:
+            self._assignments[target] = self._assignments[source]
+
+    def remove(self, ids):
+        """Remove chunk ids and drop them from their lists"""
+        ids = set(ids)
+        removed = super().remove(ids)
+        for chunk_id in ids:
+            self.hashes.pop(chunk_id, None)
+        if removed and self.is_trained:
+            self._assignments = self._assignments[:self._size].copy()
+            self._lists_cache = None
+        return removed
+
+    def copy(self):
+        index = super().copy()
+        index._assignments = self._assignments.copy()
+        index.hashes = dict(self.hashes)
+        return index
+
+    def stale_ids(self, hashes):
+        """Indexed chunk ids whose stored content hash is missing or differs from hashes"""
+        return [chunk_id for chunk_id in self.ids if chunk_id in hashes and self.hashes.get(chunk_id) != hashes[chunk_id]]
+
+    def _lists(self):
+        """Rows grouped by list: (row order, bounds) so list j is order[bounds[j]:bounds[j + 1]]"""
+        if self._lists_cache is None:
+            order = np.argsort(self._assignments, kind="stable")
+            bounds = np.searchsorted(self._assignments[order], np.arange(len(self.centroids) + 1))
+            self._lists_cache = (order, bounds)
+        return self._lists_cache
+
+    def _candidate_rows(self, centroid_scores, top_k, mask, nprobe):
+        """Rows in the closest lists, probing more lists until top_k allowed rows are found"""
+        order, bounds = self._lists()
+        probe_order = np.argsort(-centroid_scores)
+        nprobe = max(1, nprobe)
+
+        while True:
+            probed = probe_order[:nprobe]
+            rows = np.concatenate([order[bounds[j]:bounds[j + 1]] for j in probed])
+            if mask is not None:
+                # Filter before scoring so clearance restrictions cannot starve the result
+                rows = rows[mask[rows]]
+            if len(rows) >= top_k or nprobe >= len(probe_order):
+                return rows
+            nprobe *= 2
+
+    def search_many(self, queries, top_k=5, mask=None, nprobe=None):
+        """Approximate top_k search for several queries, one result list per query.
+
+        nprobe overrides the index's probe count for this call, so callers
+        sharing the index can each choose their own recall/latency trade-off.
+        """
+        if not self.is_trained:
+            return super().search_many(queries, top_k, mask=mask)
+
+        queries = normalize_rows(np.atleast_2d(queries))
+        if mask is not None:
+            top_k = min(top_k, int(np.count_nonzero(mask)))
+
+        centroid_scores = queries @ self.centroids.T
+        results = []
+        for query, query_centroid_scores in zip(queries, centroid_scores):
+            rows = self._candidate_rows(query_centroid_scores, top_k, mask, nprobe or self.nprobe)
+            scores = self.matrix[rows] @ query
+            best = top_k_indices(scores, top_k)
+            results.append([(self.ids[rows[i]], float(scores[i])) for i in best])
+        return results
+
+    def search(self, query, top_k=5, mask=None, nprobe=None):
+        """Approximate top_k search for a single query"""
+        if self._size == 0:
+            return []
+        return self.search_many(query, top_k, mask=mask, nprobe=nprobe)[0]
+
+    def save(self, path):
+        """Persist the index atomically as a .npz file"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        arrays = {
+            "matrix": self.matrix,
+            "ids": np.array(json.dumps(self.ids)),
+            "hashes": np.array(json.dumps([self.hashes.get(chunk_id) for chunk_id in self.ids])),
+            "params": np.array(json.dumps({
+                "n_lists": self.n_lists,
+                "nprobe": self.nprobe,
+                "min_train_size": self.min_train_size,
+                "retrain_factor": self.retrain_factor,
+                "seed": self.seed,
+                "trained_size": self.trained_size
+            }))
+        }
+        if self.is_trained:
+            arrays["centroids"] = self.centroids
+            arrays["assignments"] = self._assignments
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path, nprobe=None):
+        """Load an index written by save(); nprobe overrides the stored value"""
+        with np.load(path) as data:
+            params = json.loads(str(data["params"]))
+            index = cls(
+                n_lists=params["n_lists"],
+                nprobe=nprobe if nprobe is not None else params["nprobe"],
+                min_train_size=params["min_train_size"],
+                retrain_factor=params["retrain_factor"],
+                seed=params["seed"]
+            )
+            ids = json.loads(str(data["ids"]))
+            if ids:
+                VectorIndex.add(index, ids, data["matrix"])
+            # Indexes saved without hashes have rows of unknown provenance
+            if "hashes" in data:
+                index.hashes = {
+                    chunk_id: digest for chunk_id, digest in zip(ids, json.loads(str(data["hashes"]))) if digest
+                }
+            if "centroids" in data:
+                index.centroids = data["centroids"]
+                index._assignments = data["assignments"]
+                index.trained_size = params["trained_size"]
+        return index
@@ -1,22 +1,22 @@
 import streamlit as st
-import os
-import numpy as np
-from pathlib import Path
 
 # Import custom modules
 from utils import setup_environment, setup_directories, setup_page
-from document_processor import DocumentProcessor
-from embedding_engine import EmbeddingEngine
-from query_processor import QueryProcessor
-from security_protocol import SecurityProtocol
-from retrieval_engine import RetrievalEngine
-from response_generator import ResponseGenerator
+from corpus_service import CorpusService
+from ingest import load_manifest
+from tracing import tracer, TRACE_FILE
 
 # Setup environment and configure app
 api_key = setup_environment()
 setup_directories()
 setup_page()
 
+@st.cache_resource
+def get_corpus_service():
+    """Corpus and pipeline state shared by all sessions and reruns of this process"""
+    # Documents that make up the corpus are listed in corpus.json
+    return CorpusService(load_manifest())
+
 # ---------- STREAMLIT UI COMPONENTS ---------- #
 
 # Sidebar
@@ -40,7 +40,19 @@ with st.sidebar.expander("Advanced Settings"):
     force_reprocess = st.checkbox("Force document reprocessing", value=False)
     chunk_strategy = st.radio("Chunking Strategy", ["Semantic", "Fixed-Size"])
     top_k_results = st.slider("Number of results to retrieve", min_value=3, max_value=10, value=5)
+    fusion_strategy = st.radio("Result fusion", ["Max score", "Reciprocal rank fusion"])
+    retrieval_mode = st.radio("Retrieval mode", ["Vector", "Hybrid (vector + BM25)", "Lexical (BM25)"])
+    hybrid_weight = st.slider("Vector weight in hybrid mode", min_value=0.0, max_value=1.0, value=0.5, step=0.05,
+                              disabled=retrieval_mode != "Hybrid (vector + BM25)")
+    embedding_timeout = st.number_input("Query embedding timeout (s, 0 = none)", min_value=0.0, value=0.0, step=0.5)
+    use_entity_graph = st.checkbox("Entity graph expansion", value=False)
+    # Within the graph's precomputed radius: 1 = chunks mentioning the query's entities, 2 = chunks sharing a section
+    # or an entity with those; further hops reach most of the corpus through section hubs
+    graph_hops = st.slider("Entity graph hops", min_value=1, max_value=2, value=2, disabled=not use_entity_graph)
+    use_ann_index = st.checkbox("Approximate nearest-neighbour search", value=False)
+    ann_nprobe = st.slider("Clusters probed per query", min_value=1, max_value=64, value=8, disabled=not use_ann_index)
     show_debug_info = st.checkbox("Show debug information", value=False)
+    record_traces = st.checkbox("Record pipeline traces", value=False, help=f"Append each query's stage timings to {TRACE_FILE}")
 
 # Main content
 st.title("Project SHADOW - Intelligence Retrieval System")
@@ -53,6 +65,8 @@ Please enter your query below and ensure you have appropriate clearance.
 query = st.text_area("Enter your query:", "What is the status of Operation Phantom Veil, and what are the recommended counter-surveillance techniques?")
 
 if st.button("Submit Query"):
+    # Stage timings are only recorded when they will be shown or exported
+    trace = tracer.start("query", user_level=user_level) if show_debug_info or record_traces else None
     with st.spinner("Processing your query..."):
         try:
             # Check for API key
@@ -61,103 +75,88 @@ if st.button("Submit Query"):
                 st.info("Create a .env file with: GOOGLE_API_KEY=your_key_here")
                 st.stop()
             
-            # Initialize pipeline components
-            query_processor = QueryProcessor()
-            embedding_engine = EmbeddingEngine()
-            retrieval_engine = RetrievalEngine(embedding_engine)
-            response_generator = ResponseGenerator()
-            
-            # Process documents
-            document_paths = {
-                "Secret_Info_Manual": "SECRET INFO MANUAL.docx",
-                "Response_Framework": "RAG CASE RESPONSE FRAMEWORK.docx"
-            }
-            
-            # Process and chunk documents
-            all_chunks = []
-            for doc_id, doc_name in document_paths.items():
-                file_path = str(Path(doc_name).resolve())
-                if os.path.exists(file_path):
-                    doc_chunks = DocumentProcessor.process_document(file_path, doc_id, force_reprocess)
-                    all_chunks.extend(doc_chunks)
-                else:
-                    st.warning(f"Document not found: {file_path}")
-            
-            if not all_chunks:
+            # Load (or reuse) the warm corpus and pipeline components
+            corpus = get_corpus_service().ensure_loaded(force_reprocess)
+            # One version of the corpus for this query, even if another session reloads it meanwhile
+            snapshot = corpus.snapshot
+            query_processor = corpus.query_processor
+            embedding_engine = corpus.embedding_engine
+            retrieval_engine = corpus.retrieval_engine
+            response_generator = corpus.response_generator
+            
+            for file_path in corpus.missing_documents:
+                st.warning(f"Document not found: {file_path}")
+            if corpus.unembedded_chunks:
+                st.warning(f"{len(corpus.unembedded_chunks)} chunks could not be embedded and are only found by keyword (BM25) "
+                           "retrieval; they will be retried when the corpus is next reloaded.")
+            
+            if not snapshot.chunks:
                 st.error("No document content was loaded. Please check that the document files exist and are accessible.")
                 st.stop()
             
             # Process query
             query_analysis = query_processor.analyze_query(query)
-            expanded_queries = query_processor.expand_query(query, query_analysis)
-            
-            # Apply security protocol - filter chunks by clearance
-            allowed_chunks = SecurityProtocol.filter_by_clearance(all_chunks, user_level)
-            
-            if not allowed_chunks:
+            # With the entity graph, chunks about the entities come from one graph lookup
+            # instead of extra per-entity queries that each need an embedding
+            expanded_queries = query_processor.expand_query(query, query_analysis, entity_expansions=not use_entity_graph)
+            entity_chunk_ids = None
+            if use_entity_graph and corpus.entity_graph is not None:
+                with tracer.span("entity_graph", hops=graph_hops) as span:
+                    query_entities = query_analysis["entities"]["operations"] + query_analysis["entities"]["protocols"]
+                    entity_chunk_ids = list(corpus.entity_graph.chunks_near(query_entities, hops=graph_hops))
+                    span.set(chunks=len(entity_chunk_ids))
+            
+            # Apply security protocol - clearance masks are precomputed when the corpus loads
+            with tracer.span("check_clearance"):
+                has_access = snapshot.has_access(user_level)
+            if not has_access:
                 st.warning("Access Denied — Clearance Insufficient.")
                 st.stop()
             
-            # Compute embeddings for documents
-            document_embeddings = {}
-            for doc_id in document_paths.keys():
-                doc_chunks = [c for c in all_chunks if c["document"] == doc_id]
-                if doc_chunks:
-                    doc_embeddings = embedding_engine.compute_document_embeddings(
-                        doc_chunks,
-                        doc_id,
-                        force_recompute=force_reprocess
-                    )
-                    document_embeddings.update(doc_embeddings)
-            
-            # Retrieve relevant chunks for each expanded query
-            all_relevant_chunks = []
-            chunk_scores = {}
-            
-            for expanded_query in expanded_queries:
-                relevant_chunks, scores = retrieval_engine.retrieve_relevant_chunks(
-                    expanded_query,
-                    allowed_chunks,
-                    document_embeddings,
-                    top_k=top_k_results
-                )
-                
-                # Add to overall collection
-                for chunk in relevant_chunks:
-                    # Add similarity score to the chunk
-                    chunk_id = chunk["id"]
-                    if chunk_id in scores:
-                        chunk["similarity_score"] = scores[chunk_id]
-                    all_relevant_chunks.append(chunk)
-                    
-                    # Update scores
-                    for chunk_id, score in scores.items():
-                        if chunk_id not in chunk_scores or score > chunk_scores[chunk_id]:
-                            chunk_scores[chunk_id] = score
-            
-            # Remove duplicates based on chunk_id
-            unique_chunks = {}
-            for chunk in all_relevant_chunks:
-                if chunk["id"] not in unique_chunks or chunk.get("similarity_score", 0) > unique_chunks[chunk["id"]].get("similarity_score", 0):
-                    unique_chunks[chunk["id"]] = chunk
-            
-            # Sort by similarity score
-            final_relevant_chunks = sorted(unique_chunks.values(), key=lambda x: x.get("similarity_score", 0), reverse=True)
-            
-            # Take only top k after combining results from all queries
-            final_relevant_chunks = final_relevant_chunks[:top_k_results]
+            # Retrieve relevant chunks for all expanded queries in one batch
+            final_relevant_chunks, chunk_scores = retrieval_engine.retrieve_many(
+                expanded_queries,
+                snapshot.chunks,
+                snapshot.embeddings,
+                top_k=top_k_results,
+                fusion="rrf" if fusion_strategy == "Reciprocal rank fusion" else "max",
+                user_level=user_level,
+                security_levels=snapshot.security_levels,
+                mode={"Hybrid (vector + BM25)": "hybrid", "Lexical (BM25)": "lexical"}.get(retrieval_mode, "vector"),
+                entity_chunk_ids=entity_chunk_ids,
+                # Settings of this session only; the engine is shared by every session
+                index_type="ivf" if use_ann_index else "exact",
+                nprobe=ann_nprobe,
+                hybrid_weight=hybrid_weight,
+                timeout=embedding_timeout or None
+            )
+            if retrieval_mode != "Lexical (BM25)" and retrieval_engine.last_mode == "lexical":
+                st.info("Query embedding was unavailable; results come from keyword (BM25) matching only.")
+
+            # Add the fused score to copies of the chunks for display; the corpus chunks are shared
+            final_relevant_chunks = [
+                dict(chunk, similarity_score=chunk_scores[chunk["id"]]) for chunk in final_relevant_chunks
+            ]
             
-            # Generate response
-            response = response_generator.generate_response(
+            # Generate the response, rendering it incrementally as it streams in
+            st.subheader("Response:")
+            response_placeholder = st.empty()
+            response = ""
+            for piece in response_generator.generate_response_stream(
                 query,
                 query_analysis,
                 final_relevant_chunks,
-                user_level
-            )
-            
-            # Display the response
-            st.subheader("Response:")
-            st.markdown(response)
+                user_level,
+                # Skip the near-duplicate lookup rather than wait on an embedding backend that just failed
+                query_embedding=embedding_engine.get_query_embedding(query) if retrieval_engine.last_mode != "lexical" else None
+            ):
+                response += piece
+                response_placeholder.markdown(response + "▌")
+            response_placeholder.markdown(response)
+            
+            tracer.finish(trace)
+            if record_traces:
+                tracer.export_jsonl(TRACE_FILE, [trace])
             
             # Show debug information if enabled
             if show_debug_info:
@@ -167,6 +166,32 @@ if st.button("Submit Query"):
                 with st.expander("Expanded Queries"):
                     for i, expanded_query in enumerate(expanded_queries):
                         st.write(f"{i+1}. {expanded_query}")
+                    if entity_chunk_ids is not None:
+                        st.write(f"Entity graph: {len(entity_chunk_ids)} chunks within {graph_hops} hops of the query's entities")
+                
+                with st.expander("Response Timing"):
+                    st.json(response_generator.last_timings)
+                
+                with st.expander("Stage Timings"):
+                    st.write(f"Total: {trace.duration * 1000:.1f} ms")
+                    st.dataframe(trace.rows(), use_container_width=True)
+                    st.download_button("Download trace (JSON lines)", trace.to_json() + "\n",
+                                       file_name=f"trace-{trace.trace_id}.jsonl", mime="application/x-ndjson")
+                    st.download_button("Download metrics (Prometheus text)", tracer.prometheus_text(),
+                                       file_name="shadow-metrics.prom", mime="text/plain")
+                
+                with st.expander("Cache Statistics"):
+                    st.json({
+                        "query_embeddings": embedding_engine.query_cache.stats(),
+                        "chunk_embeddings": embedding_engine.cache.stats(),
+                        "responses": response_generator.cache.stats()
+                    })
+                
+                with st.expander("Backend Clients"):
+                    st.json({
+                        "embedding": embedding_engine.client.stats(),
+                        "llm": response_generator.client.stats()
+                    })
                 
                 with st.expander("Retrieved Chunks"):
                     for i, chunk in enumerate(final_relevant_chunks):
@@ -180,3 +205,6 @@ if st.button("Submit Query"):
             st.error(f"An error occurred: {str(e)}")
             import traceback
             st.code(traceback.format_exc())
+        finally:
+            # Also ends the trace when the handler stops early
+            tracer.finish(trace)
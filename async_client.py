@@ -0,0 +1,225 @@
+import time
+import random
+import asyncio
+import hashlib
+import threading
+import functools
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+from tracing import tracer
+
+# Default limits of the shared clients, in requests per second
+EMBEDDING_RATE_LIMIT = 25.0
+LLM_RATE_LIMIT = 5.0
+
+# HTTP statuses worth retrying: request timeout, rate limiting and server-side failures
+TRANSIENT_STATUSES = {408, 429, 500, 502, 503, 504}
+
+class TransientError(Exception):
+    """A failure that may succeed on retry; backends raise it for their own timeout, rate-limit and 5xx errors"""
+
+    def __init__(self, message, status=None):
+        super().__init__(message)
+        self.status = status
+
+# Retried by default; anything else (bad request, bad credentials, a bug) fails on the first attempt
+TRANSIENT_ERRORS = (TransientError, TimeoutError, ConnectionError)
+
+@contextmanager
+def transient_http_errors():
+    """Re-raise errors carrying a retryable HTTP status as TransientError.
+
+    The status is read from a code or status_code attribute, as on
+    google.api_core exceptions, so no client library needs to be imported.
+    """
+    try:
+        yield
+    except TRANSIENT_ERRORS:
+        raise
+    except Exception as e:
+        status = getattr(e, "code", None) or getattr(e, "status_code", None)
+        if isinstance(status, int) and status in TRANSIENT_STATUSES:
+            raise TransientError(str(e), status) from e
+        raise
+
+class RequestFailed(Exception):
+    """A request that still failed after every retry; the last error is its __cause__"""
+
+    def __init__(self, client_name, attempts, error):
+        super().__init__(f"{client_name} request failed after {attempts} attempt(s): {error}")
+        self.client_name = client_name
+        self.attempts = attempts
+
+class TokenBucket:
+    """Token-bucket rate limiter: rate tokens per second, holding at most capacity"""
+
+    def __init__(self, rate, capacity=None):
+        self.rate = rate
+        self.capacity = capacity if capacity is not None else max(1.0, rate)
+        self._tokens = self.capacity
+        self._updated = time.monotonic()
+
+    def _refill(self):
+        now = time.monotonic()
+        self._tokens = min(self.capacity, self._tokens + (now - self._updated) * self.rate)
+        self._updated = now
+
+    async def acquire(self, tokens=1.0):
+        """Wait until tokens are available and take them; returns the seconds spent waiting"""
+        waited = 0.0
+        while True:
+            self._refill()
+            if self._tokens >= tokens:
+                self._tokens -= tokens
+                return waited
+            delay = (tokens - self._tokens) / self.rate
+            await asyncio.sleep(delay)
+            waited += delay
+
+class RetryPolicy:
+    """Exponential backoff with full jitter: attempt n waits uniformly up to base_delay * 2**n, capped at max_delay.
+
+    Only errors in retry_on are retried, by default the transient ones.
+    """
+
+    def __init__(self, max_attempts=4, base_delay=0.5, max_delay=8.0, retry_on=TRANSIENT_ERRORS, seed=None):
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.retry_on = retry_on
+        self._random = random.Random(seed)
+
+    def delay(self, attempt):
+        return self._random.uniform(0.0, min(self.max_delay, self.base_delay * 2 ** attempt))
+
+    def should_retry(self, error, attempt):
+        return attempt + 1 < self.max_attempts and isinstance(error, self.retry_on)
+
+class AsyncClient:
+    """Shared client layer for calls to an external service.
+
+    Every call passes a token-bucket rate limit and a concurrency limit, is
+    retried with jittered exponential backoff, and, when given a key, shares
+    its result with identical calls already in flight. Blocking backend
+    functions run on a thread pool; the client keeps its own event loop on a
+    background thread, so it can be used from synchronous code (call) as well
+    as from coroutines on any loop (acall). Counters are available from stats().
+    """
+
+    def __init__(self, name, rate=None, burst=None, max_concurrency=8, retry=None):
+        self.name = name
+        self.rate = rate
+        self.burst = burst
+        self.max_concurrency = max_concurrency
+        self.retry = retry or RetryPolicy()
+        self.metrics = {
+            "requests": 0,       # calls made through the client
+            "backend_calls": 0,  # attempts that reached the backend
+            "deduplicated": 0,   # calls answered by an identical call in flight
+            "retries": 0,
+            "failures": 0,       # calls that failed after every retry
+            "rate_limit_wait_seconds": 0.0,
+            "backend_seconds": 0.0
+        }
+
+        self._loop = None
+        self._loop_lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(max_workers=max_concurrency, thread_name_prefix=f"{name}-client")
+        # Created on the client loop: the bucket, semaphore and in-flight table are only touched there
+        self._bucket = None
+        self._semaphore = None
+        self._inflight = {}
+
+    @staticmethod
+    def make_key(*parts):
+        """Deduplication key for a request made of string parts"""
+        digest = hashlib.sha256()
+        for part in parts:
+            digest.update(str(part).encode("utf-8"))
+            digest.update(b"\0")
+        return digest.hexdigest()
+
+    def _ensure_loop(self):
+        with self._loop_lock:
+            if self._loop is None:
+                self._loop = asyncio.new_event_loop()
+                threading.Thread(target=self._loop.run_forever, name=f"{self.name}-client-loop", daemon=True).start()
+                self._bucket = TokenBucket(self.rate, self.burst) if self.rate else None
+                self._semaphore = asyncio.Semaphore(self.max_concurrency)
+            return self._loop
+
+    async def _attempts(self, fn, args, kwargs):
+        loop = asyncio.get_running_loop()
+        attempt = 0
+        while True:
+            if self._bucket is not None:
+                self.metrics["rate_limit_wait_seconds"] += await self._bucket.acquire()
+            async with self._semaphore:
+                self.metrics["backend_calls"] += 1
+                start = time.perf_counter()
+                try:
+                    return await loop.run_in_executor(self._executor, functools.partial(fn, *args, **kwargs))
+                except Exception as e:
+                    error = e
+                finally:
+                    self.metrics["backend_seconds"] += time.perf_counter() - start
+
+            if not self.retry.should_retry(error, attempt):
+                self.metrics["failures"] += 1
+                raise RequestFailed(self.name, attempt + 1, error) from error
+            self.metrics["retries"] += 1
+            await asyncio.sleep(self.retry.delay(attempt))
+            attempt += 1
+
+    async def _call(self, fn, args, kwargs, key):
+        self.metrics["requests"] += 1
+        if key is None:
+            return await self._attempts(fn, args, kwargs)
+
+        pending = self._inflight.get(key)
+        if pending is not None:
+            self.metrics["deduplicated"] += 1
+            return await asyncio.shield(pending)
+
+        pending = asyncio.ensure_future(self._attempts(fn, args, kwargs))
+        self._inflight[key] = pending
+        try:
+            return await asyncio.shield(pending)
+        finally:
+            if pending.done():
+                self._inflight.pop(key, None)
+            else:
+                # The waiter was cancelled; forget the call once the backend finishes it
+                pending.add_done_callback(lambda _: self._inflight.pop(key, None))
+
+    def call(self, fn, *args, key=None, **kwargs):
+        """Run fn(*args, **kwargs) through the client from synchronous code.
+
+        Raises RequestFailed if every attempt fails. Calls with the same key
+        that overlap in time share one backend call and its result.
+        """
+        with tracer.span(f"{self.name}_client") as span:
+            future = asyncio.run_coroutine_threadsafe(self._call(fn, args, kwargs, key), self._ensure_loop())
+            try:
+                return future.result()
+            except RequestFailed as e:
+                span.set(attempts=e.attempts)
+                raise
+
+    async def acall(self, fn, *args, key=None, **kwargs):
+        """Coroutine version of call(), usable from any event loop"""
+        future = asyncio.run_coroutine_threadsafe(self._call(fn, args, kwargs, key), self._ensure_loop())
+        return await asyncio.wrap_future(future)
+
+    def stats(self):
+        return dict(self.metrics, in_flight=len(self._inflight))
+
+    def close(self):
+        if self._loop is not None:
+            self._loop.call_soon_threadsafe(self._loop.stop)
+        self._executor.shutdown(wait=False)
+
+# Clients shared by every engine in the process, so limits apply to the process as a whole
+shared_embedding_client = AsyncClient("embedding", rate=EMBEDDING_RATE_LIMIT, max_concurrency=8)
+shared_llm_client = AsyncClient("llm", rate=LLM_RATE_LIMIT, max_concurrency=4)
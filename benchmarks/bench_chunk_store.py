@@ -0,0 +1,99 @@
+"""Micro-benchmark: corpus chunks as a JSON list of dicts vs the columnar ChunkStore.
+
+Run from the repository root:
+    python -m benchmarks.bench_chunk_store --chunks 1000000
+
+Measures the time to load each persisted form and the Python heap it
+allocates per chunk (tracemalloc), then the cost of the lookups queries make:
+an id -> chunk map, and materializing one chunk.
+"""
+import gc
+import json
+import time
+import tempfile
+import argparse
+import tracemalloc
+
+from benchmarks.corpus import generate_chunks, OPERATIONS
+from chunk_store import ChunkStore
+
+def measure(load):
+    """(result, seconds, bytes of Python heap still allocated by load())"""
+    gc.collect()
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = load()
+    seconds = time.perf_counter() - start
+    allocated = tracemalloc.get_traced_memory()[0]
+    tracemalloc.stop()
+    return result, seconds, allocated
+
+def run(count=100000, seed=0):
+    chunks = generate_chunks(count, seed=seed)
+    # Give a share of the chunks operation names, as real documents have
+    for i, chunk in enumerate(chunks[::7]):
+        chunk["operations"] = [OPERATIONS[i % len(OPERATIONS)]]
+
+    with tempfile.TemporaryDirectory(prefix="shadow-bench-store-") as directory:
+        json_path = f"{directory}/corpus.json"
+        start = time.perf_counter()
+        with open(json_path, "w") as f:
+            json.dump(chunks, f)
+        json_write_seconds = time.perf_counter() - start
+
+        start = time.perf_counter()
+        ChunkStore.from_chunks(chunks).save(f"{directory}/store")
+        store_write_seconds = time.perf_counter() - start
+        del chunks
+
+        def load_json():
+            with open(json_path) as f:
+                return json.load(f)
+
+        loaded, json_load_seconds, json_bytes = measure(load_json)
+        _, json_map_seconds, json_map_bytes = measure(lambda: {chunk["id"]: i for i, chunk in enumerate(loaded)})
+        del loaded
+
+        store, store_load_seconds, store_bytes = measure(lambda: ChunkStore.load(f"{directory}/store"))
+        # The id map is built on the first lookup; chunk text stays in the memory-mapped buffer
+        _, store_map_seconds, store_map_bytes = measure(lambda: store.row(""))
+
+        start = time.perf_counter()
+        for row in range(0, count, max(1, count // 1000)):
+            store.get(store.ids[row])
+        lookup_us = (time.perf_counter() - start) / len(range(0, count, max(1, count // 1000))) * 1e6
+
+        return {
+            "chunks": count,
+            "json_write_seconds": json_write_seconds,
+            "json_load_seconds": json_load_seconds,
+            "json_bytes_per_chunk": json_bytes / count,
+            "json_id_map_seconds": json_map_seconds,
+            "json_id_map_bytes_per_chunk": json_map_bytes / count,
+            "store_write_seconds": store_write_seconds,
+            "store_load_seconds": store_load_seconds,
+            "store_bytes_per_chunk": store_bytes / count,
+            "store_id_map_seconds": store_map_seconds,
+            "store_id_map_bytes_per_chunk": store_map_bytes / count,
+            "store_column_bytes_per_chunk": store.nbytes() / count,
+            "store_get_microseconds": lookup_us
+        }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark loading and holding the chunk corpus")
+    parser.add_argument("--chunks", type=int, default=100000, help="synthetic chunks to store")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    r = run(args.chunks, args.seed)
+    print(f"{r['chunks']} chunks")
+    print(f"list of dicts (JSON): load {r['json_load_seconds']:.2f}s, {r['json_bytes_per_chunk']:.0f} B/chunk heap; "
+          f"id map {r['json_id_map_seconds']:.2f}s, +{r['json_id_map_bytes_per_chunk']:.0f} B/chunk")
+    print(f"ChunkStore:           load {r['store_load_seconds']:.3f}s, {r['store_bytes_per_chunk']:.0f} B/chunk heap "
+          f"({r['store_column_bytes_per_chunk']:.0f} B/chunk mapped); "
+          f"id map {r['store_id_map_seconds']:.2f}s, +{r['store_id_map_bytes_per_chunk']:.0f} B/chunk")
+    print(f"get(chunk id): {r['store_get_microseconds']:.1f} us")
+    print(f"write: JSON {r['json_write_seconds']:.2f}s, ChunkStore {r['store_write_seconds']:.2f}s")
+
+if __name__ == "__main__":
+    main()
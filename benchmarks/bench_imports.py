@@ -0,0 +1,72 @@
+"""Cold-start benchmark: time to import each entry point in a fresh interpreter.
+
+    python -m benchmarks.bench_imports --repeat 5
+
+Each import runs in a new process with -X importtime, so module caches from
+earlier runs do not count (the OS file cache still does, so the first repeat
+is usually the slowest). Reports the median total and the heaviest top-level
+packages pulled in.
+"""
+import sys
+import json
+import argparse
+import statistics
+import subprocess
+
+ENTRY_POINTS = ["query_service", "ingest", "corpus_service", "query_processor", "retrieval_engine", "document_processor"]
+
+def import_profile(module):
+    """{top-level module: cumulative microseconds} for one fresh import of module"""
+    output = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        capture_output=True, text=True, check=True
+    ).stderr
+
+    packages = {}
+    for line in output.splitlines():
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # header line
+        # A package's top-level module is imported once, and its cumulative time covers the whole package
+        name = name.strip()
+        if "." not in name:
+            packages[name] = int(cumulative)
+    return packages
+
+def run(modules, repeat=5):
+    results = {}
+    for module in modules:
+        totals, profiles = [], []
+        for _ in range(repeat):
+            profile = import_profile(module)
+            totals.append(profile.get(module, 0) / 1000.0)
+            profiles.append(profile)
+        heaviest = sorted(profiles[-1].items(), key=lambda item: item[1], reverse=True)
+        results[module] = {
+            "median_ms": statistics.median(totals),
+            "min_ms": min(totals),
+            "max_ms": max(totals),
+            "heaviest": {package: micros / 1000.0 for package, micros in heaviest[:6] if package != module}
+        }
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Measure import time of the entry points")
+    parser.add_argument("--modules", default=",".join(ENTRY_POINTS), help="comma-separated modules to import")
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--json", action="store_true", help="print results as JSON")
+    args = parser.parse_args(argv)
+
+    results = run([module for module in args.modules.split(",") if module], args.repeat)
+    if args.json:
+        print(json.dumps(results, indent=2))
+        return
+    for module, result in results.items():
+        heaviest = ", ".join(f"{package} {ms:.0f}" for package, ms in result["heaviest"].items())
+        print(f"{module:20s} median {result['median_ms']:8.1f} ms  (min {result['min_ms']:.1f}, "
+              f"max {result['max_ms']:.1f})  heaviest: {heaviest}")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,87 @@
+"""Micro-benchmark: chunk metadata extraction, legacy multi-regex vs MetadataExtractor.
+
+Run from the repository root:
+    python -m benchmarks.bench_metadata --chunks 100000
+"""
+import re
+import time
+import random
+import argparse
+
+from metadata_extractor import MetadataExtractor
+
+FILLER = ("the agent must report to the handler before any field contact is made and "
+          "all communication is logged according to standard procedure").split()
+MENTIONS = ["level 2", "Level 3", "clearance 5", "CLEARANCE 1", "Operation Eclipse",
+            "project Nightfall", "Protocol Zeta", "level 4", "operation S-29"]
+
+def legacy_extract(chunk_text):
+    """The per-chunk metadata code document_processor used before MetadataExtractor"""
+    security_level = 1
+    if re.search(r"level\s*[5-9]|clearance\s*[5-9]", chunk_text.lower(), re.IGNORECASE):
+        security_level = 4
+    elif re.search(r"level\s*[34]|clearance\s*[34]", chunk_text.lower(), re.IGNORECASE):
+        security_level = 3
+    elif re.search(r"level\s*2|clearance\s*2", chunk_text.lower(), re.IGNORECASE):
+        security_level = 2
+    elif re.search(r"level\s*1|clearance\s*1", chunk_text.lower(), re.IGNORECASE):
+        security_level = 1
+
+    operations = []
+    if re.search(r"operation\s+\w+|project\s+\w+|protocol\s+\w+", chunk_text.lower(), re.IGNORECASE):
+        op_matches = re.findall(r"operation\s+(\w+)|project\s+(\w+)|protocol\s+(\w+)", chunk_text, re.IGNORECASE)
+        for match in op_matches:
+            operations.extend([op for op in match if op])
+    return security_level, operations
+
+def synthetic_chunks(count, words_per_chunk=180, mention_rate=0.02, seed=0):
+    """Chunk-sized texts with clearance and operation mentions sprinkled in"""
+    rng = random.Random(seed)
+    chunks = []
+    for _ in range(count):
+        words = [rng.choice(MENTIONS) if rng.random() < mention_rate else rng.choice(FILLER)
+                 for _ in range(words_per_chunk)]
+        chunks.append(" ".join(words))
+    return chunks
+
+def run(count=100000, seed=0):
+    chunks = synthetic_chunks(count, seed=seed)
+    extractor = MetadataExtractor.default()
+
+    start = time.perf_counter()
+    legacy = [legacy_extract(text) for text in chunks]
+    legacy_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    extracted = [extractor.extract(text) for text in chunks]
+    extractor_seconds = time.perf_counter() - start
+
+    mismatches = sum(
+        1 for old, new in zip(legacy, extracted)
+        if old != (new["security_level"], new["operations"])
+    )
+    return {
+        "chunks": count,
+        "megabytes": sum(len(text) for text in chunks) / 1e6,
+        "legacy_seconds": legacy_seconds,
+        "extractor_seconds": extractor_seconds,
+        "speedup": legacy_seconds / extractor_seconds if extractor_seconds else float("inf"),
+        "mismatches": mismatches
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark chunk metadata extraction")
+    parser.add_argument("--chunks", type=int, default=100000, help="synthetic chunks to scan")
+    parser.add_argument("--seed", type=int, default=0)
+    args = parser.parse_args(argv)
+
+    result = run(args.chunks, args.seed)
+    print(f"{result['chunks']} chunks ({result['megabytes']:.1f} MB)")
+    print(f"legacy regexes:    {result['legacy_seconds']:.2f}s "
+          f"({result['chunks'] / result['legacy_seconds']:.0f} chunks/s)")
+    print(f"MetadataExtractor: {result['extractor_seconds']:.2f}s "
+          f"({result['chunks'] / result['extractor_seconds']:.0f} chunks/s)")
+    print(f"speedup: {result['speedup']:.2f}x, mismatches: {result['mismatches']}")
+
+if __name__ == "__main__":
+    main()
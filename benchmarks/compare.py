@@ -0,0 +1,72 @@
+"""Compare two benchmark result files and flag regressions.
+
+    python -m benchmarks.compare baseline.json current.json --threshold 0.1
+
+Every numeric metric present in both files is compared. Latencies and
+durations (names ending in _ms or _seconds, or "seconds") regress when they
+grow; throughputs (names ending in _per_second) regress when they shrink.
+Exits with status 1 if any metric regressed by more than the threshold.
+"""
+import sys
+import json
+import argparse
+
+def flatten(results, prefix=""):
+    """{"scenario/size/.../metric": value} for every numeric leaf"""
+    flat = {}
+    for key, value in results.items():
+        path = f"{prefix}/{key}" if prefix else key
+        if isinstance(value, dict):
+            flat.update(flatten(value, path))
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            flat[path] = float(value)
+    return flat
+
+def direction(metric):
+    """+1 if higher is better, -1 if lower is better, 0 if the metric is informational"""
+    name = metric.rsplit("/", 1)[-1]
+    if name.endswith("_per_second"):
+        return 1
+    if name.endswith("_ms") or name.endswith("_seconds") or name == "seconds":
+        return -1
+    return 0
+
+def compare(baseline, current, threshold=0.1):
+    """[(metric, baseline value, current value, relative change, regressed)] for shared metrics"""
+    before, after = flatten(baseline["results"]), flatten(current["results"])
+    rows = []
+    for metric in sorted(before.keys() & after.keys()):
+        sign = direction(metric)
+        if sign == 0:
+            continue
+        old, new = before[metric], after[metric]
+        change = (new - old) / old if old else 0.0
+        rows.append((metric, old, new, change, sign * change < -threshold))
+    return rows
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Diff two benchmark result files")
+    parser.add_argument("baseline")
+    parser.add_argument("current")
+    parser.add_argument("--threshold", type=float, default=0.1,
+                        help="relative change counted as a regression (default 0.1 = 10%%)")
+    parser.add_argument("--all", action="store_true", help="list every metric, not only regressions")
+    args = parser.parse_args(argv)
+
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.current) as f:
+        current = json.load(f)
+
+    rows = compare(baseline, current, args.threshold)
+    regressions = [row for row in rows if row[4]]
+    print(f"baseline {baseline['meta'].get('git_commit')} -> current {current['meta'].get('git_commit')}")
+    for metric, old, new, change, regressed in rows:
+        if args.all or regressed:
+            flag = "REGRESSION" if regressed else ""
+            print(f"{metric:70s} {old:12.3f} {new:12.3f} {change:+8.1%} {flag}")
+    print(f"{len(regressions)} regression(s) in {len(rows)} metrics (threshold {args.threshold:.0%})")
+    return 1 if regressions else 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,116 @@
+"""Synthetic corpora for benchmarks: DOCX documents or ready-made chunk lists.
+
+Every paragraph is sized to become one chunk and carries one clearance
+mention, drawn from a configurable clearance mix, plus occasional operation
+and protocol names. Output is fully determined by the seed.
+
+    python -m benchmarks.corpus --chunks 10000 --documents 10 --out /tmp/corpus
+"""
+import os
+import json
+import random
+import argparse
+
+FILLER = (
+    "agents handlers field report contact surveillance asset network courier signal "
+    "briefing extraction safehouse perimeter checkpoint rotation channel cipher relay "
+    "dossier source clearance directive handler review schedule transfer station "
+    "observation protocol window route protection fallback team unit compartment"
+).split()
+OPERATIONS = ["Phantom Veil", "Eclipse", "Hollow Stone", "Void", "Glass Veil", "Red Mist", "Vortex",
+              "Shadow Horizon", "Blue Cipher", "Whispering Gate", "Nightfall", "Iron Lantern"]
+PROTOCOLS = ["S-29", "Zeta", "Shadow Step", "Ghost-Step", "Omega Wave", "The Silent Room", "Cipher Delta"]
+
+# Clearance digit written in the text for each security level (see metadata_extractor.default_level_map)
+LEVEL_MENTIONS = {1: "1", 2: "2", 3: "3", 4: "5"}
+DEFAULT_CLEARANCE_MIX = {1: 0.4, 2: 0.3, 3: 0.2, 4: 0.1}
+
+def parse_clearance_mix(text):
+    """Parse "1:0.4,2:0.3,3:0.2,4:0.1" into {level: weight}"""
+    mix = {}
+    for item in text.split(","):
+        level, weight = item.split(":")
+        mix[int(level)] = float(weight)
+    return mix
+
+def paragraph_text(rng, level, words=90):
+    """One chunk-sized paragraph mentioning its clearance level and, sometimes, entities"""
+    body = rng.choices(FILLER, k=words)
+    body.insert(rng.randrange(len(body)), f"clearance level {LEVEL_MENTIONS[level]}")
+    if rng.random() < 0.3:
+        body.insert(rng.randrange(len(body)), f"Operation {rng.choice(OPERATIONS)}")
+    if rng.random() < 0.2:
+        body.insert(rng.randrange(len(body)), f"Protocol {rng.choice(PROTOCOLS)}")
+    return " ".join(body).capitalize() + "."
+
+def iter_paragraphs(count, clearance_mix=None, seed=0):
+    """Yield (level, paragraph text) for count paragraphs"""
+    clearance_mix = clearance_mix or DEFAULT_CLEARANCE_MIX
+    rng = random.Random(seed)
+    levels, weights = zip(*sorted(clearance_mix.items()))
+    for _ in range(count):
+        level = rng.choices(levels, weights)[0]
+        yield level, paragraph_text(rng, level)
+
+def generate_chunks(count, clearance_mix=None, seed=0, documents=10, paragraphs_per_section=20):
+    """Chunk dicts shaped like DocumentProcessor output, without writing any files"""
+    chunks = []
+    for i, (level, text) in enumerate(iter_paragraphs(count, clearance_mix, seed)):
+        doc_id = f"Doc_{i % documents}"
+        section = f"Section {i // documents // paragraphs_per_section}"
+        chunks.append({
+            "id": f"{doc_id}_{section}_{i}",
+            "text": text,
+            "document": doc_id,
+            "section": section,
+            "security_level": level,
+            "operations": [],
+            "position": i,
+            "start": 0,
+            "end": len(text)
+        })
+    return chunks
+
+def generate_docx_corpus(directory, chunks, documents=10, clearance_mix=None, seed=0, paragraphs_per_section=20):
+    """Write about chunks paragraphs across documents DOCX files and a corpus.json manifest.
+
+    Returns the manifest path.
+    """
+    import docx
+
+    os.makedirs(directory, exist_ok=True)
+    paragraphs = iter_paragraphs(chunks, clearance_mix, seed)
+    per_document = [chunks // documents + (1 if i < chunks % documents else 0) for i in range(documents)]
+
+    manifest = {"documents": {}, "directories": []}
+    for doc_index, count in enumerate(per_document):
+        document = docx.Document()
+        for i in range(count):
+            if i % paragraphs_per_section == 0:
+                document.add_heading(f"Section {i // paragraphs_per_section + 1}", 1)
+            document.add_paragraph(next(paragraphs)[1])
+        file_name = f"synthetic_{doc_index:04d}.docx"
+        document.save(os.path.join(directory, file_name))
+        manifest["documents"][f"Synthetic_{doc_index:04d}"] = file_name
+
+    manifest_path = os.path.join(directory, "corpus.json")
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest_path
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Generate a synthetic DOCX corpus")
+    parser.add_argument("--chunks", type=int, default=1000, help="approximate number of chunks")
+    parser.add_argument("--documents", type=int, default=10)
+    parser.add_argument("--clearance-mix", default="1:0.4,2:0.3,3:0.2,4:0.1", help="level:weight pairs")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", required=True, help="output directory")
+    args = parser.parse_args(argv)
+
+    manifest_path = generate_docx_corpus(
+        args.out, args.chunks, args.documents, parse_clearance_mix(args.clearance_mix), args.seed
+    )
+    print(f"Wrote {args.documents} documents, manifest {manifest_path}")
+
+if __name__ == "__main__":
+    main()
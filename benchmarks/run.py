@@ -0,0 +1,136 @@
+"""Run the benchmark scenarios on synthetic corpora and write the results as JSON.
+
+    python -m benchmarks.run --sizes 1000,10000 --output results.json
+    python -m benchmarks.run --sizes 100000,1000000 --scenarios retrieval,query_analysis
+
+Results are keyed by scenario and corpus size, next to the run's parameters
+and environment (Python and numpy versions, platform, git commit), so two
+runs can be diffed with benchmarks.compare.
+"""
+import sys
+import json
+import time
+import platform
+import argparse
+import subprocess
+import numpy as np
+
+from benchmarks import scenarios
+from benchmarks.corpus import parse_clearance_mix
+
+SCENARIOS = ["chunking", "ingestion", "query_analysis", "retrieval", "end_to_end"]
+# (result key, retrieval mode, vector index type)
+RETRIEVAL_VARIANTS = [
+    ("vector_exact", "vector", "exact"),
+    ("vector_ivf", "vector", "ivf"),
+    ("hybrid", "hybrid", "exact"),
+    ("lexical", "lexical", "exact")
+]
+
+def git_commit():
+    """Current commit hash, or None outside a git checkout"""
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+def environment():
+    return {
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "platform": platform.platform(),
+        "processor": platform.processor(),
+        "git_commit": git_commit(),
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%S%z")
+    }
+
+def run(sizes, selected, query_count=200, clearance_mix=None, seed=0, dim=256, max_docx_chunks=100000,
+        log=print):
+    """Run the selected scenarios at each size; returns {scenario: {size: metrics}}"""
+    queries = scenarios.make_queries(query_count, seed)
+    results = {name: {} for name in selected}
+
+    for size in sizes:
+        key = str(size)
+        if "chunking" in selected:
+            log(f"[{size}] chunking")
+            results["chunking"][key] = scenarios.bench_chunking(size, clearance_mix, seed)
+        if "ingestion" in selected:
+            if size > max_docx_chunks:
+                log(f"[{size}] ingestion skipped (above --max-docx-chunks)")
+            else:
+                log(f"[{size}] ingestion")
+                results["ingestion"][key] = scenarios.bench_ingestion(
+                    size, clearance_mix=clearance_mix, seed=seed, dim=dim
+                )
+        if "query_analysis" in selected:
+            log(f"[{size}] query analysis")
+            results["query_analysis"][key] = scenarios.bench_query_analysis(size, queries, clearance_mix, seed)
+
+        if "retrieval" in selected or "end_to_end" in selected:
+            fixture = scenarios.RetrievalFixture(size, dim, clearance_mix, seed)
+            if "retrieval" in selected:
+                results["retrieval"][key] = {}
+                for name, mode, index_type in RETRIEVAL_VARIANTS:
+                    log(f"[{size}] retrieval {name}")
+                    results["retrieval"][key][name] = scenarios.bench_retrieval(
+                        fixture, queries, mode, index_type, seed=seed
+                    )
+            if "end_to_end" in selected:
+                log(f"[{size}] end to end")
+                results["end_to_end"][key] = scenarios.bench_end_to_end(fixture, queries, seed=seed)
+            del fixture
+
+    return results
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Run the Project SHADOW benchmark suite")
+    parser.add_argument("--sizes", default="1000,10000",
+                        help="comma-separated corpus sizes in chunks, e.g. 1000,10000,100000,1000000")
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        help=f"comma-separated subset of {','.join(SCENARIOS)}")
+    parser.add_argument("--queries", type=int, default=200, help="queries per latency scenario")
+    parser.add_argument("--clearance-mix", default="1:0.4,2:0.3,3:0.2,4:0.1", help="level:weight pairs")
+    parser.add_argument("--dim", type=int, default=256, help="embedding dimension")
+    parser.add_argument("--max-docx-chunks", type=int, default=100000,
+                        help="largest size for which DOCX files are generated and ingested")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--output", help="write results JSON here (default: stdout)")
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) for size in args.sizes.split(",")]
+    selected = [name for name in args.scenarios.split(",") if name]
+    unknown = set(selected) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+
+    started = time.perf_counter()
+    results = run(
+        sizes, selected, args.queries, parse_clearance_mix(args.clearance_mix), args.seed, args.dim,
+        args.max_docx_chunks, log=lambda message: print(message, file=sys.stderr)
+    )
+    report = {
+        "meta": dict(environment(), seconds=time.perf_counter() - started),
+        "params": {
+            "sizes": sizes,
+            "scenarios": selected,
+            "queries": args.queries,
+            "clearance_mix": args.clearance_mix,
+            "dim": args.dim,
+            "seed": args.seed
+        },
+        "results": results
+    }
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(text + "\n")
+        print(f"Wrote {args.output}", file=sys.stderr)
+    else:
+        print(text)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,244 @@
+"""Benchmark scenarios. Each returns a flat dict of metrics for one corpus size.
+
+Embeddings come from the deterministic HashingEmbeddingBackend and responses
+from FakeLLMBackend, so results measure this code rather than remote APIs.
+For retrieval at large sizes the chunk embedding matrix is random rather than
+hashed: scoring cost depends only on its shape. Backend clients are not rate
+limited, so the shared request limits do not throttle the local backends.
+"""
+import os
+import time
+import random
+import tempfile
+import contextlib
+import numpy as np
+
+from benchmarks.corpus import generate_chunks, generate_docx_corpus, iter_paragraphs, OPERATIONS, PROTOCOLS
+
+QUERY_TEMPLATES = [
+    "What is the status of Operation {operation}?",
+    "What are the recommended counter-surveillance techniques for Operation {operation}?",
+    "How to implement Protocol {protocol} during an extraction?",
+    "Where is the safehouse used by Operation {operation} and what security measures protect it?",
+    "Explain the {protocol} procedure for field agents",
+    "What is the current state of the courier network and handler rotation schedule?"
+]
+
+def percentiles(latencies):
+    """p50/p95/p99/mean in milliseconds for a list of durations in seconds"""
+    values = np.asarray(latencies, dtype=np.float64) * 1000.0
+    if len(values) == 0:
+        return {"count": 0}
+    return {
+        "count": int(len(values)),
+        "p50_ms": float(np.percentile(values, 50)),
+        "p95_ms": float(np.percentile(values, 95)),
+        "p99_ms": float(np.percentile(values, 99)),
+        "mean_ms": float(values.mean())
+    }
+
+def make_queries(count, seed=0):
+    """Deterministic mix of operation, protocol and generic queries"""
+    rng = random.Random(seed)
+    return [
+        rng.choice(QUERY_TEMPLATES).format(operation=rng.choice(OPERATIONS), protocol=rng.choice(PROTOCOLS))
+        for _ in range(count)
+    ]
+
+def unlimited_client(name):
+    """Backend client without a rate limit"""
+    from async_client import AsyncClient
+    return AsyncClient(name, rate=None, max_concurrency=8)
+
+@contextlib.contextmanager
+def working_directory(path):
+    """Run with path as the current directory, since the pipeline uses relative data/ paths"""
+    previous = os.getcwd()
+    os.chdir(path)
+    try:
+        yield
+    finally:
+        os.chdir(previous)
+
+def bench_chunking(size, clearance_mix=None, seed=0, paragraphs_per_section=20):
+    """Chunking plus metadata extraction, without DOCX parsing"""
+    from document_processor import DocumentProcessor, METADATA_EXTRACTOR
+
+    paragraphs = [text for _, text in iter_paragraphs(size, clearance_mix, seed)]
+    sections = [paragraphs[i:i + paragraphs_per_section] for i in range(0, len(paragraphs), paragraphs_per_section)]
+
+    start = time.perf_counter()
+    chunks = 0
+    for section in sections:
+        for _, _, text in DocumentProcessor.stream_chunks(iter(section)):
+            METADATA_EXTRACTOR.extract(text)
+            chunks += 1
+    seconds = time.perf_counter() - start
+
+    megabytes = sum(len(p) for p in paragraphs) / 1e6
+    return {
+        "chunks": chunks,
+        "seconds": seconds,
+        "chunks_per_second": chunks / seconds if seconds else 0.0,
+        "megabytes_per_second": megabytes / seconds if seconds else 0.0
+    }
+
+def bench_ingestion(size, documents=10, workers=None, clearance_mix=None, seed=0, embed=True, dim=256):
+    """Cold and warm ingest_corpus on a generated DOCX corpus, then chunk embedding with the hashing backend"""
+    from ingest import ingest_corpus, load_manifest
+    from embedding_engine import EmbeddingEngine
+    from embedding_backends import HashingEmbeddingBackend
+    from embedding_cache import EmbeddingCache, QueryEmbeddingCache
+
+    with tempfile.TemporaryDirectory(prefix="shadow-bench-") as workdir, working_directory(workdir):
+        generate_start = time.perf_counter()
+        manifest_path = generate_docx_corpus("corpus", size, documents, clearance_mix, seed)
+        generate_seconds = time.perf_counter() - generate_start
+        document_paths = load_manifest(manifest_path)
+        os.makedirs("data/chunks", exist_ok=True)
+
+        chunks, cold = ingest_corpus(document_paths, workers=workers)
+        _, warm = ingest_corpus(document_paths, workers=workers)
+        result = {
+            "documents": cold["total_documents"],
+            "chunks": cold["total_chunks"],
+            "generate_seconds": generate_seconds,
+            "cold_seconds": cold["seconds"],
+            "cold_chunks_per_second": cold["chunks_per_second"],
+            "cold_megabytes_per_second": cold["megabytes_per_second"],
+            "lexical_index_seconds": cold["lexical_index"]["seconds"],
+            "entity_graph_seconds": cold["entity_graph"]["seconds"],
+            "keyword_model_seconds": cold["keyword_model"]["seconds"],
+            "warm_seconds": warm["seconds"],
+            "workers": cold["workers"]
+        }
+
+        if embed:
+            engine = EmbeddingEngine(
+                backend=HashingEmbeddingBackend(dim),
+                cache=EmbeddingCache("data/embeddings/chunk_cache.sqlite"),
+                query_cache=QueryEmbeddingCache(),
+                client=unlimited_client("embedding")
+            )
+            embed_start = time.perf_counter()
+            for doc_id in document_paths:
+                engine.compute_document_embeddings(chunks.document_chunks(doc_id), doc_id)
+            result["embed_seconds"] = time.perf_counter() - embed_start
+            result["embed_chunks_per_second"] = len(chunks) / result["embed_seconds"] if result["embed_seconds"] else 0.0
+        return result
+
+def bench_query_analysis(size, queries, clearance_mix=None, seed=0):
+    """analyze_query + expand_query latency with dictionaries and keyword weights fitted on the corpus"""
+    from query_processor import QueryProcessor
+    from keyword_model import KeywordModel
+
+    chunks = generate_chunks(size, clearance_mix, seed)
+    processor = QueryProcessor()
+
+    fit_start = time.perf_counter()
+    processor.keyword_model = KeywordModel.fit(chunk["text"] for chunk in chunks)
+    fit_seconds = time.perf_counter() - fit_start
+
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        analysis = processor.analyze_query(query)
+        processor.expand_query(query, analysis)
+        latencies.append(time.perf_counter() - start)
+
+    return dict(percentiles(latencies), keyword_fit_seconds=fit_seconds)
+
+class RetrievalFixture:
+    """A chunk store, a random embedding matrix and the helpers shared by the retrieval scenarios"""
+
+    def __init__(self, size, dim=256, clearance_mix=None, seed=0):
+        from chunk_store import ChunkStore
+
+        self.dim = dim
+        self.chunks = ChunkStore.from_chunks(generate_chunks(size, clearance_mix, seed))
+        rng = np.random.default_rng(seed)
+        matrix = rng.standard_normal((size, dim), dtype=np.float32)
+        self.embeddings = dict(zip(self.chunks.ids, matrix))
+        self.security_levels = self.chunks.security_levels
+
+    def engines(self, index_type="exact", nprobe=8):
+        """Fresh (embedding engine, retrieval engine) with in-memory caches and no index files"""
+        from embedding_engine import EmbeddingEngine
+        from embedding_backends import HashingEmbeddingBackend
+        from embedding_cache import EmbeddingCache, QueryEmbeddingCache
+        from retrieval_engine import RetrievalEngine
+
+        # Query embeddings are cached in a throwaway directory, removed with the fixture
+        self._cache_dir = tempfile.TemporaryDirectory(prefix="shadow-bench-cache-")
+        embedding_engine = EmbeddingEngine(
+            backend=HashingEmbeddingBackend(self.dim),
+            cache=EmbeddingCache(os.path.join(self._cache_dir.name, "cache.sqlite")),
+            query_cache=QueryEmbeddingCache(),
+            client=unlimited_client("embedding")
+        )
+        retrieval_engine = RetrievalEngine(
+            embedding_engine, index_type=index_type, nprobe=nprobe, index_path=None, lexical_index_path=None
+        )
+        return embedding_engine, retrieval_engine
+
+def bench_retrieval(fixture, queries, mode="vector", index_type="exact", top_k=5, seed=0):
+    """Index build time and retrieve_many latency over the expanded queries, as the app submits them"""
+    from query_processor import QueryProcessor
+
+    processor = QueryProcessor()
+    expanded = [processor.expand_query(query, processor.analyze_query(query)) for query in queries]
+    _, engine = fixture.engines(index_type)
+
+    build_start = time.perf_counter()
+    engine.prepare(fixture.chunks, fixture.embeddings, fixture.security_levels,
+                   vector=mode != "lexical", lexical=mode != "vector")
+    build_seconds = time.perf_counter() - build_start
+
+    rng = random.Random(seed)
+    latencies = []
+    for expanded_queries in expanded:
+        start = time.perf_counter()
+        engine.retrieve_many(
+            expanded_queries, fixture.chunks, fixture.embeddings, top_k=top_k,
+            user_level=rng.randint(1, 4), security_levels=fixture.security_levels, mode=mode
+        )
+        latencies.append(time.perf_counter() - start)
+
+    return dict(percentiles(latencies), build_seconds=build_seconds,
+                queries_per_call=float(np.mean([len(q) for q in expanded])))
+
+def bench_end_to_end(fixture, queries, top_k=5, seed=0):
+    """Submit latency: analysis, expansion, retrieval and a streamed (fake) response"""
+    from query_processor import QueryProcessor
+    from response_generator import ResponseGenerator
+    from response_cache import ResponseCache
+    from llm_backends import FakeLLMBackend
+
+    processor = QueryProcessor()
+    embedding_engine, engine = fixture.engines()
+    engine.prepare(fixture.chunks, fixture.embeddings, fixture.security_levels, lexical=False)
+    generator = ResponseGenerator(backend=FakeLLMBackend(), cache=ResponseCache(), client=unlimited_client("llm"))
+
+    rng = random.Random(seed)
+    latencies, first_token = [], []
+    for query in queries:
+        user_level = rng.randint(1, 4)
+        start = time.perf_counter()
+        analysis = processor.analyze_query(query)
+        expanded_queries = processor.expand_query(query, analysis)
+        relevant_chunks, scores = engine.retrieve_many(
+            expanded_queries, fixture.chunks, fixture.embeddings, top_k=top_k,
+            user_level=user_level, security_levels=fixture.security_levels
+        )
+        relevant_chunks = [dict(chunk, similarity_score=scores[chunk["id"]]) for chunk in relevant_chunks]
+        for _ in generator.generate_response_stream(
+            query, analysis, relevant_chunks, user_level,
+            query_embedding=embedding_engine.get_query_embedding(query)
+        ):
+            pass
+        latencies.append(time.perf_counter() - start)
+        first_token.append(generator.last_timings.get("time_to_first_token", 0.0))
+
+    result = percentiles(latencies)
+    result["time_to_first_token_p50_ms"] = float(np.percentile(first_token, 50) * 1000.0)
+    return result
@@ -0,0 +1,345 @@
+import os
+import re
+import copy
+import json
+from collections import Counter
+import numpy as np
+
+from vector_index import top_k_indices
+from utils import english_stop_words
+
+BM25_INDEX_FILE = "data/chunks/bm25_index.npz"
+
+# Words, keeping hyphenated codenames such as "s-29" or "ghost-step" together
+TOKEN_PATTERN = re.compile(r"\w+(?:-\w+)*")
+
+def tokenize(text):
+    """Lowercased terms of text; hyphenated codes also yield their parts so "ghost step" still matches"""
+    stop_words = english_stop_words()
+    terms = []
+    for token in TOKEN_PATTERN.findall(text.lower()):
+        if "-" in token:
+            terms.append(token)
+            terms.extend(part for part in token.split("-") if part not in stop_words)
+        elif token not in stop_words:
+            terms.append(token)
+    return terms
+
+def term_counts(text):
+    """Counter of tokenize(text), counting raw tokens first so per-token work stays in C"""
+    stop_words = english_stop_words()
+    counts = Counter(TOKEN_PATTERN.findall(text.lower()))
+    for token in stop_words & counts.keys():
+        del counts[token]
+    for token in [token for token in counts if "-" in token]:
+        for part in token.split("-"):
+            if part not in stop_words:
+                counts[part] += counts[token]
+    return counts
+
+class _Vocabulary(dict):
+    """term -> term id, assigning the next id to unseen terms on lookup"""
+
+    def __missing__(self, term):
+        term_id = self[term] = len(self)
+        return term_id
+
+class BM25Index:
+    """In-process BM25 inverted index over chunk text.
+
+    Postings are kept in compressed sparse row form: one int32 array of
+    chunk rows and one uint16 array of term frequencies, with per-term
+    offsets into both. Newly added chunks go into a flat delta of
+    (term id, row, tf) postings that is merged into the arrays once it grows
+    past a fraction of the index; removed chunks are tombstoned and dropped
+    at the next compaction. Document frequencies are counted over live rows
+    at query time, so they are always exact.
+    """
+
+    def __init__(self, k1=1.5, b=0.75, merge_fraction=0.1, compact_fraction=0.25):
+        self.k1 = k1
+        self.b = b
+        self.merge_fraction = merge_fraction
+        self.compact_fraction = compact_fraction
+        self.ids = []  # row -> chunk id, None for removed rows
+        self.id_to_row = {}
+        self.version = 0
+
+        self._vocab = _Vocabulary()
+        # Merged postings; term t occupies offsets[t]:offsets[t + 1]
+        self._offsets = np.zeros(1, dtype=np.int64)
+        self._rows = np.empty(0, dtype=np.int32)
+        self._tfs = np.empty(0, dtype=np.uint16)
+        # Postings added since the last merge, and their lazily sorted CSR form
+        self._delta_terms, self._delta_rows, self._delta_tfs = [], [], []
+        self._delta_csr = None
+
+        self._lengths = np.empty(0, dtype=np.float32)
+        self._live = np.empty(0, dtype=bool)
+        self._total_length = 0.0
+        self._dead = 0
+
+    def __len__(self):
+        return len(self.id_to_row)
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self.id_to_row
+
+    @property
+    def rows(self):
+        """Number of rows, including removed ones awaiting compaction"""
+        return len(self.ids)
+
+    def _reserve(self, capacity):
+        if capacity <= len(self._lengths):
+            return
+        new_capacity = max(capacity, 2 * len(self._lengths), 64)
+        lengths = np.zeros(new_capacity, dtype=np.float32)
+        live = np.zeros(new_capacity, dtype=bool)
+        lengths[:self.rows] = self._lengths[:self.rows]
+        live[:self.rows] = self._live[:self.rows]
+        self._lengths, self._live = lengths, live
+
+    def add(self, ids, texts):
+        """Insert or replace the text indexed for each chunk id"""
+        self.remove([chunk_id for chunk_id in ids if chunk_id in self.id_to_row])
+        self._reserve(self.rows + len(ids))
+
+        vocab = self._vocab
+        for chunk_id, text in zip(ids, texts):
+            row = self.rows
+            self.ids.append(chunk_id)
+            self.id_to_row[chunk_id] = row
+
+            counts = term_counts(text)
+            length = sum(counts.values())
+            self._lengths[row] = length
+            self._live[row] = True
+            self._total_length += length
+            self._delta_terms.extend(map(vocab.__getitem__, counts))
+            self._delta_rows.extend([row] * len(counts))
+            self._delta_tfs.extend(counts.values())
+
+        self._delta_csr = None
+        self.version += 1
+        if len(self._delta_terms) > max(50000, self.merge_fraction * len(self._rows)):
+            self._rebuild()
+
+    def remove(self, ids):
+        """Tombstone chunk ids; their postings are dropped at the next compaction"""
+        removed = 0
+        for chunk_id in set(ids):
+            row = self.id_to_row.pop(chunk_id, None)
+            if row is None:
+                continue
+            self.ids[row] = None
+            self._live[row] = False
+            self._total_length -= float(self._lengths[row])
+            self._dead += 1
+            removed += 1
+
+        if removed:
+            self.version += 1
+            if self._dead > self.compact_fraction * self.rows:
+                self._rebuild()
+        return removed
+
+    def copy(self):
+        """An independent copy, so it can be updated while searches keep using this index"""
+        index = copy.copy(self)
+        index.ids = list(self.ids)
+        index.id_to_row = dict(self.id_to_row)
+        index._vocab = _Vocabulary(self._vocab)
+        index._delta_terms, index._delta_rows, index._delta_tfs = (
+            list(self._delta_terms), list(self._delta_rows), list(self._delta_tfs)
+        )
+        # The merged postings arrays are only ever replaced, never written to, so they are shared
+        index._lengths = self._lengths.copy()
+        index._live = self._live.copy()
+        return index
+
+    def _sync_changes(self, chunks, changed_ids):
+        """(ids to remove, rows of chunks to index) that bring the index in line with a ChunkStore"""
+        current = set(chunks.ids)
+        removals = [chunk_id for chunk_id in self.id_to_row if chunk_id not in current]
+        changed = set(changed_ids)
+        updates = [
+            row for row, chunk_id in enumerate(chunks.ids)
+            if chunk_id not in self.id_to_row or chunk_id in changed
+        ]
+        return removals, updates
+
+    def _apply(self, chunks, removals, updates):
+        self.remove(removals)
+        if updates:
+            self.add([chunks.ids[row] for row in updates], [chunks.text(row) for row in updates])
+
+    def sync(self, chunks, changed_ids=()):
+        """Bring the index in line with a ChunkStore: drop missing ids, (re)index new and changed ones.
+
+        Only the text of chunks being indexed is read. Returns True if anything changed.
+        """
+        removals, updates = self._sync_changes(chunks, changed_ids)
+        self._apply(chunks, removals, updates)
+        return bool(removals or updates)
+
+    def synced(self, chunks, changed_ids=()):
+        """Like sync, but leaves this index untouched for the searches using it.
+
+        Returns this index if it is already in line with chunks, otherwise an
+        updated and compacted copy.
+        """
+        removals, updates = self._sync_changes(chunks, changed_ids)
+        if not removals and not updates:
+            return self
+        index = self.copy()
+        index._apply(chunks, removals, updates)
+        index._rebuild()
+        return index
+
+    @staticmethod
+    def _to_csr(terms, rows, tfs, n_terms):
+        """Sort postings by term (stable, so rows stay ascending) and build the offsets"""
+        order = np.argsort(terms, kind="stable")
+        counts = np.bincount(terms, minlength=n_terms)
+        offsets = np.concatenate(([0], np.cumsum(counts))).astype(np.int64)
+        return offsets, rows[order].astype(np.int32), tfs[order]
+
+    def _delta_arrays(self):
+        return (
+            np.asarray(self._delta_terms, dtype=np.int64),
+            np.asarray(self._delta_rows, dtype=np.int64),
+            np.minimum(np.asarray(self._delta_tfs, dtype=np.int64), np.iinfo(np.uint16).max).astype(np.uint16)
+        )
+
+    def _rebuild(self):
+        """Merge the delta into the postings arrays and compact away removed rows"""
+        delta_terms, delta_rows, delta_tfs = self._delta_arrays()
+        base_terms = np.repeat(np.arange(len(self._offsets) - 1, dtype=np.int64), np.diff(self._offsets))
+        # Delta rows are newer than every merged row, so each term's rows stay ascending
+        terms = np.concatenate((base_terms, delta_terms))
+        rows = np.concatenate((self._rows.astype(np.int64), delta_rows))
+        tfs = np.concatenate((self._tfs, delta_tfs))
+
+        # Drop postings of removed rows and renumber the remaining rows densely
+        live = self._live[:self.rows]
+        if self._dead:
+            keep = live[rows]
+            terms, rows, tfs = terms[keep], rows[keep], tfs[keep]
+            rows = (np.cumsum(live) - 1)[rows]
+
+        self._offsets, self._rows, self._tfs = self._to_csr(terms, rows, tfs, len(self._vocab))
+        self._delta_terms, self._delta_rows, self._delta_tfs = [], [], []
+        self._delta_csr = None
+
+        if self._dead:
+            self.ids = [chunk_id for chunk_id in self.ids if chunk_id is not None]
+            self.id_to_row = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        self._lengths = self._lengths[:len(live)][live].copy()
+        self._live = np.ones(len(self.ids), dtype=bool)
+        self._dead = 0
+        self.version += 1
+
+    @staticmethod
+    def _slice(csr, term_id):
+        offsets, rows, tfs = csr
+        if term_id >= len(offsets) - 1:
+            return rows[:0], tfs[:0]
+        start, end = offsets[term_id], offsets[term_id + 1]
+        return rows[start:end], tfs[start:end]
+
+    def _postings(self, term):
+        """(rows, term frequencies) of the live chunks containing term"""
+        term_id = self._vocab.get(term)
+        if term_id is None:
+            return np.empty(0, dtype=np.int32), np.empty(0, dtype=np.uint16)
+
+        rows, tfs = self._slice((self._offsets, self._rows, self._tfs), term_id)
+        if self._delta_terms:
+            if self._delta_csr is None:
+                self._delta_csr = self._to_csr(*self._delta_arrays(), len(self._vocab))
+            delta_rows, delta_tfs = self._slice(self._delta_csr, term_id)
+            if len(delta_rows):
+                rows, tfs = np.concatenate((rows, delta_rows)), np.concatenate((tfs, delta_tfs))
+        if self._dead:
+            keep = self._live[rows]
+            rows, tfs = rows[keep], tfs[keep]
+        return rows, tfs
+
+    def scores(self, query):
+        """BM25 score of every row for the query text (zero where no term matches)"""
+        scores = np.zeros(self.rows, dtype=np.float32)
+        n_docs = len(self.id_to_row)
+        if n_docs == 0:
+            return scores
+        average_length = self._total_length / n_docs or 1.0
+
+        for term, query_tf in Counter(tokenize(query)).items():
+            rows, tfs = self._postings(term)
+            if len(rows) == 0:
+                continue
+            idf = np.log1p((n_docs - len(rows) + 0.5) / (len(rows) + 0.5))
+            tfs = tfs.astype(np.float32)
+            norm = self.k1 * (1.0 - self.b + self.b * self._lengths[rows] / average_length)
+            scores[rows] += query_tf * idf * tfs * (self.k1 + 1.0) / (tfs + norm)
+        return scores
+
+    def row_mask(self, chunk_ids):
+        """Boolean mask over rows that selects the given chunk ids"""
+        mask = np.zeros(self.rows, dtype=bool)
+        rows = [self.id_to_row[chunk_id] for chunk_id in chunk_ids if chunk_id in self.id_to_row]
+        mask[rows] = True
+        return mask
+
+    def search(self, query, top_k=5, mask=None):
+        """Return [(chunk_id, score)] for the top_k matching rows allowed by mask"""
+        scores = self.scores(query)
+        candidates = scores > 0
+        if mask is not None:
+            candidates &= mask
+        rows = np.flatnonzero(candidates)
+        best = top_k_indices(scores[rows], top_k)
+        return [(self.ids[rows[i]], float(scores[rows[i]])) for i in best]
+
+    def search_many(self, queries, top_k=5, mask=None):
+        """One [(chunk_id, score)] list per query, in query order"""
+        return [self.search(query, top_k, mask=mask) for query in queries]
+
+    def save(self, path):
+        """Compact and persist the index atomically as a .npz file"""
+        if self._delta_terms or self._dead:
+            self._rebuild()
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                terms=np.array(json.dumps(list(self._vocab))),
+                offsets=self._offsets,
+                rows=self._rows,
+                tfs=self._tfs,
+                lengths=self._lengths[:self.rows],
+                ids=np.array(json.dumps(self.ids)),
+                params=np.array(json.dumps({"k1": self.k1, "b": self.b}))
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path):
+        """Load an index written by save()"""
+        with np.load(path) as data:
+            params = json.loads(str(data["params"]))
+            index = cls(k1=params["k1"], b=params["b"])
+            index._vocab = _Vocabulary((term, i) for i, term in enumerate(json.loads(str(data["terms"]))))
+            index._offsets = data["offsets"]
+            index._rows = data["rows"]
+            index._tfs = data["tfs"]
+            index.ids = json.loads(str(data["ids"]))
+            index._lengths = data["lengths"].copy()
+        index.id_to_row = {chunk_id: row for row, chunk_id in enumerate(index.ids)}
+        index._live = np.ones(len(index.ids), dtype=bool)
+        index._total_length = float(index._lengths.sum())
+        return index
@@ -0,0 +1,281 @@
+import os
+import json
+import numpy as np
+
+from security_protocol import SecurityProtocol
+
+CHUNK_STORE_DIR = "data/chunks/corpus_store"
+
+# Separates chunk ids in the id buffer; it cannot occur in text read from a DOCX file
+ID_SEPARATOR = "\0"
+
+# numpy column name -> dtype; every column has one entry per chunk unless noted
+COLUMNS = {
+    "document": np.int32,           # row in the documents table
+    "section": np.int32,            # row in the sections table
+    "security_level": np.int8,      # coerced with SecurityProtocol.coerce_level
+    "position": np.int32,           # chunk number within its section
+    "start": np.int32,              # character offsets into the section's text
+    "end": np.int32,
+    "text_offsets": np.int64,       # n + 1 byte offsets into the text buffer
+    "text": np.uint8,               # UTF-8 text of every chunk, back to back
+    "ids": np.uint8,                # UTF-8 chunk ids joined with ID_SEPARATOR
+    "operation_offsets": np.int64,  # n + 1 offsets into operation_names
+    "operation_names": np.int32     # rows in the operations table
+}
+
+def _load_column(path):
+    """Memory-map a stored column; empty columns cannot be mapped and are read instead"""
+    try:
+        # A plain ndarray view of the map: indexing np.memmap itself is several times slower
+        return np.asarray(np.load(path, mmap_mode="r"))
+    except ValueError:
+        return np.load(path)
+
+class ChunkStore:
+    """Columnar, read-only store of a corpus's chunks.
+
+    Row i is the i-th chunk. Document names, section headings and operation
+    names are interned in small tables and referenced by integer columns;
+    security level and position are numpy columns; chunk text and ids each
+    live in one contiguous UTF-8 buffer with offsets. On disk every column is
+    a .npy file that is memory-mapped on load, so opening a large store is
+    close to free and chunk text is paged in only when it is read.
+
+    The store is a sequence of chunk dicts shaped like DocumentProcessor
+    output, built on access, so code that reads chunk["id"] or chunk["text"]
+    keeps working; bulk consumers use the columns (security_levels, ids,
+    texts(), document_rows) instead. Chunk ids map to rows in O(1).
+    """
+
+    def __init__(self, columns, documents, sections, operations, sources=None):
+        self._columns = columns
+        self.documents = documents
+        self.sections = sections
+        # Every distinct operation name found in the corpus
+        self.operations = operations
+        # {doc_id: file fingerprint} of the documents the store was built from
+        self.sources = sources or {}
+        self._ids = None
+        self._id_to_row = None
+        self._document_groups = None
+
+    @classmethod
+    def from_chunks(cls, chunks, sources=None):
+        """Build a store from an iterable of chunk dicts"""
+        documents, sections, operations = {}, {}, {}
+        values = {name: [] for name in ("document", "section", "security_level", "position", "start", "end")}
+        texts, ids, operation_counts, operation_names = [], [], [], []
+
+        for chunk in chunks:
+            if ID_SEPARATOR in chunk["id"]:
+                raise ValueError(f"Chunk id contains a NUL character: {chunk['id']!r}")
+            ids.append(chunk["id"])
+            texts.append(chunk["text"].encode("utf-8"))
+            values["document"].append(documents.setdefault(chunk["document"], len(documents)))
+            values["section"].append(sections.setdefault(chunk["section"], len(sections)))
+            values["security_level"].append(SecurityProtocol.coerce_level(chunk.get("security_level", 1)))
+            values["position"].append(chunk.get("position", 0))
+            values["start"].append(chunk.get("start", 0))
+            values["end"].append(chunk.get("end", 0))
+            names = chunk.get("operations", [])
+            operation_counts.append(len(names))
+            operation_names.extend(operations.setdefault(name, len(operations)) for name in names)
+
+        columns = {name: np.asarray(column, dtype=COLUMNS[name]) for name, column in values.items()}
+        columns["text_offsets"] = np.concatenate([[0], np.cumsum([len(text) for text in texts], dtype=np.int64)])
+        columns["text"] = np.frombuffer(b"".join(texts), dtype=np.uint8)
+        columns["ids"] = np.frombuffer(ID_SEPARATOR.join(ids).encode("utf-8"), dtype=np.uint8)
+        columns["operation_offsets"] = np.concatenate([[0], np.cumsum(operation_counts, dtype=np.int64)])
+        columns["operation_names"] = np.asarray(operation_names, dtype=np.int32)
+
+        store = cls(columns, list(documents), list(sections), list(operations), sources)
+        store._ids = ids
+        return store
+
+    def __len__(self):
+        return len(self._columns["document"])
+
+    def __getitem__(self, row):
+        if row < 0:
+            row += len(self)
+        if not 0 <= row < len(self):
+            raise IndexError("chunk row out of range")
+        columns = self._columns
+        first, last = int(columns["operation_offsets"][row]), int(columns["operation_offsets"][row + 1])
+        level = int(columns["security_level"][row])
+        return {
+            "id": self.ids[row],
+            "text": self.text(row),
+            "document": self.documents[columns["document"][row]],
+            "section": self.sections[columns["section"][row]],
+            "security_level": None if level == SecurityProtocol.UNREADABLE_LEVEL else level,
+            "operations": [self.operations[name] for name in columns["operation_names"][first:last].tolist()],
+            "position": int(columns["position"][row]),
+            "start": int(columns["start"][row]),
+            "end": int(columns["end"][row])
+        }
+
+    def __iter__(self):
+        return self.iter_rows(range(len(self)))
+
+    def iter_rows(self, rows):
+        """Yield the chunk dicts of the given rows, converting columns in bulk"""
+        rows = np.asarray(rows, dtype=np.int64)
+        columns = self._columns
+        text_offsets, operation_offsets = columns["text_offsets"], columns["operation_offsets"]
+        operation_names = columns["operation_names"]
+        ids = self.ids
+        # Rows are converted in blocks, so iterating a large store never holds all dicts at once
+        for block_start in range(0, len(rows), 4096):
+            block = rows[block_start:block_start + 4096]
+            fields = zip(
+                block.tolist(),
+                columns["document"][block].tolist(),
+                columns["section"][block].tolist(),
+                columns["security_level"][block].tolist(),
+                columns["position"][block].tolist(),
+                columns["start"][block].tolist(),
+                columns["end"][block].tolist()
+            )
+            for row, document, section, level, position, start, end in fields:
+                text_start, text_end = int(text_offsets[row]), int(text_offsets[row + 1])
+                first, last = int(operation_offsets[row]), int(operation_offsets[row + 1])
+                yield {
+                    "id": ids[row],
+                    "text": columns["text"][text_start:text_end].tobytes().decode("utf-8"),
+                    "document": self.documents[document],
+                    "section": self.sections[section],
+                    "security_level": None if level == SecurityProtocol.UNREADABLE_LEVEL else level,
+                    "operations": [self.operations[name] for name in operation_names[first:last].tolist()],
+                    "position": position,
+                    "start": start,
+                    "end": end
+                }
+
+    @property
+    def ids(self):
+        """Chunk ids in row order, decoded from the id buffer on first use"""
+        if self._ids is None:
+            self._ids = self._columns["ids"].tobytes().decode("utf-8").split(ID_SEPARATOR) if len(self) else []
+        return self._ids
+
+    def text(self, row):
+        text_offsets = self._columns["text_offsets"]
+        return self._columns["text"][int(text_offsets[row]):int(text_offsets[row + 1])].tobytes().decode("utf-8")
+
+    def texts(self):
+        """Yield every chunk's text in row order"""
+        for row in range(len(self)):
+            yield self.text(row)
+
+    @property
+    def security_levels(self):
+        """int8 security level column, as SecurityProtocol.security_level_column would compute it"""
+        return self._columns["security_level"]
+
+    def row(self, chunk_id):
+        """Row of a chunk id, or None if the store does not hold it"""
+        if self._id_to_row is None:
+            self._id_to_row = {chunk_id: row for row, chunk_id in enumerate(self.ids)}
+        return self._id_to_row.get(chunk_id)
+
+    def rows(self, chunk_ids):
+        """Row of each chunk id as an int64 array, with -1 for ids the store does not hold"""
+        if self._id_to_row is None:
+            self.row(None)
+        get = self._id_to_row.get
+        return np.fromiter((get(chunk_id, -1) for chunk_id in chunk_ids), dtype=np.int64, count=len(chunk_ids))
+
+    def get(self, chunk_id):
+        """The chunk dict for an id, or None"""
+        row = self.row(chunk_id)
+        return None if row is None else self[row]
+
+    def document_rows(self, doc_id):
+        """Rows of a document's chunks, in store order"""
+        if self._document_groups is None:
+            # Group rows by document once: a stable sort keeps each document's chunks in order
+            order = np.argsort(self._columns["document"], kind="stable")
+            bounds = np.searchsorted(self._columns["document"][order], np.arange(len(self.documents) + 1))
+            self._document_groups = (order, bounds, {doc: i for i, doc in enumerate(self.documents)})
+        order, bounds, document_index = self._document_groups
+        i = document_index.get(doc_id)
+        return order[bounds[i]:bounds[i + 1]] if i is not None else order[:0]
+
+    def document_chunks(self, doc_id):
+        """A document's chunk dicts, in store order"""
+        return list(self.iter_rows(self.document_rows(doc_id)))
+
+    def nbytes(self):
+        """Bytes held by the columns and interned tables (text and id buffers included)"""
+        tables = sum(len(name.encode("utf-8")) for table in (self.documents, self.sections, self.operations)
+                     for name in table)
+        return sum(column.nbytes for column in self._columns.values()) + tables
+
+    def save(self, directory=CHUNK_STORE_DIR):
+        """Write the store as one .npy file per column plus a meta.json committed last.
+
+        Column files are named by generation, so readers of the previous
+        generation are never handed a half-written file.
+        """
+        os.makedirs(directory, exist_ok=True)
+        meta_path = os.path.join(directory, "meta.json")
+        old_meta = None
+        if os.path.exists(meta_path):
+            with open(meta_path, "r") as f:
+                old_meta = json.load(f)
+        generation = old_meta["generation"] + 1 if old_meta else 0
+
+        files = {}
+        for name in COLUMNS:
+            files[name] = f"{name}.{generation}.npy"
+            with open(os.path.join(directory, files[name]), "wb") as f:
+                np.save(f, np.ascontiguousarray(self._columns[name]))
+                f.flush()
+                os.fsync(f.fileno())
+
+        self._write_meta(directory, {
+            "generation": generation,
+            "chunks": len(self),
+            "files": files,
+            "documents": self.documents,
+            "sections": self.sections,
+            "operations": self.operations,
+            "sources": self.sources
+        })
+
+        if old_meta:
+            for file_name in old_meta["files"].values():
+                try:
+                    os.remove(os.path.join(directory, file_name))
+                except OSError:
+                    pass
+
+    def save_sources(self, directory=CHUNK_STORE_DIR):
+        """Rewrite only the recorded source fingerprints, e.g. after a document was touched but not edited"""
+        with open(os.path.join(directory, "meta.json"), "r") as f:
+            meta = json.load(f)
+        meta["sources"] = self.sources
+        self._write_meta(directory, meta)
+
+    @staticmethod
+    def _write_meta(directory, meta):
+        meta_path = os.path.join(directory, "meta.json")
+        tmp_path = f"{meta_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, meta_path)
+
+    @classmethod
+    def load(cls, directory=CHUNK_STORE_DIR):
+        """Open a store written by save() with its columns memory-mapped, or None if there is none"""
+        meta_path = os.path.join(directory, "meta.json")
+        if not os.path.exists(meta_path):
+            return None
+        with open(meta_path, "r") as f:
+            meta = json.load(f)
+        columns = {name: _load_column(os.path.join(directory, file_name)) for name, file_name in meta["files"].items()}
+        return cls(columns, meta["documents"], meta["sections"], meta["operations"], meta["sources"])
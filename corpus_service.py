@@ -0,0 +1,167 @@
+import os
+import copy
+import glob
+import threading
+from pathlib import Path
+
+from ingest import ingest_corpus
+from chunk_store import ChunkStore
+from embedding_engine import EmbeddingEngine
+from query_processor import QueryProcessor
+from keyword_model import KeywordModel
+from entity_graph import EntityGraph
+from retrieval_engine import RetrievalEngine, RetrievalSnapshot
+from response_generator import ResponseGenerator
+from tracing import tracer
+
+class CorpusService:
+    """Long-lived pipeline state shared by every query.
+
+    Holds the pipeline components, the entity graph, and a RetrievalSnapshot
+    of the loaded ChunkStore and embeddings with the security level column,
+    clearance masks and warm retrieval indexes. The corpus is loaded once and
+    only reloaded when a source document or one of the stored chunk/embedding
+    files changes, so a query only pays for query work.
+
+    A reload builds the new snapshot, query processor and entity graph off to
+    the side and then publishes each with one assignment. A query that reads
+    snapshot once sees one version of the corpus even while a reload runs.
+    """
+
+    def __init__(self, document_paths, embedding_engine=None, response_generator=None):
+        self.document_paths = document_paths
+        self.query_processor = QueryProcessor()
+        self.embedding_engine = embedding_engine or EmbeddingEngine()
+        self.retrieval_engine = RetrievalEngine(self.embedding_engine)
+        self.response_generator = response_generator or ResponseGenerator()
+
+        self.snapshot = RetrievalSnapshot(ChunkStore.from_chunks([]), {})
+        self.entity_graph = None
+        self.missing_documents = []
+        # Chunks that could not be embedded; only lexical (BM25) retrieval can return them
+        self.unembedded_chunks = []
+        self.ingest_metrics = {}
+        self.load_count = 0
+        self._signature = None
+        self._lock = threading.Lock()
+
+    @property
+    def chunks(self):
+        return self.snapshot.chunks
+
+    @property
+    def embeddings(self):
+        return self.snapshot.embeddings
+
+    @property
+    def security_levels(self):
+        return self.snapshot.security_levels
+
+    @property
+    def clearance_masks(self):
+        return self.snapshot.clearance_masks
+
+    def _watched_files(self):
+        """Source documents and the stored chunk and embedding files derived from them"""
+        paths = [str(Path(doc_name).resolve()) for doc_name in self.document_paths.values()]
+        # The combined chunk store (a subdirectory) is written by loading, so it is not a reason to reload
+        paths.extend(glob.glob("data/chunks/*.json"))
+        paths.extend(glob.glob("data/embeddings/*.ids.json"))
+        return sorted(paths)
+
+    def _current_signature(self):
+        signature = []
+        for path in self._watched_files():
+            try:
+                stat = os.stat(path)
+                signature.append((path, stat.st_mtime_ns, stat.st_size))
+            except OSError:
+                signature.append((path, None, None))
+        return tuple(signature)
+
+    def ensure_loaded(self, force_reprocess=False, wait=True):
+        """Load the corpus if it has not been loaded yet or its files changed.
+
+        With wait=False, a caller that finds another thread reloading keeps
+        the current snapshot instead of waiting for the new one.
+        """
+        if not self._lock.acquire(blocking=wait or self._signature is None):
+            return self
+        try:
+            with tracer.span("load_corpus") as span:
+                if force_reprocess or self._signature is None or self._current_signature() != self._signature:
+                    self._load(force_reprocess)
+                    span.set(reloaded=True, chunks=len(self.chunks))
+        finally:
+            self._lock.release()
+        return self
+
+    def _load(self, force_reprocess):
+        """Process documents, load embeddings and precompute everything queries need"""
+        # Ingestion teaches the entity matcher the corpus names, so it works on a copy of the query processor
+        query_processor = copy.copy(self.query_processor)
+        query_processor.entity_matcher = copy.deepcopy(self.query_processor.entity_matcher)
+        chunks, metrics = ingest_corpus(
+            self.document_paths,
+            force_reprocess=force_reprocess,
+            lexical_index=self.retrieval_engine.lexical_index,
+            query_processor=query_processor
+        )
+        missing = metrics["missing"]
+        self.ingest_metrics = metrics
+        # The BM25 index ingestion brought up to date is where the engine continues from
+        self.retrieval_engine.lexical_index = metrics["lexical_index"]["index"]
+
+        embeddings = {}
+        embedding_hashes = {}
+        unembedded = []
+        for doc_id in self.document_paths:
+            doc_chunks = chunks.document_chunks(doc_id)
+            if doc_chunks:
+                embeddings.update(self.embedding_engine.compute_document_embeddings(
+                    doc_chunks,
+                    doc_id,
+                    force_recompute=force_reprocess
+                ))
+                embedding_hashes.update(self.embedding_engine.last_hashes)
+                unembedded.extend(self.embedding_engine.last_failed_ids)
+
+        changed_ids = [
+            chunk_id
+            for entry in metrics["documents"]
+            for chunk_id in entry["changes"]["added"] + entry["changes"]["changed"]
+        ]
+
+        # Keyword weights were refitted by ingest_corpus if the corpus changed
+        if metrics["keyword_model"]["refit"] or not query_processor.keyword_model.is_fitted:
+            query_processor.keyword_model = KeywordModel.load()
+        # The matcher rebuilds its automaton on first use; do it here rather than on concurrent queries
+        query_processor.entity_matcher.find("")
+
+        # Ingestion rebuilt the graph if needed
+        entity_graph = self.entity_graph
+        if metrics["entity_graph"]["rebuilt"] or entity_graph is None:
+            entity_graph = EntityGraph.load()
+
+        # Build the indexes and row masks now rather than on the first query, including
+        # every vector index type queries have been using, so none of them waits for a rebuild
+        index_types = [self.retrieval_engine.index_type]
+        serving = self.retrieval_engine.snapshot
+        if serving is not None:
+            index_types += [index_type for index_type in serving.vectors if index_type not in index_types]
+        for index_type in index_types:
+            snapshot = self.retrieval_engine.prepare(chunks, embeddings, changed_ids=changed_ids,
+                                                     vector=bool(embeddings), embedding_hashes=embedding_hashes,
+                                                     index_type=index_type)
+
+        self.query_processor = query_processor
+        self.entity_graph = entity_graph
+        self.missing_documents = missing
+        self.unembedded_chunks = unembedded
+        self.snapshot = snapshot
+        self.load_count += 1
+        self._signature = self._current_signature()
+
+    def has_access(self, user_level):
+        """Whether any chunk in the corpus is visible at this clearance level"""
+        return self.snapshot.has_access(user_level)
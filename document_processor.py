@@ -2,49 +2,145 @@ import os
 import re
 import json
 import hashlib
-import docx
-from nltk.tokenize import sent_tokenize
-import streamlit as st
+import itertools
+from collections import deque
+
+from metadata_extractor import MetadataExtractor
+from utils import ensure_nltk_data, report_error
+
+# Bumped whenever chunk boundaries or metadata change, so stored chunks are rebuilt
+CHUNKER_VERSION = 3
+
+# Whitespace after sentence-ending punctuation
+SENTENCE_BOUNDARY = re.compile(r"(?<=[.!?])\s+")
+
+# Compiled once per process and shared by every chunk
+METADATA_EXTRACTOR = MetadataExtractor.default()
 
 class DocumentProcessor:
     """Handles document loading, parsing and chunking with advanced techniques"""
 
     @staticmethod
-    def read_docx(file_path):
-        """Read DOCX file and extract text while preserving some structure"""
+    def iter_paragraphs(file_path):
+        """Yield (section number, heading, paragraph text) for each non-empty body paragraph"""
+        import docx
+
         doc = docx.Document(file_path)
-        sections = []
         
+        section_number = 0
         current_heading = "Introduction"
-        current_section = []
         
         for para in doc.paragraphs:
             # Check if it's a heading by style
             if para.style.name.startswith('Heading'):
-                # Save previous section if it exists
-                if current_section:
-                    sections.append({
-                        "heading": current_heading,
-                        "content": "\n".join(current_section)
-                    })
-                    current_section = []
-                
+                section_number += 1
                 current_heading = para.text
             elif para.text.strip():
-                current_section.append(para.text)
-        
-        # Add the last section
-        if current_section:
-            sections.append({
-                "heading": current_heading,
-                "content": "\n".join(current_section)
-            })
-        
-        return sections
+                yield section_number, current_heading, para.text
+
+    @staticmethod
+    def iter_sections(file_path):
+        """Yield (heading, paragraph iterator) for each section, streaming paragraphs from the document"""
+        paragraphs = DocumentProcessor.iter_paragraphs(file_path)
+        for (_, heading), section in itertools.groupby(paragraphs, key=lambda p: (p[0], p[1])):
+            yield heading, (text for _, _, text in section)
+
+    @staticmethod
+    def read_docx(file_path):
+        """Read DOCX file and extract text while preserving some structure"""
+        return [
+            {"heading": heading, "content": "\n".join(paragraphs)}
+            for heading, paragraphs in DocumentProcessor.iter_sections(file_path)
+        ]
+
+    @staticmethod
+    def approx_token_count(text):
+        """Approximate model token count (about four characters per token for English text)"""
+        return (len(text) + 3) // 4
+
+    @staticmethod
+    def _split_long_text(text, max_tokens):
+        """Split text into (start, end) pieces of at most max_tokens, preferring sentence then word boundaries"""
+        max_chars = max_tokens * 4
+        start = 0
+        for match in itertools.chain(SENTENCE_BOUNDARY.finditer(text), [None]):
+            end = match.start() if match else len(text)
+            # Hard-split sentences that are too long on their own at the last space before the limit
+            while end - start > max_chars:
+                cut = text.rfind(" ", start + 1, start + max_chars)
+                cut = cut if cut > start else start + max_chars
+                yield start, cut
+                start = cut
+                while start < end and text[start] == " ":
+                    start += 1
+            if end > start:
+                yield start, end
+            if match:
+                start = match.end()
+
+    @staticmethod
+    def stream_chunks(paragraphs, max_tokens=256, min_tokens=25, overlap_tokens=0):
+        """Chunk a stream of paragraphs in linear time, yielding (start, end, text) spans.
+
+        Offsets index into the paragraphs joined with newlines (a section's
+        content as returned by read_docx). Chunks pack whole paragraphs up to
+        max_tokens; longer paragraphs are split at sentence boundaries. With
+        overlap_tokens, each chunk repeats up to that many trailing tokens of
+        the previous one. A trailing chunk below min_tokens is merged into the
+        one before it, and a section smaller than min_tokens yields nothing.
+        Only the paragraphs of the chunks being built are kept in memory.
+        """
+        # A unit is (start, end, tokens, text, separator to the next unit)
+        window = deque()
+        window_tokens = 0
+        held = None  # units of the last full chunk, held back so a small tail can be merged into it
+        offset = 0
+
+        def span(units):
+            text = "".join(unit[3] + unit[4] for unit in units[:-1]) + units[-1][3]
+            return units[0][0], units[-1][1], text
+
+        for paragraph in paragraphs:
+            if DocumentProcessor.approx_token_count(paragraph) <= max_tokens:
+                pieces = [(0, len(paragraph))]
+            else:
+                pieces = list(DocumentProcessor._split_long_text(paragraph, max_tokens))
+
+            for i, (start, end) in enumerate(pieces):
+                # Whatever lies between this piece and the next: spaces between sentences of a paragraph,
+                # and after the last piece any whitespace it ends with plus the newline between paragraphs
+                separator = paragraph[end:pieces[i + 1][0]] if i + 1 < len(pieces) else paragraph[end:] + "\n"
+                text = paragraph[start:end]
+                tokens = DocumentProcessor.approx_token_count(text)
+
+                if window and window_tokens + tokens > max_tokens:
+                    if held is not None:
+                        yield span(held)
+                    held = list(window)
+                    # Keep trailing units as overlap, always dropping at least the first one
+                    window_tokens -= window.popleft()[2]
+                    while window and (window_tokens > overlap_tokens or window_tokens + tokens > max_tokens):
+                        window_tokens -= window.popleft()[2]
+
+                window.append((offset + start, offset + end, tokens, text, separator))
+                window_tokens += tokens
+            offset += len(paragraph) + 1
+
+        if held is not None and window and window_tokens < min_tokens:
+            # Merge the small tail into the previous chunk, skipping units it already contains
+            held.extend(unit for unit in window if unit[0] >= held[-1][1])
+            window.clear()
+        if held is not None:
+            yield span(held)
+        if window and window_tokens >= min_tokens:
+            yield span(list(window))
 
     @staticmethod
     def semantic_chunking(text, min_size=100, max_size=1000):
         """Chunk text based on semantic boundaries like sentences and paragraphs"""
+        from nltk.tokenize import sent_tokenize
+        ensure_nltk_data()
+
         # First split by paragraphs
         paragraphs = text.split('\n\n')
         chunks = []
@@ -76,63 +172,172 @@ class DocumentProcessor:
             
         return chunks
 
+    @staticmethod
+    def chunk_file_path(doc_id):
+        """Location of the stored chunks for a document"""
+        return f"data/chunks/{doc_id}.json"
+
+    @staticmethod
+    def file_fingerprint(file_path, stored=None):
+        """Size, mtime and SHA-256 of a file; the hash is reused from stored when size and mtime match"""
+        stat = os.stat(file_path)
+        fingerprint = {
+            "path": file_path,
+            "size": stat.st_size,
+            "mtime_ns": stat.st_mtime_ns,
+            "chunker": CHUNKER_VERSION
+        }
+        if stored and stored.get("size") == stat.st_size and stored.get("mtime_ns") == stat.st_mtime_ns:
+            fingerprint["sha256"] = stored["sha256"]
+            return fingerprint
+
+        digest = hashlib.sha256()
+        with open(file_path, 'rb') as f:
+            for block in iter(lambda: f.read(1 << 20), b""):
+                digest.update(block)
+        fingerprint["sha256"] = digest.hexdigest()
+        return fingerprint
+
+    @staticmethod
+    def load_stored_chunks(doc_id):
+        """Return the stored {"source": fingerprint, "chunks": [...]} record for a document, or None"""
+        chunk_file = DocumentProcessor.chunk_file_path(doc_id)
+        if not os.path.exists(chunk_file):
+            return None
+        with open(chunk_file, 'r') as f:
+            stored = json.load(f)
+        return stored if isinstance(stored, dict) and "source" in stored else None
+
+    @staticmethod
+    def _save_chunks(doc_id, source, chunks):
+        chunk_file = DocumentProcessor.chunk_file_path(doc_id)
+        tmp_file = f"{chunk_file}.tmp"
+        with open(tmp_file, 'w') as f:
+            json.dump({"source": source, "chunks": chunks}, f)
+        os.replace(tmp_file, chunk_file)
+
+    @staticmethod
+    def is_current(fingerprint, source):
+        """Whether a file with this fingerprint would be chunked exactly as when source was recorded"""
+        return fingerprint["sha256"] == source["sha256"] and source.get("chunker") == CHUNKER_VERSION
+
+    @staticmethod
+    def load_if_current(file_path, doc_id):
+        """(stored chunks, file fingerprint) if the file content has not changed since they were made, else None"""
+        stored = DocumentProcessor.load_stored_chunks(doc_id)
+        if stored is None:
+            return None
+        fingerprint = DocumentProcessor.file_fingerprint(file_path, stored["source"])
+        if not DocumentProcessor.is_current(fingerprint, stored["source"]):
+            return None
+        # Same content with a new path or mtime (e.g. touched or copied): remember the new stat
+        if fingerprint != stored["source"]:
+            DocumentProcessor._save_chunks(doc_id, fingerprint, stored["chunks"])
+        return stored["chunks"], fingerprint
+
+    @staticmethod
+    def stored_chunks_if_current(file_path, doc_id):
+        """Stored chunks if the file content has not changed since they were made, else None"""
+        stored = DocumentProcessor.load_if_current(file_path, doc_id)
+        return stored[0] if stored is not None else None
+
+    @staticmethod
+    def diff_chunks(old_chunks, new_chunks):
+        """Compare two chunk lists section by section.
+
+        Sections whose chunks are identical are skipped wholesale; within
+        changed sections chunks are matched by id. Returns the ids of added,
+        changed and removed chunks.
+        """
+        def by_section(chunks):
+            sections = {}
+            for chunk in chunks:
+                sections.setdefault(chunk["section"], []).append((chunk["id"], chunk["text"]))
+            return sections
+
+        old_sections = by_section(old_chunks)
+        new_sections = by_section(new_chunks)
+        changes = {"added": [], "changed": [], "removed": [], "unchanged_sections": 0}
+
+        for section in list(old_sections) + [s for s in new_sections if s not in old_sections]:
+            old_section = old_sections.get(section, [])
+            new_section = new_sections.get(section, [])
+            if old_section == new_section:
+                changes["unchanged_sections"] += 1
+                continue
+
+            old_texts = dict(old_section)
+            new_texts = dict(new_section)
+            for chunk_id, text in new_texts.items():
+                if chunk_id not in old_texts:
+                    changes["added"].append(chunk_id)
+                elif old_texts[chunk_id] != text:
+                    changes["changed"].append(chunk_id)
+            changes["removed"].extend(chunk_id for chunk_id in old_texts if chunk_id not in new_texts)
+
+        return changes
+
     @staticmethod
     def process_document(file_path, doc_id, force_reprocess=False):
         """Process a document and store chunks with metadata"""
-        # Create unique ID for the document based on path
-        doc_hash = hashlib.md5(file_path.encode()).hexdigest()
-        chunk_file = f"data/chunks/{doc_id}_{doc_hash}.json"
-        
-        # Check if processed chunks already exist
-        if os.path.exists(chunk_file) and not force_reprocess:
-            with open(chunk_file, 'r') as f:
-                return json.load(f)
+        return DocumentProcessor.process_document_with_changes(file_path, doc_id, force_reprocess)[0]
+
+    @staticmethod
+    def process_document_with_changes(file_path, doc_id, force_reprocess=False):
+        """Process a document if its content changed, returning (chunks, changes).
+
+        Stored chunks are keyed by doc_id and tagged with the file's size, mtime
+        and content hash, so a document edited in place is detected and
+        re-chunked. changes lists the chunk ids added, changed or removed
+        relative to the stored chunks.
+        """
+        chunks, changes, _ = DocumentProcessor.process_document_with_source(file_path, doc_id, force_reprocess)
+        return chunks, changes
+
+    @staticmethod
+    def process_document_with_source(file_path, doc_id, force_reprocess=False):
+        """Like process_document_with_changes, also returning the file fingerprint the chunks were made from"""
+        no_changes = {"added": [], "changed": [], "removed": [], "unchanged_sections": 0}
+
+        # Reuse stored chunks unless the file content changed
+        if not force_reprocess:
+            stored = DocumentProcessor.load_if_current(file_path, doc_id)
+            if stored is not None:
+                return stored[0], no_changes, stored[1]
+
+        stored = DocumentProcessor.load_stored_chunks(doc_id)
+        fingerprint = DocumentProcessor.file_fingerprint(file_path)
         
         # Process document based on type
         if file_path.endswith('.docx'):
-            sections = DocumentProcessor.read_docx(file_path)
-            
-            # Create chunks with metadata
+            # Create chunks with metadata, streaming paragraphs section by section
             chunks = []
-            for section in sections:
-                section_chunks = DocumentProcessor.semantic_chunking(section["content"])
+            for heading, paragraphs in DocumentProcessor.iter_sections(file_path):
+                section_chunks = DocumentProcessor.stream_chunks(paragraphs)
                 
-                for i, chunk_text in enumerate(section_chunks):
-                    # Detect security level in the chunk
-                    security_level = 1  # Default level
-                    if re.search(r"level\s*[5-9]|clearance\s*[5-9]", chunk_text.lower(), re.IGNORECASE):
-                        security_level = 4  # Map to our highest level
-                    elif re.search(r"level\s*[34]|clearance\s*[34]", chunk_text.lower(), re.IGNORECASE):
-                        security_level = 3
-                    elif re.search(r"level\s*2|clearance\s*2", chunk_text.lower(), re.IGNORECASE):
-                        security_level = 2
-                    elif re.search(r"level\s*1|clearance\s*1", chunk_text.lower(), re.IGNORECASE):
-                        security_level = 1
-                    
-                    # Extract operation information if present
-                    operations = []
-                    if re.search(r"operation\s+\w+|project\s+\w+|protocol\s+\w+", chunk_text.lower(), re.IGNORECASE):
-                        op_matches = re.findall(r"operation\s+(\w+)|project\s+(\w+)|protocol\s+(\w+)", chunk_text, re.IGNORECASE)
-                        for match in op_matches:
-                            ops = [op for op in match if op]
-                            operations.extend(ops)
+                for i, (start, end, chunk_text) in enumerate(section_chunks):
+                    # Highest clearance mention and operation names in one pass
+                    metadata = METADATA_EXTRACTOR.extract(chunk_text)
                     
                     chunk = {
-                        "id": f"{doc_id}_{section['heading']}_{i}",
+                        "id": f"{doc_id}_{heading}_{i}",
                         "text": chunk_text,
                         "document": doc_id,
-                        "section": section["heading"],
-                        "security_level": security_level,
-                        "operations": operations,
-                        "position": i
+                        "section": heading,
+                        "security_level": metadata["security_level"],
+                        "operations": metadata["operations"],
+                        "position": i,
+                        # Character offsets into the section's text
+                        "start": start,
+                        "end": end
                     }
                     chunks.append(chunk)
             
-            # Save chunks to file
-            with open(chunk_file, 'w') as f:
-                json.dump(chunks, f)
+            # Save chunks to file along with the fingerprint of the source
+            DocumentProcessor._save_chunks(doc_id, fingerprint, chunks)
+            changes = DocumentProcessor.diff_chunks(stored["chunks"] if stored else [], chunks)
             
-            return chunks
+            return chunks, changes, fingerprint
         else:
-            st.error(f"Unsupported file format for {file_path}")
-            return []
+            report_error(f"Unsupported file format for {file_path}")
+            return [], no_changes, None
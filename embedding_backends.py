@@ -0,0 +1,80 @@
+import re
+import time
+import random
+import hashlib
+import numpy as np
+
+from async_client import transient_http_errors
+
+class EmbeddingBackend:
+    """Interface for services that turn a batch of texts into embedding vectors"""
+
+    model_name = "base"
+
+    def embed_batch(self, texts, task_type="retrieval_document"):
+        """Return one embedding (list of floats) per input text, in order"""
+        raise NotImplementedError
+
+class GeminiEmbeddingBackend(EmbeddingBackend):
+    """Embeds batches of text with Google's Generative AI embedding API"""
+
+    def __init__(self, model_name="models/embedding-001"):
+        self.model_name = model_name
+
+    def embed_batch(self, texts, task_type="retrieval_document"):
+        """Send a whole batch in one request; the API accepts a list of contents"""
+        import google.generativeai as genai
+
+        with transient_http_errors():
+            result = genai.embed_content(
+                model=self.model_name,
+                content=list(texts),
+                task_type=task_type
+            )
+        return result["embedding"]
+
+class HashingEmbeddingBackend(EmbeddingBackend):
+    """Deterministic local backend based on feature hashing of words and word pairs.
+
+    Texts that share vocabulary get similar vectors, which is enough to exercise
+    retrieval and measure ingestion throughput without network access.
+
+    Optional latency (seconds per batch) and error_rate (chance that a batch
+    raises ConnectionError) simulate a remote service; calls counts batches.
+    """
+
+    TOKEN_PATTERN = re.compile(r"\w+")
+
+    def __init__(self, dim=768, model_name=None, latency=0.0, error_rate=0.0, seed=None):
+        self.dim = dim
+        self.model_name = model_name or f"local/hashing-{dim}"
+        self.latency = latency
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    def _embed_one(self, text):
+        """Hash unigrams and bigrams into a signed, L2-normalized vector"""
+        vector = np.zeros(self.dim, dtype=np.float32)
+        tokens = self.TOKEN_PATTERN.findall(text.lower())
+        features = tokens + [f"{a} {b}" for a, b in zip(tokens, tokens[1:])]
+
+        for feature in features:
+            digest = hashlib.blake2b(feature.encode(), digest_size=8).digest()
+            bucket = int.from_bytes(digest[:4], "little") % self.dim
+            sign = 1.0 if digest[4] & 1 else -1.0
+            vector[bucket] += sign
+
+        norm = np.linalg.norm(vector)
+        if norm > 0:
+            vector /= norm
+        return vector.tolist()
+
+    def embed_batch(self, texts, task_type="retrieval_document"):
+        """Embed each text locally; task_type does not change the result"""
+        self.calls += 1
+        if self.latency:
+            time.sleep(self.latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise ConnectionError("injected embedding failure")
+        return [self._embed_one(text) for text in texts]
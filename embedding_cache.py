@@ -0,0 +1,213 @@
+import os
+import re
+import time
+import sqlite3
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+class EmbeddingCache:
+    """Persistent, content-addressed cache of chunk embeddings.
+
+    Entries are keyed by a hash of the model name and the chunk text, so an
+    unchanged chunk is never sent to the embedding backend twice, whatever
+    document or position it appears in. The least recently used entries are
+    evicted once the cache holds more than max_entries vectors. With a ttl
+    (seconds), entries older than that are treated as misses.
+    """
+
+    def __init__(self, path="data/embeddings/chunk_cache.sqlite", max_entries=200000, ttl=None):
+        self.path = path
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "key TEXT PRIMARY KEY, vector BLOB NOT NULL, last_used REAL NOT NULL, created REAL)"
+        )
+        # Caches written before entries carried a creation time
+        columns = [row[1] for row in self._conn.execute("PRAGMA table_info(embeddings)")]
+        if "created" not in columns:
+            self._conn.execute("ALTER TABLE embeddings ADD COLUMN created REAL")
+        self._conn.execute("CREATE INDEX IF NOT EXISTS idx_last_used ON embeddings (last_used)")
+        self._conn.commit()
+
+    @staticmethod
+    def make_key(model_name, text):
+        """Content hash identifying an embedding of text by model_name"""
+        return hashlib.sha256(f"{model_name}\0{text}".encode("utf-8")).hexdigest()
+
+    def get_many(self, keys):
+        """Look up several keys at once, returning {key: embedding} for the hits"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        with self._lock:
+            # Stay well below SQLite's bound-parameter limit
+            for start in range(0, len(keys), 500):
+                batch = keys[start:start + 500]
+                placeholders = ",".join("?" * len(batch))
+                rows = self._conn.execute(
+                    f"SELECT key, vector, created FROM embeddings WHERE key IN ({placeholders})", batch
+                ).fetchall()
+                for key, blob, created in rows:
+                    if self.ttl is not None and (created is None or time.time() - created > self.ttl):
+                        continue
+                    found[key] = np.frombuffer(blob, dtype=np.float32).tolist()
+
+            if found:
+                now = time.time()
+                self._conn.executemany(
+                    "UPDATE embeddings SET last_used = ? WHERE key = ?",
+                    [(now, key) for key in found]
+                )
+                self._conn.commit()
+
+            self.hits += len(found)
+            self.misses += len(keys) - len(found)
+        return found
+
+    def put_many(self, items):
+        """Store {key: embedding} pairs and evict old entries beyond max_entries"""
+        if not items:
+            return
+        now = time.time()
+        rows = [
+            (key, np.asarray(vector, dtype=np.float32).tobytes(), now, now)
+            for key, vector in items.items()
+        ]
+        with self._lock:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector, last_used, created) VALUES (?, ?, ?, ?)", rows
+            )
+            self._evict()
+            self._conn.commit()
+
+    def _evict(self):
+        """Drop the least recently used entries above the size bound"""
+        count = self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = count - self.max_entries
+        if excess > 0:
+            self._conn.execute(
+                "DELETE FROM embeddings WHERE key IN "
+                "(SELECT key FROM embeddings ORDER BY last_used ASC LIMIT ?)",
+                (excess,)
+            )
+
+    def __len__(self):
+        with self._lock:
+            return self._conn.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+            "entries": len(self),
+            "max_entries": self.max_entries
+        }
+
+class QueryEmbeddingCache:
+    """In-process LRU cache of query embeddings with a TTL and an optional on-disk tier.
+
+    Queries are embedded with a different task type than document chunks, so
+    they are cached separately from EmbeddingCache. Keys are built from the
+    model name and the normalized query text, so trivial differences in case
+    and whitespace still hit.
+    """
+
+    TASK_TYPE = "retrieval_query"
+
+    def __init__(self, max_entries=1024, ttl=24 * 3600, disk_cache=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        # Optional persistent second tier, e.g. EmbeddingCache("data/embeddings/query_cache.sqlite", ttl=...)
+        self.disk_cache = disk_cache
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def normalize(text):
+        """Case- and whitespace-insensitive form of a query"""
+        return re.sub(r"\s+", " ", text).strip().lower()
+
+    def make_key(self, model_name, text):
+        """Cache key for a query embedded by model_name"""
+        return EmbeddingCache.make_key(f"{model_name}|{self.TASK_TYPE}", self.normalize(text))
+
+    def get_many(self, keys):
+        """Return {key: embedding} for keys found in memory or on disk"""
+        keys = list(dict.fromkeys(keys))
+        found = {}
+        now = time.time()
+        with self._lock:
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+                embedding, created = entry
+                if self.ttl is not None and now - created > self.ttl:
+                    del self._entries[key]
+                    continue
+                self._entries.move_to_end(key)
+                found[key] = embedding
+            self.hits += len(found)
+
+        remaining = [key for key in keys if key not in found]
+        if remaining and self.disk_cache is not None:
+            from_disk = self.disk_cache.get_many(remaining)
+            # Promote disk hits into memory
+            self._store(from_disk, now)
+            found.update(from_disk)
+            with self._lock:
+                self.disk_hits += len(from_disk)
+
+        with self._lock:
+            self.misses += len(keys) - len(found)
+        return found
+
+    def _store(self, items, now):
+        """Insert into the memory tier, evicting least recently used entries"""
+        with self._lock:
+            for key, embedding in items.items():
+                self._entries[key] = (embedding, now)
+                self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def put_many(self, items):
+        """Cache {key: embedding} in memory and, if configured, on disk"""
+        if not items:
+            return
+        self._store(items, time.time())
+        if self.disk_cache is not None:
+            self.disk_cache.put_many(items)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """Hit/miss counters for both tiers and current size"""
+        lookups = self.hits + self.disk_hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.disk_hits) / lookups if lookups else 0.0,
+            "entries": len(self),
+            "max_entries": self.max_entries
+        }
@@ -1,46 +1,189 @@
 import os
-import pickle
-import streamlit as st
-import google.generativeai as genai
+from concurrent.futures import ThreadPoolExecutor
+import numpy as np
+
+from embedding_backends import GeminiEmbeddingBackend
+from embedding_cache import EmbeddingCache, QueryEmbeddingCache
+from embedding_store import EmbeddingStore, migrate_pickle
+from tracing import tracer, traced
+from async_client import AsyncClient, RequestFailed, shared_embedding_client
+from utils import report_error
+
+# Query embeddings are cached per process, so they survive across engine instances and reruns
+shared_query_cache = QueryEmbeddingCache()
 
 class EmbeddingEngine:
     """Handles creation and retrieval of embeddings"""
-    
-    def __init__(self, model_name="models/embedding-001"):
-        self.model_name = model_name
-    
+
+    def __init__(self, model_name="models/embedding-001", backend=None, batch_size=100, max_workers=4, cache=None, query_cache=None,
+                 client=None):
+        # The backend does the actual embedding work; default to Gemini
+        self.backend = backend or GeminiEmbeddingBackend(model_name)
+        self.model_name = self.backend.model_name
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        # Content-addressed cache shared by all documents
+        self.cache = cache if cache is not None else EmbeddingCache()
+        # Queries use a different task type, so they have their own cache
+        self.query_cache = query_cache if query_cache is not None else shared_query_cache
+        # Rate limiting, retries and deduplication of embedding requests
+        self.client = client if client is not None else shared_embedding_client
+        # Chunks the last compute_document_embeddings call could not embed
+        self.last_failed_ids = []
+        # {chunk_id: hash of model and text} for the embeddings it returned
+        self.last_hashes = {}
+
     def get_embedding(self, text):
-        """Get embedding for a text using Google Generative AI"""
-        try:
-            embedding = genai.embed_content(
-                model=self.model_name,
-                content=text,
-                task_type="retrieval_document"
-            )
-            return embedding["embedding"]
-        except Exception as e:
-            st.error(f"Error generating embedding: {str(e)}")
-            return None
-    
+        """Get embedding for a single text"""
+        return self.embed_many([text])[0]
+
+    def get_query_embedding(self, text):
+        """Get embedding for a single search query"""
+        return self.embed_queries([text])[0]
+
+    @traced("embed_queries")
+    def embed_queries(self, texts):
+        """Embed search queries, serving repeated queries from the query embedding cache"""
+        texts = list(texts)
+        keys = [self.query_cache.make_key(self.model_name, text) for text in texts]
+        cached = self.query_cache.get_many(keys)
+        tracer.current_span().set(queries=len(texts), cache_hits=len(cached))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, QueryEmbeddingCache.normalize(text))
+
+        if missing:
+            vectors = self.embed_many(missing.values(), task_type=QueryEmbeddingCache.TASK_TYPE)
+            computed = {key: vector for key, vector in zip(missing, vectors) if vector}
+            self.query_cache.put_many(computed)
+            cached.update(computed)
+
+        return [cached.get(key) for key in keys]
+
+    def _embed_batch(self, batch, task_type):
+        """Embed one batch, returning None for every text if the request still fails after retries"""
+        with tracer.span("embedding_request", texts=len(batch), bytes=sum(len(text.encode()) for text in batch)) as span:
+            try:
+                # Identical batches requested at the same time (e.g. the same query twice) share one call
+                return self.client.call(
+                    self.backend.embed_batch, batch, task_type=task_type,
+                    key=AsyncClient.make_key(self.model_name, task_type, *batch)
+                )
+            except RequestFailed as e:
+                span.set(error=type(e).__name__)
+                report_error(f"Error generating embedding: {str(e)}")
+                return [None] * len(batch)
+
+    def embed_many(self, texts, task_type="retrieval_document"):
+        """Embed many texts using batched requests, a bounded number running in parallel.
+
+        Results are returned in the same order as the input texts; texts whose
+        batch failed get None.
+        """
+        texts = list(texts)
+        if not texts:
+            return []
+
+        batches = [texts[i:i + self.batch_size] for i in range(0, len(texts), self.batch_size)]
+
+        # A single batch does not need a thread pool
+        if len(batches) == 1 or self.max_workers <= 1:
+            batch_results = [self._embed_batch(batch, task_type) for batch in batches]
+        else:
+            with ThreadPoolExecutor(max_workers=min(self.max_workers, len(batches))) as executor:
+                # map() yields results in submission order, which keeps embeddings aligned
+                embed_batch = tracer.propagate(lambda batch: self._embed_batch(batch, task_type))
+                batch_results = list(executor.map(embed_batch, batches))
+
+        embeddings = []
+        for result in batch_results:
+            embeddings.extend(result)
+        return embeddings
+
+    def embed_with_cache(self, texts):
+        """Embed texts, reusing cached embeddings and only sending new or changed texts to the backend"""
+        keys = [EmbeddingCache.make_key(self.model_name, text) for text in texts]
+        cached = self.cache.get_many(keys)
+        tracer.current_span().add("chunk_cache_hits", len(cached))
+
+        missing = {}
+        for key, text in zip(keys, texts):
+            if key not in cached:
+                missing.setdefault(key, text)
+
+        if missing:
+            vectors = self.embed_many(missing.values())
+            computed = {key: vector for key, vector in zip(missing, vectors) if vector}
+            self.cache.put_many(computed)
+            cached.update(computed)
+
+        return [cached.get(key) for key in keys]
+
     def compute_document_embeddings(self, chunks, doc_id, force_recompute=False):
-        """Compute embeddings for document chunks and store them"""
-        embeddings_file = f"data/embeddings/{doc_id}_embeddings.pkl"
-        
-        # Check if embeddings already exist
-        if os.path.exists(embeddings_file) and not force_recompute:
-            with open(embeddings_file, 'rb') as f:
-                return pickle.load(f)
-        
-        # Compute embeddings for all chunks
-        embeddings = {}
-        for chunk in chunks:
-            chunk_id = chunk["id"]
-            embedding = self.get_embedding(chunk["text"])
-            if embedding:
-                embeddings[chunk_id] = embedding
-                
-        # Save embeddings to file
-        with open(embeddings_file, 'wb') as f:
-            pickle.dump(embeddings, f)
-        
+        """Compute embeddings for document chunks and store them.
+
+        Each stored row carries a hash of the model and chunk text, so only
+        chunks that are new or whose text changed are embedded again, and rows
+        for chunks that no longer exist are dropped. Returns {chunk_id: embedding}
+        where each embedding is a row of the document's memory-mapped EmbeddingStore;
+        last_hashes then holds the hash each returned embedding was computed from.
+        """
+        store = EmbeddingStore(f"data/embeddings/{doc_id}")
+
+        # Convert embeddings cached by older versions as pickles
+        legacy_file = f"data/embeddings/{doc_id}_embeddings.pkl"
+        if not store.exists() and os.path.exists(legacy_file):
+            migrate_pickle(legacy_file, store.prefix)
+
+        chunk_hashes = {chunk["id"]: EmbeddingCache.make_key(self.model_name, chunk["text"]) for chunk in chunks}
+        self.last_failed_ids = []
+
+        if not store.exists() or force_recompute:
+            ids, vectors = self._embed_chunks(chunks)
+            store.write(ids, vectors, [chunk_hashes[chunk_id] for chunk_id in ids])
+            return self._stored_embeddings(store, chunk_hashes)
+
+        stored_ids, stored_vectors = store.load()
+        stored_hashes = store.load_hashes()
+        # A row without a hash (e.g. migrated from a pickle) cannot be shown to match its chunk, so it is stale;
+        # re-embedding unchanged text is served by the embedding cache
+        current_rows = [
+            row for row, (chunk_id, digest) in enumerate(zip(stored_ids, stored_hashes))
+            if digest is not None and chunk_hashes.get(chunk_id) == digest
+        ]
+        current_ids = {stored_ids[row] for row in current_rows}
+        new_chunks = [chunk for chunk in chunks if chunk["id"] not in current_ids]
+
+        if len(current_rows) == len(stored_ids):
+            # Nothing stale: only append chunks added since the store was written
+            if new_chunks:
+                ids, vectors = self._embed_chunks(new_chunks)
+                store.append(ids, vectors, [chunk_hashes[chunk_id] for chunk_id in ids])
+            return self._stored_embeddings(store, chunk_hashes)
+
+        # Some rows are stale or removed: keep the current rows and rewrite the store
+        ids, vectors = self._embed_chunks(new_chunks)
+        keep_ids = [stored_ids[row] for row in current_rows]
+        all_ids = keep_ids + ids
+        all_vectors = np.asarray(stored_vectors[current_rows])
+        if ids:
+            all_vectors = np.concatenate([all_vectors, vectors])
+        store.write(all_ids, all_vectors, [chunk_hashes[chunk_id] for chunk_id in all_ids])
+        return self._stored_embeddings(store, chunk_hashes)
+
+    def _stored_embeddings(self, store, chunk_hashes):
+        embeddings = store.as_dict()
+        # Every row left in the store matches its chunk's current text
+        self.last_hashes = {chunk_id: chunk_hashes[chunk_id] for chunk_id in embeddings}
         return embeddings
+
+    def _embed_chunks(self, chunks):
+        """Embed chunk texts, returning (ids, float32 matrix) for the chunks that succeeded"""
+        embeddings = self.embed_with_cache([chunk["text"] for chunk in chunks])
+        ids = [chunk["id"] for chunk, embedding in zip(chunks, embeddings) if embedding is not None]
+        # Failed chunks are left out of the store, so they are embedded again on the next load
+        self.last_failed_ids.extend(chunk["id"] for chunk, embedding in zip(chunks, embeddings) if embedding is None)
+        vectors = np.asarray([embedding for embedding in embeddings if embedding is not None], dtype=np.float32)
+        return ids, vectors
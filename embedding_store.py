@@ -0,0 +1,151 @@
+import os
+import sys
+import json
+import glob
+import pickle
+import numpy as np
+
+def _as_matrix(vectors, count):
+    """Contiguous float32 (count, dim) view of vectors, tolerating an empty batch"""
+    vectors = np.ascontiguousarray(vectors, dtype=np.float32)
+    if count == 0:
+        return vectors.reshape(0, vectors.shape[-1] if vectors.ndim == 2 else 0)
+    return vectors.reshape(count, -1)
+
+class EmbeddingStore:
+    """On-disk float32 embedding matrix with a JSON id sidecar.
+
+    Rows live in a raw float32 file opened with np.memmap, so loading is
+    zero-copy and the pages are shared between processes through the OS page
+    cache. The sidecar ({prefix}.ids.json) names the data file and records how
+    many rows are valid; replacing it is the single atomic commit point for
+    both full rewrites and appends, so readers never see a half-written store.
+    """
+
+    def __init__(self, prefix):
+        self.prefix = prefix
+        self.sidecar_path = f"{prefix}.ids.json"
+
+    def exists(self):
+        return os.path.exists(self.sidecar_path)
+
+    def _read_sidecar(self):
+        with open(self.sidecar_path, "r") as f:
+            return json.load(f)
+
+    def _write_sidecar(self, meta):
+        tmp_path = f"{self.sidecar_path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump(meta, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.sidecar_path)
+
+    def _data_path(self, meta):
+        return os.path.join(os.path.dirname(self.sidecar_path), meta["data_file"])
+
+    def load(self):
+        """Return (ids, matrix) with the matrix memory-mapped read-only"""
+        meta = self._read_sidecar()
+        count, dim = len(meta["ids"]), meta["dim"]
+        if count == 0:
+            return [], np.empty((0, dim), dtype=np.float32)
+        matrix = np.memmap(self._data_path(meta), dtype=np.float32, mode="r", shape=(count, dim))
+        return meta["ids"], matrix
+
+    def load_hashes(self):
+        """Content hash recorded for each row, or None for rows stored without one"""
+        meta = self._read_sidecar()
+        return meta.get("hashes") or [None] * len(meta["ids"])
+
+    def as_dict(self):
+        """Return {chunk_id: embedding row} backed by the memory map"""
+        ids, matrix = self.load()
+        return dict(zip(ids, matrix))
+
+    def write(self, ids, vectors, hashes=None):
+        """Replace the store contents with the given rows and optional per-row content hashes"""
+        vectors = _as_matrix(vectors, len(ids))
+        old_meta = self._read_sidecar() if self.exists() else None
+        generation = old_meta["generation"] + 1 if old_meta else 0
+
+        # Write a new data file, then switch the sidecar over to it
+        data_file = f"{os.path.basename(self.prefix)}.{generation}.f32"
+        data_path = os.path.join(os.path.dirname(self.sidecar_path), data_file)
+        with open(data_path, "wb") as f:
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        self._write_sidecar({
+            "dim": int(vectors.shape[1]) if len(ids) else (old_meta["dim"] if old_meta else 0),
+            "generation": generation,
+            "data_file": data_file,
+            "ids": list(ids),
+            "hashes": list(hashes) if hashes is not None else [None] * len(ids)
+        })
+
+        if old_meta and old_meta["data_file"] != data_file:
+            try:
+                os.remove(self._data_path(old_meta))
+            except OSError:
+                pass
+
+    def append(self, ids, vectors, hashes=None):
+        """Append rows for new chunk ids without rewriting existing rows"""
+        if not ids:
+            return
+        if not self.exists():
+            self.write(ids, vectors, hashes)
+            return
+
+        meta = self._read_sidecar()
+        vectors = _as_matrix(vectors, len(ids))
+        if meta["ids"] and vectors.shape[1] != meta["dim"]:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match store dimension {meta['dim']}")
+
+        # Drop any bytes past the committed rows (left by an interrupted append) before writing
+        data_path = self._data_path(meta)
+        committed = len(meta["ids"]) * meta["dim"] * 4
+        with open(data_path, "r+b" if os.path.exists(data_path) else "wb") as f:
+            f.truncate(committed)
+            f.seek(committed)
+            f.write(vectors.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+
+        old_hashes = meta.get("hashes") or [None] * len(meta["ids"])
+        meta["dim"] = int(vectors.shape[1])
+        meta["ids"] = meta["ids"] + list(ids)
+        meta["hashes"] = old_hashes + (list(hashes) if hashes is not None else [None] * len(ids))
+        self._write_sidecar(meta)
+
+def migrate_pickle(pickle_path, prefix):
+    """Convert one legacy {chunk_id: [floats]} pickle into an EmbeddingStore.
+
+    Pickles carry no content hashes, so the rows are stored without one and
+    EmbeddingEngine.compute_document_embeddings embeds those chunks again.
+    """
+    with open(pickle_path, "rb") as f:
+        embeddings = pickle.load(f)
+    store = EmbeddingStore(prefix)
+    ids = list(embeddings.keys())
+    vectors = np.asarray([embeddings[chunk_id] for chunk_id in ids], dtype=np.float32)
+    store.write(ids, vectors)
+    return store
+
+def migrate_pickles(directory="data/embeddings"):
+    """One-shot migration of every legacy {doc_id}_embeddings.pkl file that has no store yet"""
+    migrated = []
+    for pickle_path in sorted(glob.glob(os.path.join(directory, "*_embeddings.pkl"))):
+        doc_id = os.path.basename(pickle_path)[:-len("_embeddings.pkl")]
+        prefix = os.path.join(directory, doc_id)
+        if not EmbeddingStore(prefix).exists():
+            migrate_pickle(pickle_path, prefix)
+            migrated.append(doc_id)
+    return migrated
+
+if __name__ == "__main__":
+    directory = sys.argv[1] if len(sys.argv) > 1 else "data/embeddings"
+    for doc_id in migrate_pickles(directory):
+        print(f"Migrated embeddings for {doc_id}")
@@ -0,0 +1,199 @@
+import os
+import json
+import itertools
+from collections import deque
+import numpy as np
+
+from entity_matcher import EntityMatcher
+
+ENTITY_GRAPH_FILE = "data/chunks/entity_graph.npz"
+
+class EntityGraph:
+    """Entity knowledge graph over the corpus, stored as a compact adjacency index.
+
+    Nodes are chunks, sections and entities (operation and protocol names).
+    Chunks link to their section and to the entities they mention, and
+    entities mentioned in the same chunk are linked with a weight equal to
+    the number of chunks they share. The graph is assembled with networkx at
+    ingestion and kept as CSR arrays.
+
+    Hops are counted in chunks: the chunks that mention an entity are one hop
+    away, and chunks that share a section or an entity with a chunk h hops
+    away are h + 1 hops away. The chunks within max_hops of an entity are
+    found the first time it is looked up and remembered, so loading a graph
+    does no traversal and repeated queries for an entity are one table lookup.
+    """
+
+    def __init__(self, nodes, indptr, indices, weights, chunk_entities, dictionary_size, max_hops=2):
+        self.nodes = nodes  # "chunk:<id>", "section:<doc>/<section>" or "entity:<name>"
+        self.node_index = {node: i for i, node in enumerate(nodes)}
+        self.indptr = indptr
+        self.indices = indices
+        self.weights = weights
+        self.chunk_entities = chunk_entities  # chunk id -> entity keys, reused by incremental rebuilds
+        self.dictionary_size = dictionary_size
+        self.max_hops = max_hops
+        self._is_chunk = np.fromiter((node.startswith("chunk:") for node in nodes), dtype=bool, count=len(nodes))
+        # Entity node -> (chunk nodes, hops) within max_hops, filled in on first lookup
+        self._entity_table = {}
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @staticmethod
+    def extract_entities(chunk, entity_matcher):
+        """Normalized names of the known entities mentioned in a chunk"""
+        return sorted({EntityMatcher.normalize(name) for _, _, name in entity_matcher.find(chunk["text"])})
+
+    @classmethod
+    def build(cls, chunks, entity_matcher, previous=None, changed_ids=(), max_hops=2):
+        """Build the graph for chunks.
+
+        Entity mentions are found with entity_matcher. When previous is a
+        graph built with the same entity dictionary, mentions of chunks not in
+        changed_ids are reused instead of matched again.
+        """
+        import networkx as nx
+
+        reuse = previous is not None and previous.dictionary_size == len(entity_matcher)
+        changed = set(changed_ids)
+
+        graph = nx.Graph()
+        chunk_entities = {}
+        for chunk in chunks:
+            chunk_id = chunk["id"]
+            if reuse and chunk_id not in changed and chunk_id in previous.chunk_entities:
+                entities = previous.chunk_entities[chunk_id]
+            else:
+                entities = cls.extract_entities(chunk, entity_matcher)
+            chunk_entities[chunk_id] = entities
+
+            chunk_node = f"chunk:{chunk_id}"
+            graph.add_edge(chunk_node, f"section:{chunk['document']}/{chunk['section']}", weight=1.0)
+            for entity in entities:
+                graph.add_edge(chunk_node, f"entity:{entity}", weight=1.0)
+            # Co-occurrence edges between every pair of entities in the chunk
+            for first, second in itertools.combinations(entities, 2):
+                first, second = f"entity:{first}", f"entity:{second}"
+                if graph.has_edge(first, second):
+                    graph[first][second]["weight"] += 1.0
+                else:
+                    graph.add_edge(first, second, weight=1.0)
+
+        nodes = list(graph.nodes)
+        if nodes:
+            adjacency = nx.to_scipy_sparse_array(graph, nodelist=nodes, weight="weight", format="csr")
+            indptr, indices, weights = adjacency.indptr, adjacency.indices, adjacency.data
+        else:
+            indptr, indices, weights = np.zeros(1, dtype=np.int64), np.empty(0, dtype=np.int32), np.empty(0)
+
+        return cls(
+            nodes,
+            indptr.astype(np.int64),
+            indices.astype(np.int32),
+            weights.astype(np.float32),
+            chunk_entities,
+            len(entity_matcher),
+            max_hops
+        )
+
+    def _neighbours(self, node):
+        return self.indices[self.indptr[node]:self.indptr[node + 1]]
+
+    def _chunks_within(self, start_nodes, hops):
+        """{chunk node: hops} for chunk nodes within hops of any start node, counting hops in chunks.
+
+        The search alternates between chunks and the sections and entities
+        they link to; entity co-occurrence edges are not followed, since a
+        shared chunk already connects co-occurring entities.
+        """
+        found = {}
+        visited = set(start_nodes)  # section and entity nodes already expanded
+        frontier = list(start_nodes)
+        for hop in range(1, hops + 1):
+            reached = []
+            for node in frontier:
+                for neighbour in self._neighbours(node).tolist():
+                    if self._is_chunk[neighbour] and neighbour not in found:
+                        found[neighbour] = hop
+                        reached.append(neighbour)
+            if hop == hops:
+                break
+            frontier = []
+            for chunk_node in reached:
+                for neighbour in self._neighbours(chunk_node).tolist():
+                    if not self._is_chunk[neighbour] and neighbour not in visited:
+                        visited.add(neighbour)
+                        frontier.append(neighbour)
+        return found
+
+    def _entity_chunks(self, node):
+        """(chunk nodes, hops) within max_hops of one entity node, computed once per entity"""
+        entry = self._entity_table.get(node)
+        if entry is None:
+            # Concurrent first lookups may both traverse; either result is the same
+            found = self._chunks_within([node], self.max_hops)
+            entry = (
+                np.fromiter(found.keys(), dtype=np.int32, count=len(found)),
+                np.fromiter(found.values(), dtype=np.int8, count=len(found))
+            )
+            self._entity_table[node] = entry
+        return entry
+
+    def chunks_near(self, entity_names, hops=None):
+        """{chunk id: hops} for chunks within hops (counted in chunks) of the named entities.
+
+        Uses the per-entity table when hops <= max_hops, and a breadth-first
+        search over the adjacency index otherwise.
+        """
+        hops = self.max_hops if hops is None else hops
+        start_nodes = [
+            self.node_index[f"entity:{EntityMatcher.normalize(name)}"]
+            for name in entity_names
+            if f"entity:{EntityMatcher.normalize(name)}" in self.node_index
+        ]
+        if hops > self.max_hops:
+            found = self._chunks_within(start_nodes, hops)
+        else:
+            found = {}
+            for node in start_nodes:
+                chunk_nodes, chunk_hops = self._entity_chunks(node)
+                for chunk_node, hop in zip(chunk_nodes.tolist(), chunk_hops.tolist()):
+                    if hop <= hops and hop < found.get(chunk_node, hops + 1):
+                        found[chunk_node] = hop
+        return {self.nodes[node][len("chunk:"):]: hop for node, hop in found.items()}
+
+    def save(self, path=ENTITY_GRAPH_FILE):
+        """Persist the graph atomically as a .npz file"""
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "wb") as f:
+            np.savez(
+                f,
+                nodes=np.array(json.dumps(self.nodes)),
+                indptr=self.indptr,
+                indices=self.indices,
+                weights=self.weights,
+                chunk_entities=np.array(json.dumps(self.chunk_entities)),
+                params=np.array(json.dumps({"dictionary_size": self.dictionary_size, "max_hops": self.max_hops}))
+            )
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=ENTITY_GRAPH_FILE):
+        """Load a graph written by save(), or None if there is none"""
+        if not os.path.exists(path):
+            return None
+        with np.load(path) as data:
+            params = json.loads(str(data["params"]))
+            return cls(
+                json.loads(str(data["nodes"])),
+                data["indptr"],
+                data["indices"],
+                data["weights"],
+                json.loads(str(data["chunk_entities"])),
+                params["dictionary_size"],
+                params["max_hops"]
+            )
@@ -0,0 +1,130 @@
+from collections import deque
+
+def _is_word_char(ch):
+    """Same notion of a word character as the regex \\w"""
+    return ch.isalnum() or ch == "_"
+
+class EntityMatcher:
+    """Case-insensitive, word-boundary-aware multi-pattern matcher (Aho-Corasick).
+
+    Every entity name is inserted into one trie; failure links turn it into
+    an automaton that finds all names in a text in a single left-to-right
+    pass, so matching cost depends on the text length and the number of
+    matches rather than on the dictionary size. A name only matches where a
+    regex \\b<name>\\b would. Names can be added at any time; the failure
+    links are recomputed on the next match after the trie changed.
+    """
+
+    def __init__(self):
+        self._goto = [{}]  # node -> {char: child node}
+        self._fail = [0]
+        self._outputs = [[]]  # node -> keys of names ending here, including via failure links
+        self._terminal = [None]  # node -> key of the name ending exactly here
+        self._dirty = False
+        self.names = {}  # key (lowercased name) -> canonical spelling
+        self.kinds = {}  # key -> entity kinds, in insertion order
+
+    @staticmethod
+    def normalize(text):
+        """Lowercase text without changing its length, so match offsets stay valid"""
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            return lowered
+        return "".join(ch.lower() if len(ch.lower()) == 1 else ch for ch in text)
+
+    def __len__(self):
+        return len(self.names)
+
+    def __contains__(self, name):
+        return self.normalize(name) in self.names
+
+    def add(self, name, kind):
+        """Register name as an entity of the given kind; returns True if the name is new"""
+        key = self.normalize(name.strip())
+        if not key:
+            return False
+
+        if key in self.names:
+            if kind not in self.kinds[key]:
+                self.kinds[key].append(kind)
+            return False
+
+        node = 0
+        for ch in key:
+            child = self._goto[node].get(ch)
+            if child is None:
+                child = len(self._goto)
+                self._goto[node][ch] = child
+                self._goto.append({})
+                self._fail.append(0)
+                self._outputs.append([])
+                self._terminal.append(None)
+            node = child
+        self._terminal[node] = key
+        self.names[key] = name.strip()
+        self.kinds[key] = [kind]
+        self._dirty = True
+        return True
+
+    def add_many(self, names, kind):
+        """Register several names of one kind, returning how many were new"""
+        return sum(self.add(name, kind) for name in names)
+
+    def _build(self):
+        """Compute failure links and output sets breadth-first over the trie"""
+        for node in range(len(self._goto)):
+            self._outputs[node] = [self._terminal[node]] if self._terminal[node] else []
+
+        queue = deque()
+        for child in self._goto[0].values():
+            self._fail[child] = 0
+            queue.append(child)
+
+        while queue:
+            node = queue.popleft()
+            for ch, child in self._goto[node].items():
+                fail = self._fail[node]
+                while fail and ch not in self._goto[fail]:
+                    fail = self._fail[fail]
+                self._fail[child] = self._goto[fail].get(ch, 0)
+                self._outputs[child] = self._outputs[child] + self._outputs[self._fail[child]]
+                queue.append(child)
+
+        self._dirty = False
+
+    def find(self, text):
+        """All (start, end, canonical name) matches in text, including overlapping ones"""
+        if self._dirty:
+            self._build()
+
+        lowered = self.normalize(text)
+        goto, fail, outputs = self._goto, self._fail, self._outputs
+        matches = []
+        node = 0
+        for position, ch in enumerate(lowered):
+            while node and ch not in goto[node]:
+                node = fail[node]
+            node = goto[node].get(ch, 0)
+
+            for key in outputs[node]:
+                end = position + 1
+                start = end - len(key)
+                # Apply \b semantics at both edges of the name
+                before = start > 0 and _is_word_char(text[start - 1])
+                after = end < len(text) and _is_word_char(text[end])
+                if before == _is_word_char(key[0]) or after == _is_word_char(key[-1]):
+                    continue
+                matches.append((start, end, self.names[key]))
+
+        matches.sort()
+        return matches
+
+    def entities(self, text, kinds=()):
+        """Names found in text grouped by kind, each listed once in order of appearance"""
+        found = {kind: [] for kind in kinds}
+        for _, _, name in self.find(text):
+            for kind in self.kinds[self.normalize(name)]:
+                names = found.setdefault(kind, [])
+                if name not in names:
+                    names.append(name)
+        return found
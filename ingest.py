@@ -0,0 +1,247 @@
+import os
+import re
+import sys
+import json
+import glob
+import time
+import argparse
+from pathlib import Path
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from document_processor import DocumentProcessor
+from chunk_store import ChunkStore, CHUNK_STORE_DIR
+from keyword_model import KeywordModel, KEYWORD_MODEL_FILE
+from bm25_index import BM25Index, BM25_INDEX_FILE
+from entity_graph import EntityGraph, ENTITY_GRAPH_FILE
+from query_processor import QueryProcessor
+
+MANIFEST_PATH = "corpus.json"
+
+def load_manifest(manifest_path=MANIFEST_PATH):
+    """Read the corpus manifest and return {doc_id: file path}.
+
+    The manifest lists documents explicitly under "documents" ({doc_id: path})
+    and/or "directories" to scan for .docx files; scanned files get a doc_id
+    derived from their file name. Relative paths are resolved against the
+    manifest's directory.
+    """
+    with open(manifest_path, "r") as f:
+        manifest = json.load(f)
+
+    base_dir = Path(manifest_path).resolve().parent
+    documents = {}
+    for doc_id, doc_name in manifest.get("documents", {}).items():
+        documents[doc_id] = str((base_dir / doc_name).resolve())
+
+    for directory in manifest.get("directories", []):
+        pattern = str((base_dir / directory).resolve() / "**" / "*.docx")
+        for file_path in sorted(glob.glob(pattern, recursive=True)):
+            # Skip Word lock files such as ~$Manual.docx
+            if os.path.basename(file_path).startswith("~$"):
+                continue
+            doc_id = re.sub(r"\W+", "_", Path(file_path).stem).strip("_")
+            documents.setdefault(doc_id, file_path)
+
+    return documents
+
+def _process_one(doc_id, file_path, force_reprocess):
+    """Worker: parse and chunk one document, returning its chunks, changes, timing and file fingerprint"""
+    start = time.perf_counter()
+    chunks, changes, source = DocumentProcessor.process_document_with_source(file_path, doc_id, force_reprocess)
+    return doc_id, chunks, changes, time.perf_counter() - start, source
+
+def ingest_corpus(document_paths, workers=None, force_reprocess=False, progress=None, lexical_index=None,
+                  query_processor=None):
+    """Parse and chunk every document, in a process pool, into one combined chunk store.
+
+    Documents whose content matches the previous ChunkStore (or their stored
+    chunks) are reused in-process; new and edited ones are parsed in
+    parallel. When nothing changed, the memory-mapped store at
+    CHUNK_STORE_DIR is returned as is, without reading any chunk JSON.
+    progress, if given, is called with a metrics dict after each document; each dict carries the chunk ids
+    added, changed and removed. The BM25 index (lexical_index, or the one
+    persisted at BM25_INDEX_FILE) is brought up to date with those changes
+    in a copy, which is saved and returned as metrics["lexical_index"]["index"].
+    query_processor's entity dictionary learns the corpus operation names and
+    is used to rebuild the entity graph when the corpus changed.
+    Returns (ChunkStore, metrics).
+    """
+    start = time.perf_counter()
+    metrics = {
+        "documents": [],
+        "missing": [file_path for file_path in document_paths.values() if not os.path.exists(file_path)]
+    }
+    total = len(document_paths) - len(metrics["missing"])
+    no_changes = {"added": [], "changed": [], "removed": [], "unchanged_sections": 0}
+    previous = None if force_reprocess else ChunkStore.load(CHUNK_STORE_DIR)
+    # Chunk dicts per document, or its rows in the previous store for documents in reused
+    results = {}
+    reused = set()
+    sources = {}
+
+    def record(doc_id, chunks, changes, seconds, cached, source):
+        file_path = document_paths[doc_id]
+        if source is not None:
+            sources[doc_id] = source
+        entry = {
+            "doc_id": doc_id,
+            "chunks": len(chunks),
+            "bytes": os.path.getsize(file_path),
+            "seconds": seconds,
+            "cached": cached,
+            "changes": changes,
+            "done": len(results) + 1,
+            "total": total
+        }
+        results[doc_id] = chunks
+        metrics["documents"].append(entry)
+        if progress:
+            progress(entry)
+
+    pending = []
+    for doc_id, file_path in document_paths.items():
+        if not os.path.exists(file_path):
+            continue
+        stored = None
+        if not force_reprocess:
+            lookup_start = time.perf_counter()
+            previous_source = previous.sources.get(doc_id) if previous is not None else None
+            if previous_source is not None:
+                # Only the file is hashed (and only if its size or mtime changed); no chunks are read
+                fingerprint = DocumentProcessor.file_fingerprint(file_path, previous_source)
+                if DocumentProcessor.is_current(fingerprint, previous_source):
+                    reused.add(doc_id)
+                    rows = previous.document_rows(doc_id)
+                    record(doc_id, rows, no_changes, time.perf_counter() - lookup_start, True, fingerprint)
+                    continue
+            stored = DocumentProcessor.load_if_current(file_path, doc_id)
+        if stored is not None:
+            record(doc_id, stored[0], no_changes, time.perf_counter() - lookup_start, True, stored[1])
+        else:
+            pending.append((doc_id, file_path))
+
+    workers = workers or os.cpu_count() or 1
+    if len(pending) <= 1 or workers <= 1:
+        for doc_id, file_path in pending:
+            doc_id, chunks, changes, seconds, source = _process_one(doc_id, file_path, force_reprocess)
+            record(doc_id, chunks, changes, seconds, False, source)
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, len(pending))) as executor:
+            futures = [
+                executor.submit(_process_one, doc_id, file_path, force_reprocess)
+                for doc_id, file_path in pending
+            ]
+            for future in as_completed(futures):
+                doc_id, chunks, changes, seconds, source = future.result()
+                record(doc_id, chunks, changes, seconds, False, source)
+
+    # Recorded in manifest order, whatever order the workers finished in
+    sources = {doc_id: sources[doc_id] for doc_id in document_paths if doc_id in sources}
+    if previous is not None and list(sources) == list(previous.sources) and reused == set(sources):
+        # Same documents in the same order, none edited: keep the store on disk
+        chunks = previous
+        if sources != previous.sources:
+            chunks.sources = sources
+            chunks.save_sources(CHUNK_STORE_DIR)
+    else:
+        # Combine in manifest order so chunk order is stable across runs
+        def combined():
+            for doc_id in document_paths:
+                if doc_id in reused:
+                    yield from previous.iter_rows(results[doc_id])
+                else:
+                    yield from results.get(doc_id, [])
+
+        chunks = ChunkStore.from_chunks(combined(), sources)
+        chunks.save(CHUNK_STORE_DIR)
+
+    # Update the BM25 index incrementally with the chunks that were added, edited or removed
+    lexical_start = time.perf_counter()
+    if lexical_index is None:
+        lexical_index = BM25Index.load(BM25_INDEX_FILE) if os.path.exists(BM25_INDEX_FILE) else BM25Index()
+    changed_ids = [
+        chunk_id
+        for entry in metrics["documents"]
+        for chunk_id in entry["changes"]["added"] + entry["changes"]["changed"]
+    ]
+    # The given index may be serving queries, so changes go to a copy
+    synced_index = lexical_index.synced(chunks, chunks.ids if force_reprocess else changed_ids)
+    updated = synced_index is not lexical_index
+    if updated or not os.path.exists(BM25_INDEX_FILE):
+        synced_index.save(BM25_INDEX_FILE)
+    metrics["lexical_index"] = {
+        "updated": updated, "index": synced_index, "seconds": time.perf_counter() - lexical_start
+    }
+
+    # Rebuild the entity graph when the chunks or the entity dictionary changed
+    graph_start = time.perf_counter()
+    query_processor = query_processor or QueryProcessor()
+    query_processor.add_corpus_entities(chunks.operations)
+    previous_graph = None if force_reprocess else EntityGraph.load(ENTITY_GRAPH_FILE)
+    rebuild_graph = (previous_graph is None
+                     or updated
+                     or previous_graph.dictionary_size != len(query_processor.entity_matcher))
+    if rebuild_graph:
+        EntityGraph.build(chunks, query_processor.entity_matcher, previous_graph, changed_ids).save(ENTITY_GRAPH_FILE)
+    metrics["entity_graph"] = {"rebuilt": rebuild_graph, "seconds": time.perf_counter() - graph_start}
+
+    # Refit the keyword IDF table only when the corpus changed
+    fit_start = time.perf_counter()
+    refit = (force_reprocess
+             or any(not entry["cached"] for entry in metrics["documents"])
+             or KeywordModel.load(KEYWORD_MODEL_FILE).documents != len(chunks))
+    if refit:
+        KeywordModel.fit(chunks.texts()).save(KEYWORD_MODEL_FILE)
+    metrics["keyword_model"] = {"refit": refit, "seconds": time.perf_counter() - fit_start}
+
+    elapsed = time.perf_counter() - start
+    total_bytes = sum(entry["bytes"] for entry in metrics["documents"])
+    metrics.update({
+        "total_documents": len(metrics["documents"]),
+        "total_chunks": len(chunks),
+        "total_bytes": total_bytes,
+        "seconds": elapsed,
+        "documents_per_second": len(metrics["documents"]) / elapsed if elapsed else 0.0,
+        "chunks_per_second": len(chunks) / elapsed if elapsed else 0.0,
+        "megabytes_per_second": total_bytes / 1e6 / elapsed if elapsed else 0.0,
+        "workers": workers
+    })
+    return chunks, metrics
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Parse and chunk the document corpus")
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help="corpus manifest (default: corpus.json)")
+    parser.add_argument("--workers", type=int, default=None, help="worker processes (default: CPU count)")
+    parser.add_argument("--force", action="store_true", help="reprocess documents even if their content is unchanged")
+    args = parser.parse_args(argv)
+
+    def report(entry):
+        if entry["cached"]:
+            source = "unchanged"
+        else:
+            changes = entry["changes"]
+            source = (f"{entry['bytes'] / 1e6:.2f} MB, {len(changes['added'])} added, "
+                      f"{len(changes['changed'])} changed, {len(changes['removed'])} removed")
+        print(f"[{entry['done']}/{entry['total']}] {entry['doc_id']}: "
+              f"{entry['chunks']} chunks in {entry['seconds']:.2f}s ({source})")
+
+    document_paths = load_manifest(args.manifest)
+    os.makedirs("data/chunks", exist_ok=True)
+    chunks, metrics = ingest_corpus(document_paths, args.workers, args.force, progress=report)
+
+    for file_path in metrics["missing"]:
+        print(f"Document not found: {file_path}", file=sys.stderr)
+    print(f"Ingested {metrics['total_documents']} documents, {metrics['total_chunks']} chunks "
+          f"in {metrics['seconds']:.2f}s with {metrics['workers']} workers "
+          f"({metrics['documents_per_second']:.1f} docs/s, {metrics['chunks_per_second']:.0f} chunks/s, "
+          f"{metrics['megabytes_per_second']:.2f} MB/s)")
+    print(f"Combined chunk store: {CHUNK_STORE_DIR}")
+    if metrics["lexical_index"]["updated"]:
+        print(f"BM25 index updated in {metrics['lexical_index']['seconds']:.2f}s: {BM25_INDEX_FILE}")
+    if metrics["entity_graph"]["rebuilt"]:
+        print(f"Entity graph rebuilt in {metrics['entity_graph']['seconds']:.2f}s: {ENTITY_GRAPH_FILE}")
+    if metrics["keyword_model"]["refit"]:
+        print(f"Keyword model refitted in {metrics['keyword_model']['seconds']:.2f}s: {KEYWORD_MODEL_FILE}")
+
+if __name__ == "__main__":
+    main()
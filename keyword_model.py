@@ -0,0 +1,126 @@
+import os
+import re
+import json
+import math
+from collections import Counter
+
+from utils import english_stop_words
+
+KEYWORD_MODEL_FILE = "data/keyword_model.json"
+
+# Same tokens as scikit-learn's default token_pattern, so terms line up with the fitted vocabulary
+TOKEN_PATTERN = re.compile(r"(?u)\b\w\w+\b")
+
+class KeywordModel:
+    """TF-IDF keyword scorer whose IDF table is fitted once over the chunk corpus.
+
+    Fitting uses scikit-learn at ingestion time; the IDF table is saved as
+    JSON and queries are scored with a plain-Python transform against it, so
+    query analysis no longer fits a vectorizer on every request. Unigrams the
+    corpus has never seen get the highest IDF; unseen bigrams are ignored.
+    """
+
+    def __init__(self, idf=None, default_idf=1.0, ngram_range=(1, 2), documents=0):
+        self.idf = idf or {}
+        self.default_idf = default_idf
+        self.ngram_range = tuple(ngram_range)
+        self.documents = documents
+
+    @property
+    def is_fitted(self):
+        return bool(self.idf)
+
+    @staticmethod
+    def tokens(text):
+        """Lowercased word tokens with stop words removed"""
+        stop_words = english_stop_words()
+        return [t for t in TOKEN_PATTERN.findall(text.lower()) if t not in stop_words]
+
+    def terms(self, text):
+        """Word n-grams of text, built the way TfidfVectorizer builds them"""
+        tokens = self.tokens(text)
+        low, high = self.ngram_range
+        terms = []
+        for n in range(low, high + 1):
+            terms.extend(" ".join(tokens[i:i + n]) for i in range(len(tokens) - n + 1))
+        return terms
+
+    @classmethod
+    def fit(cls, texts, ngram_range=(1, 2), max_features=100000):
+        """Fit the IDF table on the chunk texts"""
+        from sklearn.feature_extraction.text import TfidfVectorizer
+
+        texts = list(texts)
+        if not texts:
+            return cls(ngram_range=ngram_range)
+        vectorizer = TfidfVectorizer(stop_words="english", ngram_range=ngram_range, max_features=max_features)
+        try:
+            vectorizer.fit(texts)
+        except ValueError:
+            # Only stop words in the corpus
+            return cls(ngram_range=ngram_range, documents=len(texts))
+
+        idf = dict(zip(vectorizer.get_feature_names_out().tolist(), vectorizer.idf_.tolist()))
+        # Smoothed IDF of a term that appears in no document, as TfidfVectorizer computes it: ln((1 + n) / (1 + df)) + 1
+        default_idf = math.log(1 + len(texts)) + 1.0
+        return cls(idf, default_idf, ngram_range, len(texts))
+
+    def score(self, text):
+        """{term: tf-idf weight} for the terms of text"""
+        scores = {}
+        for term, count in Counter(self.terms(text)).items():
+            idf = self.idf.get(term)
+            if idf is None:
+                if " " in term:
+                    continue
+                idf = self.default_idf
+            scores[term] = count * idf
+        return scores
+
+    def keywords(self, text, max_keywords=10):
+        """Highest-weighted terms of text that do not share words, in query order.
+
+        Keeping query order lets consecutive keywords be read as a phrase,
+        which is how expand_query combines them.
+        """
+        tokens = self.tokens(text)
+        start = {}
+        for n in range(self.ngram_range[0], self.ngram_range[1] + 1):
+            for i in range(len(tokens) - n + 1):
+                start.setdefault(" ".join(tokens[i:i + n]), i)
+
+        scores = self.score(text)
+        used = set()
+        selected = []
+        for term in sorted(scores, key=lambda term: -scores[term]):
+            words = set(range(start[term], start[term] + term.count(" ") + 1))
+            if words & used:
+                continue
+            used |= words
+            selected.append(term)
+            if len(selected) == max_keywords:
+                break
+        return sorted(selected, key=start.get)
+
+    def save(self, path=KEYWORD_MODEL_FILE):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        tmp_path = f"{path}.tmp"
+        with open(tmp_path, "w") as f:
+            json.dump({
+                "ngram_range": list(self.ngram_range),
+                "documents": self.documents,
+                "default_idf": self.default_idf,
+                "idf": self.idf
+            }, f)
+        os.replace(tmp_path, path)
+
+    @classmethod
+    def load(cls, path=KEYWORD_MODEL_FILE):
+        """Load a saved model, or an unfitted one if none has been saved yet"""
+        if not os.path.exists(path):
+            return cls()
+        with open(path, "r") as f:
+            data = json.load(f)
+        return cls(data["idf"], data["default_idf"], data["ngram_range"], data["documents"])
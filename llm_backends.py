@@ -0,0 +1,83 @@
+import time
+import random
+
+from async_client import transient_http_errors
+
+class LLMBackend:
+    """Interface for chat models that answer a system prompt plus a user message"""
+
+    model_name = "base"
+
+    def generate(self, system_prompt, user_message):
+        """Return the complete response text"""
+        return "".join(self.stream(system_prompt, user_message))
+
+    def stream(self, system_prompt, user_message):
+        """Yield the response text in pieces as it is produced"""
+        raise NotImplementedError
+
+class GeminiLLMBackend(LLMBackend):
+    """Generates responses with Google's Gemini models"""
+
+    def __init__(self, model_name="gemini-2.0-flash"):
+        self.model_name = model_name
+
+    def _model(self, system_prompt):
+        import google.generativeai as genai
+
+        return genai.GenerativeModel(
+            model_name=self.model_name,
+            system_instruction=system_prompt
+        )
+
+    def generate(self, system_prompt, user_message):
+        with transient_http_errors():
+            response = self._model(system_prompt).generate_content(user_message)
+            return response.text
+
+    def stream(self, system_prompt, user_message):
+        with transient_http_errors():
+            response = self._model(system_prompt).generate_content(user_message, stream=True)
+            for chunk in response:
+                # A chunk without parts (safety-blocked output, or a final chunk with only the finish reason)
+                # makes .text raise, so the text is read from the parts directly
+                parts = chunk.parts if len(chunk.candidates) == 1 else []
+                text = "".join(part.text for part in parts)
+                if text:
+                    yield text
+
+class FakeLLMBackend(LLMBackend):
+    """Deterministic offline stand-in for an LLM with configurable latency.
+
+    The answer lists the context chunks it was given, so tests can check what
+    reached the model, and is streamed word by word. With error_rate, a request
+    raises ConnectionError before its first token with that probability; calls
+    counts requests.
+    """
+
+    def __init__(self, first_token_latency=0.0, token_latency=0.0, model_name="local/fake-llm", error_rate=0.0, seed=None):
+        self.first_token_latency = first_token_latency
+        self.token_latency = token_latency
+        self.model_name = model_name
+        self.error_rate = error_rate
+        self._random = random.Random(seed)
+        self.calls = 0
+
+    def _answer(self, user_message):
+        query = user_message.split("\n", 1)[0].replace("Query:", "").strip()
+        chunk_lines = [line for line in user_message.splitlines() if line.startswith("Chunk ")]
+        return (
+            f"### Response\n\nQuery: {query}\n\n"
+            f"Answer based on {len(chunk_lines)} context chunks: {', '.join(line.rstrip(':') for line in chunk_lines)}."
+        )
+
+    def stream(self, system_prompt, user_message):
+        self.calls += 1
+        time.sleep(self.first_token_latency)
+        if self.error_rate and self._random.random() < self.error_rate:
+            raise ConnectionError("injected LLM failure")
+        words = self._answer(user_message).split(" ")
+        for i, word in enumerate(words):
+            if i:
+                time.sleep(self.token_latency)
+            yield word if i == len(words) - 1 else word + " "
@@ -0,0 +1,113 @@
+import re
+
+def default_level_map(digit):
+    """Map a clearance digit found in the text to one of our four levels"""
+    if digit >= 5:
+        return 4  # Map to our highest level
+    if digit >= 3:
+        return 3
+    if digit >= 1:
+        return digit
+    return None
+
+class MetadataExtractor:
+    """Single-pass scanner for chunk security levels and named entities.
+
+    All rules are compiled into one regular expression, so each chunk is
+    lowercased once and scanned once regardless of how many rules exist.
+    Level rules are keywords followed by a digit ("level 3", "clearance 5");
+    the highest mapped level wins. Entity rules are keywords followed by a
+    name ("Operation Eclipse"), collected per kind in order of appearance
+    with their original casing. Keyword patterns are matched against
+    lowercased text, so write them in lowercase.
+    """
+
+    def __init__(self, level_map=default_level_map):
+        self.level_map = level_map
+        self.level_keywords = []
+        self.entity_rules = []  # (kind, keyword pattern, name pattern)
+        self._pattern = None
+        self._unicode_pattern = None
+        self._group_kinds = {}
+
+    @classmethod
+    def default(cls):
+        """Extractor with the rules used for document chunks"""
+        extractor = cls()
+        extractor.add_level_keyword("level")
+        extractor.add_level_keyword("clearance")
+        for keyword in ("operation", "project", "protocol"):
+            extractor.add_entity_rule("operations", keyword)
+        return extractor
+
+    def add_level_keyword(self, pattern):
+        """Treat pattern followed by a digit as a clearance mention"""
+        self.level_keywords.append(pattern)
+        self._pattern = None
+        return self
+
+    def add_entity_rule(self, kind, keyword_pattern, name_pattern=r"\w+"):
+        """Collect the name following keyword_pattern into the entity list for kind"""
+        self.entity_rules.append((kind, keyword_pattern, name_pattern))
+        self._pattern = None
+        return self
+
+    def _compile(self):
+        alternatives = []
+        if self.level_keywords:
+            alternatives.append(r"(?:" + "|".join(self.level_keywords) + r")\s*(?P<level>\d)")
+
+        # Entity rules sharing a kind and name pattern share one group
+        grouped = {}
+        for kind, keyword_pattern, name_pattern in self.entity_rules:
+            grouped.setdefault((kind, name_pattern), []).append(keyword_pattern)
+
+        self._group_kinds = {}
+        for i, ((kind, name_pattern), keywords) in enumerate(grouped.items()):
+            group = f"entity{i}"
+            self._group_kinds[group] = kind
+            # Only the keyword is consumed, so a level mention inside the name is still seen
+            alternatives.append(r"(?:" + "|".join(keywords) + r")\s+(?=(?P<" + group + r">" + name_pattern + r"))")
+
+        pattern = "|".join(alternatives) or r"(?!)"
+        self._pattern = re.compile(pattern)
+        # Lowercasing can change the length of some non-ASCII text, breaking the offsets
+        self._unicode_pattern = re.compile(pattern, re.IGNORECASE)
+
+    def extract(self, text, default_level=1):
+        """Return {"security_level": int, kind: [names], ...} for one chunk of text"""
+        if self._pattern is None:
+            self._compile()
+
+        lowered = text.lower()
+        if len(lowered) == len(text):
+            matches = self._pattern.finditer(lowered)
+        else:
+            matches = self._unicode_pattern.finditer(text)
+
+        result = {"security_level": None}
+        for kind in self._group_kinds.values():
+            result.setdefault(kind, [])
+
+        entity_end = 0
+        for match in matches:
+            digit = match.group("level") if self.level_keywords else None
+            if digit is not None:
+                level = self.level_map(int(digit))
+                if level is not None and (result["security_level"] is None or level > result["security_level"]):
+                    result["security_level"] = level
+                continue
+
+            # Names never overlap: skip keywords that appear inside the previous name
+            if match.start() < entity_end:
+                continue
+            for group, kind in self._group_kinds.items():
+                start, end = match.span(group)
+                if start >= 0:
+                    result[kind].append(text[start:end])
+                    entity_end = end
+                    break
+
+        if result["security_level"] is None:
+            result["security_level"] = default_level
+        return result
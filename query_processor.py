@@ -1,5 +1,9 @@
 import re
-from sklearn.feature_extraction.text import TfidfVectorizer
+
+from entity_matcher import EntityMatcher
+from keyword_model import KeywordModel
+from tracing import traced
+from utils import english_stop_words
 
 class QueryProcessor:
     """Handles query understanding, expansion and mapping"""
@@ -41,13 +45,42 @@ class QueryProcessor:
             "Vortex", "Red Mist", "The Silent Room", "Cipher Delta"
         ]
         
-        # Initialize TF-IDF vectorizer for keyword extraction
-        self.vectorizer = TfidfVectorizer(
-            max_features=10,
-            stop_words='english',
-            ngram_range=(1, 2)
-        )
+        # One automaton for every known entity name, extended with names found in the corpus
+        self.entity_matcher = EntityMatcher()
+        self.entity_matcher.add_many(self.operations, "operations")
+        self.entity_matcher.add_many(self.protocols, "protocols")
+        
+        # TF-IDF weights fitted over the chunk corpus at ingestion, for keyword extraction
+        self.keyword_model = KeywordModel.load()
+    
+    def add_corpus_entities(self, names):
+        """Learn operation names that DocumentProcessor extracted into chunk["operations"]
+        (a ChunkStore's operations table lists each of them once).
+        
+        Only names that look like proper nouns (capitalized or containing a
+        digit, at least two characters, and not a stop word) are kept, so
+        phrases like "the project team" or "Protocol The Silent Room" do not
+        add "team" or "The". The extractor captures one word after
+        "Operation", so a name that is only the first word of a known
+        multi-word name ("Phantom" from "Operation Phantom Veil") is skipped
+        rather than matched on its own. Names already known keep their
+        existing kind. Returns how many names were added.
+        """
+        stop_words = english_stop_words()
+        first_words = {key.split()[0] for key in self.entity_matcher.names if " " in key}
+        added = 0
+        for name in names:
+            if not (name[:1].isupper() or any(ch.isdigit() for ch in name)):
+                continue
+            if len(name) < 2 or name.lower() in stop_words:
+                continue
+            if EntityMatcher.normalize(name) in first_words:
+                continue
+            if name not in self.entity_matcher:
+                added += self.entity_matcher.add(name, "operations")
+        return added
     
+    @traced("analyze_query")
     def analyze_query(self, query):
         """Analyze the query to extract intent, entities, and key terms"""
         analysis = {
@@ -72,44 +105,33 @@ class QueryProcessor:
         elif re.search(r"security|protection|safeguard|risk", query, re.IGNORECASE):
             analysis["intent"] = "security"
         
-        # Detect operations mentioned in query
-        for operation in self.operations:
-            if re.search(r"\b" + re.escape(operation) + r"\b", query, re.IGNORECASE):
-                analysis["entities"]["operations"].append(operation)
-        
-        # Detect protocols mentioned in query
-        for protocol in self.protocols:
-            if re.search(r"\b" + re.escape(protocol) + r"\b", query, re.IGNORECASE):
-                analysis["entities"]["protocols"].append(protocol)
+        # Detect operations and protocols mentioned in query in a single pass
+        entities = self.entity_matcher.entities(query, ["operations", "protocols"])
+        analysis["entities"]["operations"] = entities["operations"]
+        analysis["entities"]["protocols"] = entities["protocols"]
         
         # Detect potential locations
         location_patterns = r"base|facility|compound|safehouse|region|area|zone|sector|building"
         locations = re.findall(r"([A-Za-z]+ (?:" + location_patterns + r"))", query, re.IGNORECASE)
         analysis["entities"]["locations"] = locations
         
-        # Extract key terms using TF-IDF if there's enough text
+        # Extract key terms weighted by corpus TF-IDF if there's enough text
         if len(query.split()) > 3:
-            try:
-                # Prepare the vectorizer with the query
-                self.vectorizer.fit_transform([query])
-                # Get feature names
-                feature_names = self.vectorizer.get_feature_names_out()
-                # Take top features as keywords
-                analysis["keywords"] = feature_names.tolist()
-            except:
-                # Fallback to simple keyword extraction
-                words = query.lower().split()
-                stop_words = ["the", "a", "an", "is", "are", "and", "or", "for", "in", "on", "at", "to"]
-                analysis["keywords"] = [word for word in words if len(word) > 3 and word not in stop_words][:5]
+            analysis["keywords"] = self.keyword_model.keywords(query)
         
         return analysis
     
-    def expand_query(self, query, analysis):
-        """Expand the query based on analysis to improve retrieval"""
+    @traced("expand_query")
+    def expand_query(self, query, analysis, entity_expansions=True):
+        """Expand the query based on analysis to improve retrieval.
+        
+        With entity_expansions=False the per-entity queries are left out, for
+        when chunks about the entities come from the entity graph instead.
+        """
         expanded_queries = [query]  # Always include original query
         
         # Add intent-based expansions
-        for intent_type, template in self.query_templates.items():
+        for intent_type, template in self.query_templates.items() if entity_expansions else ():
             for pattern in template["patterns"]:
                 if pattern in query.lower():
                     # Fill in the template with entities if available
@@ -120,13 +142,14 @@ class QueryProcessor:
                                 expanded_queries.append(template["expansion"].format(entity))
         
         # Add entity-focused queries
-        for operation in analysis["entities"]["operations"]:
-            expanded_queries.append(f"information about {operation}")
-            expanded_queries.append(f"{operation} details")
-        
-        for protocol in analysis["entities"]["protocols"]:
-            expanded_queries.append(f"{protocol} protocol details")
-            expanded_queries.append(f"how to implement {protocol}")
+        if entity_expansions:
+            for operation in analysis["entities"]["operations"]:
+                expanded_queries.append(f"information about {operation}")
+                expanded_queries.append(f"{operation} details")
+            
+            for protocol in analysis["entities"]["protocols"]:
+                expanded_queries.append(f"{protocol} protocol details")
+                expanded_queries.append(f"how to implement {protocol}")
         
         # Add keyword-based expansions using different combinations
         keywords = analysis["keywords"]
@@ -0,0 +1,359 @@
+"""Headless query service: the retrieval and answer pipeline without Streamlit.
+
+Serve it over HTTP on the local machine:
+
+    python query_service.py serve --port 8080 --concurrency 8
+    curl -X POST localhost:8080/query -d '{"query": "Status of Operation Eclipse?", "clearance": 3}'
+
+or answer a JSON-lines file of {"query": ..., "clearance": ...} objects:
+
+    python query_service.py batch queries.jsonl --output answers.jsonl --concurrency 8
+"""
+import sys
+import json
+import time
+import asyncio
+import argparse
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+from corpus_service import CorpusService
+from embedding_engine import EmbeddingEngine
+from response_generator import ResponseGenerator
+from async_client import AsyncClient, EMBEDDING_RATE_LIMIT, LLM_RATE_LIMIT
+from ingest import load_manifest, MANIFEST_PATH
+from retrieval_engine import RETRIEVAL_MODES, FUSION_STRATEGIES
+from security_protocol import SecurityProtocol
+from tracing import tracer, TRACE_FILE
+
+class QueryService:
+    """Async front end to a CorpusService.
+
+    Each request runs analysis and expansion on the event loop and its
+    blocking stages (retrieval with query embedding, then response
+    generation) on a thread pool, with at most max_concurrency requests in
+    flight. While one request waits on the LLM, others can embed their
+    queries or score chunks, so throughput grows with concurrency.
+    """
+
+    def __init__(self, corpus, max_concurrency=8, top_k=5, mode="vector", fusion="max", trace=False):
+        self.corpus = corpus
+        self.max_concurrency = max_concurrency
+        self.top_k = top_k
+        self.mode = mode
+        self.fusion = fusion
+        # Record a trace per request (kept by the tracer and served on /metrics)
+        self.trace = trace
+        # Two threads per request slot: one retrieving or generating, one for the embedding call it may spawn
+        self._executor = ThreadPoolExecutor(max_workers=2 * max_concurrency, thread_name_prefix="query-service")
+        self._semaphore = None
+        self.completed = 0
+        self.failed = 0
+
+    async def _run(self, fn, *args, **kwargs):
+        """Run a blocking call on the service's thread pool, inside the request's trace"""
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self._executor, tracer.propagate(functools.partial(fn, *args, **kwargs)))
+
+    async def load(self, wait=True):
+        """Load the corpus (or reload it if its files changed); wait=False keeps serving during a reload"""
+        await self._run(self.corpus.ensure_loaded, wait=wait)
+        return self
+
+    def _retrieve(self, snapshot, expanded_queries, user_level, top_k, mode, fusion):
+        relevant_chunks, scores = self.corpus.retrieval_engine.retrieve_many(
+            expanded_queries, snapshot.chunks, snapshot.embeddings, top_k=top_k, fusion=fusion,
+            user_level=user_level, security_levels=snapshot.security_levels, mode=mode
+        )
+        # last_mode is per thread, so this is the mode of the call above
+        return relevant_chunks, scores, self.corpus.retrieval_engine.last_mode
+
+    def _generate(self, query, query_analysis, relevant_chunks, user_level, used_mode):
+        corpus = self.corpus
+        # Skip the near-duplicate lookup rather than wait on an embedding backend that just failed
+        query_embedding = corpus.embedding_engine.get_query_embedding(query) if used_mode != "lexical" else None
+        return corpus.response_generator.generate_response(
+            query, query_analysis, relevant_chunks, user_level, query_embedding=query_embedding
+        )
+
+    async def answer(self, query, user_level, top_k=None, mode=None, fusion=None):
+        """Answer one query at a clearance level; returns a JSON-serializable dict"""
+        if self._semaphore is None:
+            self._semaphore = asyncio.Semaphore(self.max_concurrency)
+        top_k = top_k or self.top_k
+        mode = mode or self.mode
+        fusion = fusion or self.fusion
+
+        async with self._semaphore:
+            with tracer.trace("query", enabled=self.trace, user_level=user_level):
+                start = time.perf_counter()
+                result = {"query": query, "clearance": user_level}
+                try:
+                    await self.load(wait=False)
+                    # One version of the corpus for the whole request, even if a reload publishes another
+                    snapshot = self.corpus.snapshot
+                    processor = self.corpus.query_processor
+                    query_analysis = processor.analyze_query(query)
+                    expanded_queries = processor.expand_query(query, query_analysis)
+
+                    with tracer.span("check_clearance"):
+                        has_access = snapshot.has_access(user_level)
+                    if not has_access:
+                        result["error"] = "Access Denied — Clearance Insufficient."
+                        return result
+
+                    relevant_chunks, scores, used_mode = await self._run(
+                        self._retrieve, snapshot, expanded_queries, user_level, top_k, mode, fusion
+                    )
+                    relevant_chunks = [
+                        dict(chunk, similarity_score=scores[chunk["id"]]) for chunk in relevant_chunks
+                    ]
+                    response = await self._run(
+                        self._generate, query, query_analysis, relevant_chunks, user_level, used_mode
+                    )
+
+                    result.update(
+                        response=response,
+                        mode=used_mode,
+                        chunks=[
+                            {
+                                "id": chunk["id"],
+                                "document": chunk["document"],
+                                "section": chunk["section"],
+                                "security_level": chunk["security_level"],
+                                "score": chunk["similarity_score"]
+                            }
+                            for chunk in relevant_chunks
+                        ]
+                    )
+                    self.completed += 1
+                except Exception as e:
+                    result["error"] = f"{type(e).__name__}: {e}"
+                    self.failed += 1
+                finally:
+                    result["seconds"] = time.perf_counter() - start
+                return result
+
+    async def answer_many(self, requests):
+        """Yield (position, result) for (query, clearance) pairs as they complete"""
+        async def run(position, query, user_level):
+            return position, await self.answer(query, user_level)
+
+        tasks = [asyncio.ensure_future(run(i, query, level)) for i, (query, level) in enumerate(requests)]
+        for task in asyncio.as_completed(tasks):
+            yield await task
+
+    def stats(self):
+        return {
+            "completed": self.completed,
+            "failed": self.failed,
+            "max_concurrency": self.max_concurrency,
+            "chunks": len(self.corpus.chunks),
+            "unembedded_chunks": len(self.corpus.unembedded_chunks),
+            "embedding_client": self.corpus.embedding_engine.client.stats(),
+            "llm_client": self.corpus.response_generator.client.stats()
+        }
+
+    def close(self):
+        self._executor.shutdown(wait=False)
+
+# Largest top_k a request may ask for
+MAX_TOP_K = 50
+
+def parse_request(payload):
+    """(query, clearance) from a request object, raising ValueError if either is missing or invalid"""
+    if not isinstance(payload, dict):
+        raise ValueError("request must be a JSON object")
+    query = payload.get("query")
+    if not isinstance(query, str) or not query.strip():
+        raise ValueError("'query' must be a non-empty string")
+    try:
+        user_level = int(payload.get("clearance", payload.get("user_level")))
+    except (TypeError, ValueError):
+        raise ValueError("'clearance' must be an integer clearance level")
+    if not 1 <= user_level <= SecurityProtocol.MAX_CLEARANCE:
+        raise ValueError(f"'clearance' must be between 1 and {SecurityProtocol.MAX_CLEARANCE}")
+    return query, user_level
+
+def parse_options(payload):
+    """The optional top_k, mode and fusion of a request object, raising ValueError if any is invalid"""
+    options = {key: payload[key] for key in ("top_k", "mode", "fusion") if key in payload}
+    top_k = options.get("top_k", 1)
+    if isinstance(top_k, bool) or not isinstance(top_k, int) or not 1 <= top_k <= MAX_TOP_K:
+        raise ValueError(f"'top_k' must be an integer between 1 and {MAX_TOP_K}")
+    if options.get("mode", "vector") not in RETRIEVAL_MODES:
+        raise ValueError(f"'mode' must be one of {sorted(RETRIEVAL_MODES)}")
+    if options.get("fusion", "max") not in FUSION_STRATEGIES:
+        raise ValueError(f"'fusion' must be one of {sorted(FUSION_STRATEGIES)}")
+    return options
+
+def make_handler(service, loop):
+    """Request handler class bound to a service whose coroutines run on loop"""
+
+    class QueryHandler(BaseHTTPRequestHandler):
+        def _send(self, status, body, content_type="application/json"):
+            data = (json.dumps(body) if content_type == "application/json" else body).encode("utf-8")
+            self.send_response(status)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Content-Length", str(len(data)))
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path == "/health":
+                self._send(200, dict(service.stats(), status="ok"))
+            elif self.path == "/metrics":
+                self._send(200, tracer.prometheus_text(), "text/plain; version=0.0.4")
+            else:
+                self._send(404, {"error": "not found"})
+
+        def do_POST(self):
+            if self.path != "/query":
+                self._send(404, {"error": "not found"})
+                return
+            try:
+                length = int(self.headers.get("Content-Length", 0))
+                payload = json.loads(self.rfile.read(length) or b"{}")
+                query, user_level = parse_request(payload)
+                options = parse_options(payload)
+            except ValueError as e:
+                self._send(400, {"error": str(e)})
+                return
+
+            result = asyncio.run_coroutine_threadsafe(service.answer(query, user_level, **options), loop).result()
+            if "error" in result and "response" not in result:
+                status = 403 if result["error"].startswith("Access Denied") else 500
+            else:
+                status = 200
+            self._send(status, result)
+
+        def log_message(self, format, *args):
+            sys.stderr.write(f"{self.address_string()} {format % args}\n")
+
+    return QueryHandler
+
+def serve(service, host="127.0.0.1", port=8080):
+    """Serve POST /query, GET /health and GET /metrics until interrupted"""
+    # The service's coroutines run on one event loop; HTTP handler threads submit to it
+    loop = asyncio.new_event_loop()
+    threading.Thread(target=loop.run_forever, daemon=True).start()
+    asyncio.run_coroutine_threadsafe(service.load(), loop).result()
+
+    server = ThreadingHTTPServer((host, port), make_handler(service, loop))
+    print(f"Serving {len(service.corpus.chunks)} chunks on http://{host}:{port} "
+          f"(concurrency {service.max_concurrency})", file=sys.stderr)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        loop.call_soon_threadsafe(loop.stop)
+        service.close()
+
+async def run_batch(service, input_file, output_file, progress=None):
+    """Answer every line of input_file, writing results to output_file in input order"""
+    requests, results = [], {}
+    for line_number, line in enumerate(input_file, start=1):
+        if not line.strip():
+            continue
+        try:
+            requests.append(parse_request(json.loads(line)))
+        except ValueError as e:
+            # Keep the line's place in the output so results stay aligned with the input
+            requests.append(None)
+            results[len(requests) - 1] = {"line": line_number, "error": str(e)}
+
+    await service.load()
+    valid = [(i, request) for i, request in enumerate(requests) if request is not None]
+    next_position, done = 0, len(requests) - len(valid)
+    async for position, result in service.answer_many([request for _, request in valid]):
+        results[valid[position][0]] = result
+        done += 1
+        if progress:
+            progress(done, len(requests))
+        # Write every result whose predecessors are all done
+        while next_position in results:
+            output_file.write(json.dumps(results.pop(next_position)) + "\n")
+            next_position += 1
+    while next_position in results:
+        output_file.write(json.dumps(results.pop(next_position)) + "\n")
+        next_position += 1
+    return len(requests)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Headless Project SHADOW query service")
+    parser.add_argument("--manifest", default=MANIFEST_PATH, help="corpus manifest (default: corpus.json)")
+    parser.add_argument("--concurrency", type=int, default=8, help="requests processed at once")
+    parser.add_argument("--embedding-rate", type=float, default=EMBEDDING_RATE_LIMIT,
+                        help="embedding requests per second (0 = unlimited)")
+    parser.add_argument("--llm-rate", type=float, default=LLM_RATE_LIMIT, help="LLM requests per second (0 = unlimited)")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--mode", choices=sorted(RETRIEVAL_MODES), default="vector")
+    parser.add_argument("--fusion", choices=sorted(FUSION_STRATEGIES), default="max")
+    parser.add_argument("--trace", action="store_true", help=f"record per-stage traces to {TRACE_FILE}")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    serve_parser = commands.add_parser("serve", help="serve queries over HTTP")
+    serve_parser.add_argument("--host", default="127.0.0.1")
+    serve_parser.add_argument("--port", type=int, default=8080)
+
+    batch_parser = commands.add_parser("batch", help="answer a JSON-lines file of {query, clearance} objects")
+    batch_parser.add_argument("input", help="input .jsonl file, or - for stdin")
+    batch_parser.add_argument("--output", help="output .jsonl file (default: stdout)")
+    args = parser.parse_args(argv)
+
+    from utils import setup_environment, setup_directories
+    if not setup_environment():
+        print("Google API Key not found. Please add your GOOGLE_API_KEY to the .env file.", file=sys.stderr)
+        return 1
+    setup_directories()
+
+    if args.trace:
+        tracer.jsonl_path = TRACE_FILE
+    # Backend calls of all in-flight requests share one client per service, sized to the concurrency
+    corpus = CorpusService(
+        load_manifest(args.manifest),
+        embedding_engine=EmbeddingEngine(
+            client=AsyncClient("embedding", rate=args.embedding_rate or None, max_concurrency=args.concurrency)
+        ),
+        response_generator=ResponseGenerator(
+            client=AsyncClient("llm", rate=args.llm_rate or None, max_concurrency=args.concurrency)
+        )
+    )
+    service = QueryService(
+        corpus,
+        max_concurrency=args.concurrency,
+        top_k=args.top_k,
+        mode=args.mode,
+        fusion=args.fusion,
+        trace=args.trace
+    )
+
+    if args.command == "serve":
+        serve(service, args.host, args.port)
+        return 0
+
+    def report(done, total):
+        print(f"\r{done}/{total} answered", end="", file=sys.stderr, flush=True)
+
+    input_file = sys.stdin if args.input == "-" else open(args.input)
+    output_file = open(args.output, "w") if args.output else sys.stdout
+    start = time.perf_counter()
+    try:
+        count = asyncio.run(run_batch(service, input_file, output_file, progress=report))
+    finally:
+        if input_file is not sys.stdin:
+            input_file.close()
+        if output_file is not sys.stdout:
+            output_file.close()
+        service.close()
+    elapsed = time.perf_counter() - start
+    print(f"\n{count} queries in {elapsed:.1f}s ({count / elapsed if elapsed else 0.0:.1f} queries/s), "
+          f"{service.failed} failed", file=sys.stderr)
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
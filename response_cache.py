@@ -0,0 +1,180 @@
+import time
+import hashlib
+import threading
+from collections import OrderedDict
+import numpy as np
+
+from embedding_cache import QueryEmbeddingCache
+
+class ResponseCache:
+    """LRU cache of generated responses keyed on everything that shapes the answer.
+
+    The key covers the model, clearance level, normalized query and the ids
+    and content hashes of the retrieved chunks, so a changed chunk can never
+    serve a stale answer. When a chunk id is seen with new content, every
+    cached response built from it is dropped. With similarity_threshold set,
+    a query whose embedding is at least that similar to a cached query with
+    the same model, clearance and chunks counts as a hit as well.
+    """
+
+    def __init__(self, max_entries=256, ttl=3600, similarity_threshold=None):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self.similarity_threshold = similarity_threshold
+        self.hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self.invalidations = 0
+        # key -> entry dict
+        self._entries = OrderedDict()
+        # context key -> keys of entries sharing model, clearance and chunks
+        self._by_context = {}
+        # chunk id -> keys of entries built from it
+        self._by_chunk = {}
+        # chunk id -> content hash last seen
+        self._chunk_hashes = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def content_hash(text):
+        return hashlib.sha1(text.encode("utf-8")).hexdigest()
+
+    def _context_key(self, model_name, user_level, chunk_hashes):
+        fingerprint = "|".join(f"{chunk_id}:{digest}" for chunk_id, digest in sorted(chunk_hashes.items()))
+        return hashlib.sha256(f"{model_name}\0{user_level}\0{fingerprint}".encode("utf-8")).hexdigest()
+
+    def _prepare(self, model_name, user_level, query, chunks):
+        """Compute (key, context key, chunk hashes) and drop entries made stale by changed chunks"""
+        chunk_hashes = {chunk["id"]: self.content_hash(chunk["text"]) for chunk in chunks}
+        changed = [
+            chunk_id for chunk_id, digest in chunk_hashes.items()
+            if self._chunk_hashes.get(chunk_id, digest) != digest
+        ]
+        if changed:
+            self._invalidate(changed)
+        self._chunk_hashes.update(chunk_hashes)
+
+        context_key = self._context_key(model_name, user_level, chunk_hashes)
+        normalized = QueryEmbeddingCache.normalize(query)
+        key = hashlib.sha256(f"{context_key}\0{normalized}".encode("utf-8")).hexdigest()
+        return key, context_key, chunk_hashes
+
+    def _expired(self, entry, now):
+        return self.ttl is not None and now - entry["created"] > self.ttl
+
+    def get(self, model_name, user_level, query, chunks, query_embedding=None):
+        """Return a cached response for this request, or None"""
+        now = time.time()
+        with self._lock:
+            key, context_key, _ = self._prepare(model_name, user_level, query, chunks)
+
+            entry = self._entries.get(key)
+            if entry is not None and self._expired(entry, now):
+                self._remove(key)
+                entry = None
+            if entry is not None:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry["response"]
+
+            if self.similarity_threshold is not None and query_embedding is not None:
+                near_key = self._find_near_duplicate(context_key, query_embedding, now)
+                if near_key is not None:
+                    self._entries.move_to_end(near_key)
+                    self.near_hits += 1
+                    return self._entries[near_key]["response"]
+
+            self.misses += 1
+            return None
+
+    def _find_near_duplicate(self, context_key, query_embedding, now):
+        """Key of the most similar cached query above the threshold for the same context"""
+        query = np.asarray(query_embedding, dtype=np.float32)
+        norm = np.linalg.norm(query)
+        if norm == 0:
+            return None
+        query = query / norm
+
+        best_key, best_score = None, self.similarity_threshold
+        for key in list(self._by_context.get(context_key, ())):
+            entry = self._entries[key]
+            if self._expired(entry, now):
+                self._remove(key)
+                continue
+            if entry["embedding"] is None:
+                continue
+            score = float(entry["embedding"] @ query)
+            if score >= best_score:
+                best_key, best_score = key, score
+        return best_key
+
+    def put(self, model_name, user_level, query, chunks, response, query_embedding=None):
+        """Cache a generated response"""
+        embedding = None
+        if query_embedding is not None:
+            embedding = np.asarray(query_embedding, dtype=np.float32)
+            norm = np.linalg.norm(embedding)
+            embedding = embedding / norm if norm else None
+
+        with self._lock:
+            key, context_key, chunk_hashes = self._prepare(model_name, user_level, query, chunks)
+            if key in self._entries:
+                self._remove(key)
+            self._entries[key] = {
+                "response": response,
+                "created": time.time(),
+                "embedding": embedding,
+                "context": context_key,
+                "chunks": list(chunk_hashes)
+            }
+            self._by_context.setdefault(context_key, set()).add(key)
+            for chunk_id in chunk_hashes:
+                self._by_chunk.setdefault(chunk_id, set()).add(key)
+
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, key):
+        """Drop an entry and its secondary index references"""
+        entry = self._entries.pop(key)
+        keys = self._by_context.get(entry["context"])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_context[entry["context"]]
+        for chunk_id in entry["chunks"]:
+            keys = self._by_chunk.get(chunk_id)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._by_chunk[chunk_id]
+
+    def _invalidate(self, chunk_ids):
+        for chunk_id in chunk_ids:
+            for key in list(self._by_chunk.get(chunk_id, ())):
+                self._remove(key)
+                self.invalidations += 1
+
+    def invalidate_chunks(self, chunk_ids):
+        """Drop every cached response built from any of the given chunks"""
+        with self._lock:
+            self._invalidate(chunk_ids)
+            for chunk_id in chunk_ids:
+                self._chunk_hashes.pop(chunk_id, None)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._entries)
+
+    def stats(self):
+        """Hit/miss counters and current size"""
+        lookups = self.hits + self.near_hits + self.misses
+        return {
+            "hits": self.hits,
+            "near_duplicate_hits": self.near_hits,
+            "misses": self.misses,
+            "hit_rate": (self.hits + self.near_hits) / lookups if lookups else 0.0,
+            "invalidations": self.invalidations,
+            "entries": len(self),
+            "max_entries": self.max_entries
+        }
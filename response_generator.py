@@ -1,27 +1,51 @@
-import google.generativeai as genai
-import streamlit as st
+import time
+import itertools
+import threading
+
+from response_cache import ResponseCache
+from llm_backends import GeminiLLMBackend
+from async_client import AsyncClient, shared_llm_client
+from tracing import tracer
+from utils import report_error
+
+# Responses are cached per process, so repeated requests skip the LLM across reruns
+shared_response_cache = ResponseCache()
 
 class ResponseGenerator:
     """Generates final responses using LLM"""
     
-    def __init__(self, model_name="gemini-2.0-flash"):
-        self.model_name = model_name
+    def __init__(self, model_name="gemini-2.0-flash", cache=None, backend=None, client=None):
+        # The backend produces the text; default to Gemini
+        self.backend = backend or GeminiLLMBackend(model_name)
+        self.model_name = self.backend.model_name
+        self.cache = cache if cache is not None else shared_response_cache
+        # Rate limiting, retries and deduplication of LLM requests
+        self.client = client if client is not None else shared_llm_client
+        # Timings of the most recent streamed response, per thread
+        self._local = threading.local()
+
+    @property
+    def last_timings(self):
+        return getattr(self._local, "last_timings", {})
+
+    @last_timings.setter
+    def last_timings(self, timings):
+        self._local.last_timings = timings
     
-    def generate_response(self, query, query_analysis, relevant_chunks, user_level):
-        """Generate a comprehensive response using Gemini"""
-        try:
-            # Format the context from relevant chunks
-            context = ""
-            for i, chunk in enumerate(relevant_chunks):
-                context += f"\nChunk {i+1}:\n{chunk['text']}\n"
-            
-            # Detect entities from the query analysis
-            entities = []
-            for entity_type, entity_list in query_analysis["entities"].items():
-                entities.extend(entity_list)
-            
-            # Construct system prompt with security context
-            system_prompt = f"""You are Project SHADOW's Intelligence Retrieval Assistant powered by Google's AI.
+    def build_prompts(self, query, query_analysis, relevant_chunks, user_level):
+        """Build the (system prompt, user message) pair sent to the LLM"""
+        # Format the context from relevant chunks
+        context = ""
+        for i, chunk in enumerate(relevant_chunks):
+            context += f"\nChunk {i+1}:\n{chunk['text']}\n"
+        
+        # Detect entities from the query analysis
+        entities = []
+        for entity_type, entity_list in query_analysis["entities"].items():
+            entities.extend(entity_list)
+        
+        # Construct system prompt with security context
+        system_prompt = f"""You are Project SHADOW's Intelligence Retrieval Assistant powered by Google's AI.
 You are assisting an intelligence officer with clearance level {user_level}.
             
 Only provide information that is appropriate for this clearance level.
@@ -32,26 +56,104 @@ acknowledge this without making up details. Provide factual, direct answers.
             
 Format your responses in a clear, structured manner using markdown.
 If relevant, organize information into sections with headings."""
-            
-            # Construct the user message that includes context and query
-            user_message = f"""Query: {query}
+        
+        # Construct the user message that includes context and query
+        user_message = f"""Query: {query}
             
 Context information:
 {context}
             
 Based on the context information above, please provide a comprehensive response to my query.
 If the information in the context is not sufficient, please indicate this clearly."""
+        
+        return system_prompt, user_message
+    
+    def generate_response(self, query, query_analysis, relevant_chunks, user_level, query_embedding=None):
+        """Generate a comprehensive response using Gemini.
+
+        Identical requests (same model, clearance, query and retrieved chunks) are
+        answered from the response cache; query_embedding enables near-duplicate
+        matching when the cache has a similarity threshold.
+        """
+        with tracer.span("generate_response", chunks=len(relevant_chunks)) as span:
+            cached = self.cache.get(self.model_name, user_level, query, relevant_chunks, query_embedding)
+            span.set(cache_hits=int(cached is not None))
+            if cached is not None:
+                return cached
+
+            try:
+                system_prompt, user_message = self.build_prompts(query, query_analysis, relevant_chunks, user_level)
+                
+                # Generate the response
+                with tracer.span("llm_request", prompt_bytes=len(system_prompt.encode()) + len(user_message.encode())) as request:
+                    response = self.client.call(
+                        self.backend.generate, system_prompt, user_message,
+                        key=AsyncClient.make_key(self.model_name, system_prompt, user_message)
+                    )
+                    request.set(response_bytes=len(response.encode()))
+                
+                if response:
+                    self.cache.put(self.model_name, user_level, query, relevant_chunks, response, query_embedding)
+                return response
+            except Exception as e:
+                span.set(error=type(e).__name__)
+                report_error(f"Error generating response: {str(e)}")
+                return f"I encountered an error while generating a response: {str(e)}"
+    
+    def _open_stream(self, system_prompt, user_message):
+        """Start a streamed response and wait for its first piece, so failures before any output are retried"""
+        pieces = iter(self.backend.stream(system_prompt, user_message))
+        first = next(pieces, None)
+        return ([] if first is None else [first]), pieces
+
+    def generate_response_stream(self, query, query_analysis, relevant_chunks, user_level, query_embedding=None):
+        """Yield the response text in pieces as the LLM produces it.
+
+        Time to first token and total time are recorded in last_timings. A cached
+        response is yielded in one piece; only a complete, non-empty stream is cached.
+        """
+        start = time.perf_counter()
+        self.last_timings = {"cached": False}
+
+        cached = self.cache.get(self.model_name, user_level, query, relevant_chunks, query_embedding)
+        if cached is not None:
+            elapsed = time.perf_counter() - start
+            self.last_timings.update(cached=True, time_to_first_token=elapsed, total_time=elapsed)
+            tracer.record("generate_response", elapsed, chunks=len(relevant_chunks), cache_hits=1)
+            yield cached
+            return
+
+        pieces = []
+        prompt_bytes = 0
+        try:
+            system_prompt, user_message = self.build_prompts(query, query_analysis, relevant_chunks, user_level)
+            prompt_bytes = len(system_prompt.encode()) + len(user_message.encode())
             
-            # Create the Gemini model
-            model = genai.GenerativeModel(
-                model_name=self.model_name,
-                system_instruction=system_prompt
-            )
-            
-            # Generate the response
-            response = model.generate_content(user_message)
+            # Only opening the stream goes through the client; a stream cannot be retried once text was shown
+            first, rest = self.client.call(self._open_stream, system_prompt, user_message)
+            for piece in itertools.chain(first, rest):
+                if not pieces:
+                    self.last_timings["time_to_first_token"] = time.perf_counter() - start
+                pieces.append(piece)
+                yield piece
             
-            return response.text
+            # Reached only when the stream ran to its end: a failed stream raises and an abandoned one
+            # exits at the yield, so neither leaves a partial answer in the cache
+            response = "".join(pieces)
+            if response:
+                self.cache.put(self.model_name, user_level, query, relevant_chunks, response, query_embedding)
         except Exception as e:
-            st.error(f"Error generating response: {str(e)}")
-            return f"I encountered an error while generating a response: {str(e)}"
+            report_error(f"Error generating response: {str(e)}")
+            yield f"I encountered an error while generating a response: {str(e)}"
+        finally:
+            self.last_timings["total_time"] = time.perf_counter() - start
+            # The stream spans the caller's work between pieces, so it is recorded as one finished span
+            tracer.record(
+                "generate_response",
+                self.last_timings["total_time"],
+                chunks=len(relevant_chunks),
+                cache_hits=0,
+                prompt_bytes=prompt_bytes,
+                response_bytes=sum(len(piece.encode()) for piece in pieces),
+                time_to_first_token_ms=self.last_timings.get("time_to_first_token", 0.0) * 1000.0
+            )
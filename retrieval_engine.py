@@ -1,58 +1,446 @@
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor, TimeoutError
 import numpy as np
 
+from vector_index import VectorIndex, normalize_rows, top_k_indices
+from ann_index import IVFIndex
+from bm25_index import BM25Index, BM25_INDEX_FILE
+from security_protocol import SecurityProtocol
+from tracing import tracer, traced
+
+def fuse_max_score(result_lists):
+    """Keep each chunk's best similarity across all queries"""
+    fused = {}
+    for results in result_lists:
+        for chunk_id, score in results:
+            if chunk_id not in fused or score > fused[chunk_id]:
+                fused[chunk_id] = score
+    return fused
+
+def fuse_reciprocal_rank(result_lists, k=60):
+    """Reciprocal rank fusion: sum of 1 / (k + rank) over the queries that returned a chunk"""
+    fused = {}
+    for results in result_lists:
+        for rank, (chunk_id, _) in enumerate(results, start=1):
+            fused[chunk_id] = fused.get(chunk_id, 0.0) + 1.0 / (k + rank)
+    return fused
+
+FUSION_STRATEGIES = {
+    "max": fuse_max_score,
+    "rrf": fuse_reciprocal_rank
+}
+
+# "vector": embedding similarity; "lexical": BM25 only; "hybrid": both, fused per query
+RETRIEVAL_MODES = {"vector", "lexical", "hybrid"}
+
+# Snapshots kept for lookup, so a query still holding the previous corpus version finds its indexes
+RECENT_SNAPSHOTS = 2
+
+class RetrievalSnapshot:
+    """One version of the corpus as queries see it.
+
+    Holds the ChunkStore, the {chunk_id: embedding} dict with the content
+    hash of each embedding where known, and the security level column, plus
+    the vector indexes (one per index type a caller asked for) and the BM25
+    index built over them, with row masks aligned to each index. A snapshot
+    is never modified once published: reloading the corpus or building
+    another index type makes a new one, so a query that reads a snapshot
+    once keeps a consistent view.
+    """
+
+    def __init__(self, chunks, embeddings, security_levels=None, vectors=None, lexical=None, clearance_masks=None,
+                 embedding_hashes=None):
+        self.chunks = chunks
+        self.embeddings = embeddings
+        self.embedding_hashes = embedding_hashes or {}
+        self.security_levels = chunks.security_levels if security_levels is None else security_levels
+        # Per-clearance masks over the chunks, for has_access
+        self.clearance_masks = (SecurityProtocol.build_clearance_masks(self.security_levels)
+                                if clearance_masks is None else clearance_masks)
+        # index_type -> (index, present_mask, clearance_masks), for the types built so far
+        self.vectors = dict(vectors or {})
+        # (BM25 index, present_mask, clearance_masks), once built
+        self.lexical = lexical
+
+    def matches(self, chunks, embeddings, security_levels):
+        return self.chunks is chunks and self.embeddings is embeddings and self.security_levels is security_levels
+
+    def has_access(self, user_level):
+        """Whether any chunk is visible at this clearance level"""
+        return bool(SecurityProtocol.clearance_mask(self.clearance_masks, user_level).any())
+
 class RetrievalEngine:
     """Handles retrieval of relevant chunks based on query"""
-    
-    def __init__(self, embedding_engine):
+
+    def __init__(self, embedding_engine, index_type="exact", nprobe=8, index_path="data/chunks/ann_index.npz",
+                 lexical_index_path=BM25_INDEX_FILE, hybrid_weight=0.5, embedding_timeout=None):
         self.embedding_engine = embedding_engine
-    
+        # Defaults for retrieve_many; "exact" scores every chunk, "ivf" uses the approximate inverted-file index
+        self.index_type = index_type
+        self.nprobe = nprobe
+        self.index_path = index_path
+        self.lexical_index_path = lexical_index_path
+        # Latest IVF and BM25 indexes, the starting point for the next snapshot's incremental update
+        self.ann_index = None
+        self.lexical_index = None
+        # Recently published snapshots, newest first; replaced as a whole, never modified
+        self._snapshots = ()
+        self._build_lock = threading.Lock()
+        # Weight of the cosine score in hybrid mode; BM25 gets the rest
+        self.hybrid_weight = hybrid_weight
+        # Seconds to wait for query embeddings before answering from the lexical index alone
+        self.embedding_timeout = embedding_timeout
+        self._embedding_executor = None
+        # Mode actually used by the last retrieve_many call ("lexical" after a fallback), per thread
+        self._local = threading.local()
+
+    @property
+    def last_mode(self):
+        return getattr(self._local, "last_mode", None)
+
+    @last_mode.setter
+    def last_mode(self, mode):
+        self._local.last_mode = mode
+
     def vector_similarity(self, v1, v2):
         """Compute cosine similarity between two vectors"""
         dot_product = np.dot(v1, v2)
         norm_v1 = np.linalg.norm(v1)
         norm_v2 = np.linalg.norm(v2)
-        
+
         # Handle zero vectors to avoid division by zero
         if norm_v1 == 0 or norm_v2 == 0:
             return 0
-            
+
         return dot_product / (norm_v1 * norm_v2)
-    
-    def retrieve_relevant_chunks(self, query, all_chunks, document_embeddings, top_k=5):
-        """Retrieve top-k relevant chunks using embedding similarity"""
+
+    @property
+    def snapshot(self):
+        """The most recently published snapshot, or None"""
+        return self._snapshots[0] if self._snapshots else None
+
+    def _find_snapshot(self, all_chunks, document_embeddings, security_levels):
+        for snapshot in self._snapshots:
+            if snapshot.matches(all_chunks, document_embeddings, security_levels):
+                return snapshot
+        return None
+
+    @staticmethod
+    def _is_complete(snapshot, vector, lexical, index_type):
+        return (not vector or index_type in snapshot.vectors) and (not lexical or snapshot.lexical is not None)
+
+    def prepare(self, all_chunks, document_embeddings, security_levels=None, changed_ids=(), vector=True, lexical=True,
+                embedding_hashes=None, index_type=None):
+        """The snapshot of all_chunks (a ChunkStore) and document_embeddings, with the indexes it needs.
+
+        A published snapshot for the same objects is reused; missing indexes
+        are built off to the side and published in a new snapshot with one
+        assignment, so queries on other threads never see an index being
+        updated. vector and lexical select the indexes to build, and
+        index_type ("exact" or "ivf", default the engine's) the vector index;
+        a snapshot keeps every index type built for it.
+        changed_ids names chunks whose embeddings changed since the previous
+        snapshot, and embedding_hashes ({chunk_id: content hash}, as in
+        EmbeddingEngine.last_hashes) identifies every embedding; the
+        persistent IVF index re-inserts changed chunks and rows whose saved
+        hash differs, and drops chunks that are gone, instead of being
+        rebuilt. The BM25 index adds new and drops removed chunks;
+        ingest_corpus already re-indexed edited ones.
+        """
+        if security_levels is None:
+            security_levels = all_chunks.security_levels
+        index_type = index_type or self.index_type
+        snapshot = self._find_snapshot(all_chunks, document_embeddings, security_levels)
+        if snapshot is not None and self._is_complete(snapshot, vector, lexical, index_type):
+            return snapshot
+
+        with self._build_lock:
+            previous = self._find_snapshot(all_chunks, document_embeddings, security_levels)
+            if previous is not None and self._is_complete(previous, vector, lexical, index_type):
+                return previous
+            if previous is None:
+                previous = RetrievalSnapshot(all_chunks, document_embeddings, security_levels,
+                                             embedding_hashes=embedding_hashes)
+
+            vectors = previous.vectors
+            if vector and index_type not in vectors:
+                vectors = dict(vectors)
+                vectors[index_type] = self._build_vector(previous, changed_ids, index_type)
+            lexical_state = previous.lexical
+            if lexical and lexical_state is None:
+                lexical_state = self._build_lexical(all_chunks, security_levels)
+
+            snapshot = RetrievalSnapshot(all_chunks, document_embeddings, security_levels, vectors,
+                                         lexical_state, previous.clearance_masks, previous.embedding_hashes)
+            others = tuple(other for other in self._snapshots if other is not previous)
+            self._snapshots = ((snapshot,) + others)[:RECENT_SNAPSHOTS]
+        return snapshot
+
+    def _build_vector(self, snapshot, changed_ids, index_type):
+        """(index, present_mask, clearance_masks) of one index type over a snapshot's embeddings"""
+        if index_type == "ivf":
+            index = self._update_ann_index(snapshot.embeddings, changed_ids, snapshot.embedding_hashes)
+        else:
+            index = VectorIndex.from_embeddings(snapshot.embeddings)
+        present_mask, clearance_masks = self._row_masks(index, snapshot.chunks, snapshot.security_levels)
+        return index, present_mask, clearance_masks
+
+    def _update_ann_index(self, document_embeddings, changed_ids=(), embedding_hashes=None):
+        """The persisted IVF index brought in line with document_embeddings, without modifying one in use"""
+        index = self.ann_index
+        if index is None:
+            if self.index_path and os.path.exists(self.index_path):
+                index = IVFIndex.load(self.index_path, nprobe=self.nprobe)
+            else:
+                index = IVFIndex(nprobe=self.nprobe)
+
+        # Drop chunks that no longer exist, then insert new, changed and stale ones incrementally;
+        # chunk ids are positional, so an id that is still present may now hold different text
+        embedding_hashes = embedding_hashes or {}
+        removals = [chunk_id for chunk_id in index.ids if chunk_id not in document_embeddings]
+        changed = set(changed_ids).union(index.stale_ids(embedding_hashes))
+        update_ids = [
+            chunk_id for chunk_id in document_embeddings
+            if chunk_id not in index or chunk_id in changed
+        ]
+        if removals or update_ids:
+            # Searches may still be running on the current index, so the changes go to a copy
+            index = index.copy() if index is self.ann_index else index
+            index.remove(removals)
+            if update_ids:
+                index.add(update_ids, [document_embeddings[chunk_id] for chunk_id in update_ids],
+                          [embedding_hashes.get(chunk_id) for chunk_id in update_ids])
+            if self.index_path:
+                index.save(self.index_path)
+        self.ann_index = index
+        return index
+
+    def _build_lexical(self, all_chunks, security_levels):
+        """(BM25 index, present_mask, clearance_masks) for a new snapshot"""
+        index = self.lexical_index
+        if index is None:
+            if self.lexical_index_path and os.path.exists(self.lexical_index_path):
+                index = BM25Index.load(self.lexical_index_path)
+            else:
+                index = BM25Index()
+        synced = index.synced(all_chunks)
+        if synced is not index and self.lexical_index_path:
+            synced.save(self.lexical_index_path)
+        self.lexical_index = synced
+        present_mask, clearance_masks = self._row_masks(synced, all_chunks, security_levels)
+        return synced, present_mask, clearance_masks
+
+    @staticmethod
+    def _row_masks(index, all_chunks, security_levels):
+        """Mask of index rows present in all_chunks, and per-clearance masks aligned with the index rows.
+
+        Rows without a chunk are never allowed.
+        """
+        present_mask = index.row_mask(all_chunks.ids)
+        row_levels = np.full(len(index.ids), SecurityProtocol.UNREADABLE_LEVEL, dtype=np.int8)
+        chunk_positions = all_chunks.rows(index.ids)
+        present = chunk_positions >= 0
+        row_levels[present] = np.asarray(security_levels)[chunk_positions[present]]
+        return present_mask, SecurityProtocol.build_clearance_masks(row_levels)
+
+    @staticmethod
+    def _mask(state, user_level):
+        """Rows a query may return from a snapshot index: its chunks, limited by clearance if user_level is set"""
+        present_mask, clearance_masks = state[-2:]
+        if user_level is None:
+            return present_mask
+        return SecurityProtocol.clearance_mask(clearance_masks, user_level)
+
+    def _embed_queries(self, queries, timeout):
+        """Query embeddings, or Nones if the backend fails or takes longer than timeout seconds"""
+        if timeout is None:
+            return self.embedding_engine.embed_queries(queries)
+        if self._embedding_executor is None:
+            self._embedding_executor = ThreadPoolExecutor(max_workers=2)
+        future = self._embedding_executor.submit(tracer.propagate(self.embedding_engine.embed_queries), queries)
+        try:
+            return future.result(timeout=timeout)
+        except TimeoutError:
+            tracer.current_span().set(embedding_timeout=True)
+            return [None] * len(queries)
+
+    @staticmethod
+    def _vector_search(index, query_embeddings, top_k, mask, nprobe):
+        if isinstance(index, IVFIndex):
+            return index.search_many(query_embeddings, top_k, mask=mask, nprobe=nprobe)
+        return index.search_many(query_embeddings, top_k, mask=mask)
+
+    def _hybrid_search(self, queries, query_embeddings, index, lexical_index, mask, lexical_mask, top_k,
+                       hybrid_weight, nprobe):
+        """Per-query fusion of cosine and BM25 scores over the union of both candidate lists.
+
+        BM25 scores are divided by the query's best candidate score so both
+        signals are on a 0-1 scale before weighting; a candidate missing from
+        one list still gets its exact score from the other index.
+        """
+        n_candidates = max(4 * top_k, 20)
+        vector_lists = self._vector_search(index, query_embeddings, n_candidates, mask, nprobe)
+        normalized_queries = normalize_rows(query_embeddings)
+
+        result_lists = []
+        for query, query_embedding, vector_results in zip(queries, normalized_queries, vector_lists):
+            lexical_scores = lexical_index.scores(query)
+            allowed = lexical_scores > 0
+            if lexical_mask is not None:
+                allowed &= lexical_mask
+            lexical_rows = np.flatnonzero(allowed)
+            lexical_rows = lexical_rows[top_k_indices(lexical_scores[lexical_rows], n_candidates)]
+
+            cosine = dict(vector_results)
+            candidates = list(cosine) + [
+                lexical_index.ids[row] for row in lexical_rows if lexical_index.ids[row] not in cosine
+            ]
+            for chunk_id in candidates:
+                if chunk_id not in cosine:
+                    row = index.id_to_row.get(chunk_id)
+                    cosine[chunk_id] = float(index.matrix[row] @ query_embedding) if row is not None else 0.0
+
+            bm25 = {
+                chunk_id: float(lexical_scores[lexical_index.id_to_row[chunk_id]]) if chunk_id in lexical_index else 0.0
+                for chunk_id in candidates
+            }
+            best_bm25 = max(bm25.values(), default=0.0) or 1.0
+
+            fused = [
+                (chunk_id, hybrid_weight * cosine[chunk_id] + (1 - hybrid_weight) * bm25[chunk_id] / best_bm25)
+                for chunk_id in candidates
+            ]
+            fused.sort(key=lambda item: item[1], reverse=True)
+            result_lists.append(fused[:top_k])
+        return result_lists
+
+    def retrieve_relevant_chunks(self, query, all_chunks, document_embeddings, top_k=5, user_level=None, security_levels=None):
+        """Retrieve top-k relevant chunks from the all_chunks ChunkStore using embedding similarity.
+
+        If user_level is given, all_chunks may be the unfiltered corpus and the
+        clearance check is applied as a precomputed mask while scoring.
+        """
         # Get query embedding
-        query_embedding = self.embedding_engine.get_embedding(query)
+        query_embedding = self.embedding_engine.get_query_embedding(query)
         if not query_embedding:
-            return []
-        
-        # Create a dictionary to map chunk IDs to their indices
-        chunk_index_map = {chunk["id"]: i for i, chunk in enumerate(all_chunks)}
-        
-        # Compute similarities between query and all chunks
-        similarities = []
-        for chunk_id, chunk_embedding in document_embeddings.items():
-            # Check if chunk_id exists in our chunks (it might have been filtered)
-            if chunk_id in chunk_index_map:
-                similarity = self.vector_similarity(query_embedding, chunk_embedding)
-                similarities.append((chunk_id, similarity))
-        
-        # Sort by similarity score in descending order
-        similarities.sort(key=lambda x: x[1], reverse=True)
-        
-        # Get top-k most similar chunks
-        top_chunk_ids = [chunk_id for chunk_id, _ in similarities[:top_k]]
-        
+            # Fall back to lexical matching so the query still gets an answer
+            return self.retrieve_many([query], all_chunks, document_embeddings, top_k,
+                                      user_level=user_level, security_levels=security_levels, mode="lexical")
+
+        # Score every chunk in one pass, restricted to chunks the user may see
+        snapshot = self.prepare(all_chunks, document_embeddings, security_levels, lexical=False)
+        vector_state = snapshot.vectors[self.index_type]
+        top_matches = vector_state[0].search(query_embedding, top_k, mask=self._mask(vector_state, user_level))
+
         # Map chunk IDs back to the original chunks
         relevant_chunks = []
         scores = {}
-        
-        for chunk_id in top_chunk_ids:
-            index = chunk_index_map[chunk_id]
-            chunk = all_chunks[index]
-            relevant_chunks.append(chunk)
-            
+
+        for chunk_id, score in top_matches:
+            relevant_chunks.append(all_chunks.get(chunk_id))
             # Store the similarity score for debugging
-            score = next((score for id, score in similarities if id == chunk_id), 0)
             scores[chunk_id] = score
-        
+
+        return relevant_chunks, scores
+
+    def _score_candidates(self, candidate_ids, queries, query_embeddings, index, mask, top_k):
+        """Rank externally supplied candidates (e.g. entity graph neighbours) by their best score over the queries.
+
+        Vector and hybrid modes use cosine similarity against the query
+        embeddings already computed; lexical mode uses BM25. Candidates the
+        mask does not allow are dropped.
+        """
+        rows = [index.id_to_row[chunk_id] for chunk_id in candidate_ids if chunk_id in index.id_to_row]
+        rows = np.asarray([row for row in rows if mask is None or mask[row]], dtype=np.int64)
+        if len(rows) == 0:
+            return []
+        if query_embeddings is not None:
+            scores = (index.matrix[rows] @ normalize_rows(query_embeddings).T).max(axis=1)
+        else:
+            scores = np.max([index.scores(query)[rows] for query in queries], axis=0)
+        best = top_k_indices(scores, top_k)
+        return [(index.ids[rows[i]], float(scores[i])) for i in best]
+
+    @traced("retrieve")
+    def retrieve_many(self, queries, all_chunks, document_embeddings, top_k=5, fusion="max", user_level=None,
+                      security_levels=None, mode="vector", entity_chunk_ids=None, index_type=None, nprobe=None,
+                      hybrid_weight=None, timeout=None):
+        """Retrieve top-k chunks for several queries at once and fuse the rankings.
+
+        All queries are embedded in one batch and scored with a single
+        matrix-matrix product. fusion selects how per-query results are
+        combined: "max" (best score) or "rrf" (reciprocal rank fusion).
+        mode is "vector", "lexical" (BM25 only) or "hybrid" (cosine and BM25
+        fused per query); if no query can be embedded, retrieval falls back to
+        the lexical index and last_mode records it.
+        user_level applies the clearance mask as in retrieve_relevant_chunks.
+        entity_chunk_ids (e.g. chunks near the query's entities in the entity
+        graph) are ranked against the queries and fused as one more result list.
+        index_type, nprobe (IVF lists probed), hybrid_weight and timeout (seconds
+        to wait for query embeddings) apply to this call only and default to
+        the engine's settings, so callers sharing the engine do not affect
+        each other.
+        """
+        if fusion not in FUSION_STRATEGIES:
+            raise ValueError(f"Unknown fusion strategy: {fusion}")
+        if mode not in RETRIEVAL_MODES:
+            raise ValueError(f"Unknown retrieval mode: {mode}")
+        index_type = index_type or self.index_type
+        nprobe = nprobe or self.nprobe
+        hybrid_weight = self.hybrid_weight if hybrid_weight is None else hybrid_weight
+        timeout = self.embedding_timeout if timeout is None else timeout
+        # Every index and mask below comes from this one snapshot
+        snapshot = self.prepare(all_chunks, document_embeddings, security_levels,
+                                vector=mode != "lexical", lexical=mode != "vector", index_type=index_type)
+
+        # Embed all queries together, skipping any that failed
+        embedded_queries, query_embeddings = [], []
+        if mode != "lexical":
+            for query, embedding in zip(queries, self._embed_queries(queries, timeout)):
+                if embedding:
+                    embedded_queries.append(query)
+                    query_embeddings.append(embedding)
+            if not query_embeddings:
+                mode = "lexical"
+        self.last_mode = mode
+        tracer.current_span().set(mode=mode, queries=len(queries), embedded_queries=len(embedded_queries))
+
+        if mode == "lexical":
+            if snapshot.lexical is None:
+                # Fell back from vector mode
+                snapshot = self.prepare(all_chunks, document_embeddings, security_levels, vector=False)
+            lexical_index = snapshot.lexical[0]
+            lexical_mask = self._mask(snapshot.lexical, user_level)
+            result_lists = lexical_index.search_many(queries, top_k, mask=lexical_mask)
+            if entity_chunk_ids:
+                result_lists.append(
+                    self._score_candidates(entity_chunk_ids, queries, None, lexical_index, lexical_mask, top_k)
+                )
+        else:
+            query_embeddings = np.asarray(query_embeddings, dtype=np.float32)
+            vector_state = snapshot.vectors[index_type]
+            index = vector_state[0]
+            mask = self._mask(vector_state, user_level)
+            if mode == "hybrid":
+                lexical_index = snapshot.lexical[0]
+                lexical_mask = self._mask(snapshot.lexical, user_level)
+                result_lists = self._hybrid_search(
+                    embedded_queries, query_embeddings, index, lexical_index, mask, lexical_mask, top_k,
+                    hybrid_weight, nprobe
+                )
+            else:
+                result_lists = self._vector_search(index, query_embeddings, top_k, mask, nprobe)
+            if entity_chunk_ids:
+                result_lists.append(
+                    self._score_candidates(entity_chunk_ids, embedded_queries, query_embeddings, index, mask, top_k)
+                )
+
+        fused = FUSION_STRATEGIES[fusion](result_lists)
+        ranked = sorted(fused.items(), key=lambda item: item[1], reverse=True)[:top_k]
+
+        # Only the returned chunks are built from the store's columns
+        relevant_chunks = [all_chunks.get(chunk_id) for chunk_id, _ in ranked]
+        scores = dict(ranked)
+        tracer.current_span().set(results=len(relevant_chunks))
         return relevant_chunks, scores
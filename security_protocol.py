@@ -1,5 +1,14 @@
+import numpy as np
+
+from tracing import traced
+
 class SecurityProtocol:
     """Handles enforcement of security protocols for information access"""
+
+    # Highest clearance level a user can hold
+    MAX_CLEARANCE = 4
+    # Stored for chunks whose level cannot be read; no clearance grants access to them
+    UNREADABLE_LEVEL = np.iinfo(np.int8).max
     
     @staticmethod
     def check_clearance(user_level, required_level):
@@ -20,6 +29,7 @@ class SecurityProtocol:
         return user_level >= required_level
     
     @staticmethod
+    @traced("filter_by_clearance")
     def filter_by_clearance(chunks, user_level):
         """Filter chunks based on user clearance level"""
         filtered_chunks = []
@@ -30,3 +40,43 @@ class SecurityProtocol:
                 filtered_chunks.append(chunk)
         
         return filtered_chunks
+
+    @staticmethod
+    def coerce_level(level):
+        """A chunk's security level as an int8 value; unreadable levels become UNREADABLE_LEVEL"""
+        try:
+            level = int(level)
+        except (TypeError, ValueError):
+            return SecurityProtocol.UNREADABLE_LEVEL
+        return min(max(level, 0), SecurityProtocol.UNREADABLE_LEVEL)
+
+    @staticmethod
+    def security_level_column(chunks):
+        """Coerce every chunk's security level once into a compact int8 column"""
+        levels = np.empty(len(chunks), dtype=np.int8)
+        for i, chunk in enumerate(chunks):
+            levels[i] = SecurityProtocol.coerce_level(chunk.get("security_level", 1))
+        return levels
+
+    @staticmethod
+    def build_clearance_masks(levels):
+        """Precompute one boolean access mask per clearance level.
+
+        Row u of the result selects the entries a user with clearance u may
+        see, matching check_clearance for every level up to MAX_CLEARANCE.
+        """
+        levels = np.asarray(levels, dtype=np.int8)
+        readable = levels[levels != SecurityProtocol.UNREADABLE_LEVEL]
+        top_level = max(SecurityProtocol.MAX_CLEARANCE, int(readable.max()) if len(readable) else 0)
+        return levels[np.newaxis, :] <= np.arange(top_level + 1, dtype=np.int16)[:, np.newaxis]
+
+    @staticmethod
+    def clearance_mask(masks, user_level):
+        """Select the precomputed mask for user_level"""
+        try:
+            user_level = int(user_level)
+        except (TypeError, ValueError):
+            return np.zeros(masks.shape[1], dtype=bool)
+        if user_level < 0:
+            return np.zeros(masks.shape[1], dtype=bool)
+        return masks[min(user_level, len(masks) - 1)]
@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+# The modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+@pytest.fixture
+def workdir(tmp_path, monkeypatch):
+    """Run in an empty directory, since the pipeline reads and writes relative data/ paths"""
+    monkeypatch.chdir(tmp_path)
+    os.makedirs("data/chunks")
+    os.makedirs("data/embeddings")
+    return tmp_path
+
+def make_corpus_service(chunks=80, documents=2, dim=64, seed=0, **llm_options):
+    """A CorpusService over a generated DOCX corpus, with the hashing embedding backend and the fake LLM"""
+    from benchmarks.corpus import generate_docx_corpus
+    from async_client import AsyncClient
+    from corpus_service import CorpusService
+    from embedding_backends import HashingEmbeddingBackend
+    from embedding_engine import EmbeddingEngine
+    from ingest import load_manifest
+    from llm_backends import FakeLLMBackend
+    from response_cache import ResponseCache
+    from response_generator import ResponseGenerator
+
+    document_paths = load_manifest(generate_docx_corpus("corpus", chunks, documents, seed=seed))
+    embedding_engine = EmbeddingEngine(backend=HashingEmbeddingBackend(dim), client=AsyncClient("embedding"))
+    response_generator = ResponseGenerator(
+        backend=FakeLLMBackend(**llm_options), cache=ResponseCache(), client=AsyncClient("llm")
+    )
+    return CorpusService(document_paths, embedding_engine, response_generator)
+
+@pytest.fixture
+def corpus_service(workdir):
+    return make_corpus_service()
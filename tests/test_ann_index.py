@@ -0,0 +1,49 @@
+import numpy as np
+
+from ann_index import IVFIndex
+
+def random_vectors(count, dim=16, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dim)).astype(np.float32)
+
+def test_ivf_add_and_remove_keep_rows_lists_and_hashes_aligned():
+    index = IVFIndex(n_lists=4, min_train_size=64)
+    ids = [f"chunk_{i}" for i in range(100)]
+    vectors = random_vectors(100)
+    index.add(ids, vectors, hashes=[f"h{i}" for i in range(100)])
+    assert index.is_trained
+
+    index.remove(ids[:10])
+    index.add(ids[20:25], random_vectors(5, seed=1), hashes=["new"] * 5)
+
+    assert sorted(index.ids) == sorted(ids[10:])
+    assert len(index._assignments) == len(index.ids)
+    assert set(index.hashes) == set(index.ids)
+    assert index.hashes["chunk_20"] == "new" and index.hashes["chunk_30"] == "h30"
+    # With every list probed, the approximate search finds each row as its own nearest neighbour
+    index.nprobe = index.n_lists
+    for chunk_id in ("chunk_15", "chunk_22", "chunk_99"):
+        assert index.search(index.matrix[index.id_to_row[chunk_id]], top_k=1)[0][0] == chunk_id
+
+def test_ivf_hashes_survive_save_and_load_and_mark_stale_rows(workdir):
+    index = IVFIndex(min_train_size=64)
+    ids = [f"chunk_{i}" for i in range(80)]
+    index.add(ids, random_vectors(80), hashes=[f"h{i}" for i in range(80)])
+    index.save("data/chunks/ann_index.npz")
+
+    loaded = IVFIndex.load("data/chunks/ann_index.npz")
+    current = {chunk_id: f"h{i}" for i, chunk_id in enumerate(ids)}
+    current["chunk_3"] = "edited"
+    assert loaded.hashes == index.hashes
+    assert loaded.stale_ids(current) == ["chunk_3"]
+
+def test_ivf_copy_is_independent():
+    index = IVFIndex(min_train_size=64)
+    ids = [f"chunk_{i}" for i in range(80)]
+    index.add(ids, random_vectors(80), hashes=["h"] * 80)
+    copied = index.copy()
+    copied.remove(ids[:5])
+    copied.add(["extra"], random_vectors(1, seed=2), hashes=["x"])
+
+    assert len(index.ids) == 80 and "extra" not in index.id_to_row
+    assert index.hashes == {chunk_id: "h" for chunk_id in ids}
+    assert len(index._assignments) == 80
@@ -0,0 +1,81 @@
+import threading
+
+import pytest
+
+from async_client import AsyncClient, RequestFailed, RetryPolicy, transient_http_errors
+
+class StatusError(Exception):
+    """Shaped like a google.api_core HTTP error"""
+
+    def __init__(self, code):
+        super().__init__(f"HTTP {code}")
+        self.code = code
+
+def failing(errors, result="ok"):
+    """A backend function that raises each of errors in turn, then returns result"""
+    errors = list(errors)
+
+    def fn():
+        if errors:
+            with transient_http_errors():
+                raise errors.pop(0)
+        return result
+    return fn
+
+@pytest.fixture
+def client():
+    client = AsyncClient("test", retry=RetryPolicy(base_delay=0))
+    yield client
+    client.close()
+
+def test_transient_errors_are_retried(client):
+    assert client.call(failing([ConnectionError("reset"), TimeoutError("slow")])) == "ok"
+    stats = client.stats()
+    assert stats["backend_calls"] == 3
+    assert stats["retries"] == 2
+    assert stats["failures"] == 0
+
+def test_permanent_errors_fail_on_the_first_attempt(client):
+    with pytest.raises(RequestFailed) as info:
+        client.call(failing([ValueError("bad request")]))
+    assert info.value.attempts == 1
+    assert isinstance(info.value.__cause__, ValueError)
+    assert client.stats()["retries"] == 0
+
+@pytest.mark.parametrize("code, retried", [(429, True), (503, True), (400, False), (403, False)])
+def test_http_status_decides_retry(client, code, retried):
+    fn = failing([StatusError(code)])
+    if retried:
+        assert client.call(fn) == "ok"
+    else:
+        with pytest.raises(RequestFailed):
+            client.call(fn)
+    assert client.stats()["retries"] == int(retried)
+
+def test_identical_calls_in_flight_share_one_backend_call(client):
+    release = threading.Event()
+    calls = []
+
+    def slow():
+        calls.append(1)
+        release.wait(5)
+        return "shared"
+
+    results = []
+    threads = [
+        threading.Thread(target=lambda: results.append(client.call(slow, key=client.make_key("same"))))
+        for _ in range(4)
+    ]
+    for thread in threads:
+        thread.start()
+    # Let every caller reach the client before the backend call finishes
+    while client.stats()["requests"] < 4:
+        threading.Event().wait(0.01)
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert results == ["shared"] * 4
+    assert len(calls) == 1
+    assert client.stats()["deduplicated"] == 3
+    assert client.stats()["in_flight"] == 0
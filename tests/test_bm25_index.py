@@ -0,0 +1,26 @@
+from benchmarks.corpus import generate_chunks
+from bm25_index import BM25Index
+from chunk_store import ChunkStore
+
+def bm25_for(chunks):
+    index = BM25Index()
+    index.sync(chunks)
+    return index
+
+def test_bm25_synced_returns_itself_when_nothing_changed():
+    chunks = ChunkStore.from_chunks(generate_chunks(50))
+    index = bm25_for(chunks)
+    assert index.synced(chunks) is index
+
+def test_bm25_synced_updates_a_copy():
+    chunks = generate_chunks(50)
+    index = bm25_for(ChunkStore.from_chunks(chunks))
+    edited_id, removed_id = chunks[0]["id"], chunks[-1]["id"]
+    chunks = [dict(chunks[0], text="Zanzibar courier handoff")] + chunks[1:-1]
+
+    updated = index.synced(ChunkStore.from_chunks(chunks), changed_ids=[edited_id])
+
+    assert updated is not index
+    assert removed_id in index.id_to_row and removed_id not in updated.id_to_row
+    assert updated.search("zanzibar", top_k=1)[0][0] == edited_id
+    assert index.search("zanzibar", top_k=1) == []
@@ -0,0 +1,92 @@
+import os
+import asyncio
+import threading
+
+import numpy as np
+
+from benchmarks.corpus import generate_docx_corpus
+from ingest import ingest_corpus
+from query_service import QueryService
+from vector_index import normalize_rows
+from conftest import make_corpus_service
+
+def rewrite_corpus(seed):
+    """Regenerate the test corpus with new text and clearance levels, replacing each file atomically"""
+    generate_docx_corpus("staging", 80, 2, seed=seed)
+    for file_name in os.listdir("staging"):
+        os.replace(os.path.join("staging", file_name), os.path.join("corpus", file_name))
+
+def test_queries_during_reloads_stay_within_clearance(corpus_service):
+    corpus_service.ensure_loaded()
+    service = QueryService(corpus_service, max_concurrency=4, top_k=10, mode="hybrid")
+    done = threading.Event()
+    errors = []
+
+    def reload():
+        try:
+            for seed in (1, 2, 3):
+                rewrite_corpus(seed)
+                corpus_service.ensure_loaded()
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    async def query():
+        results = []
+        while not done.is_set():
+            results.extend(await asyncio.gather(*(
+                service.answer("What is the status of Operation Eclipse extraction?", level) for level in (1, 2, 3)
+            )))
+        return results
+
+    thread = threading.Thread(target=reload)
+    thread.start()
+    try:
+        results = asyncio.run(query())
+    finally:
+        thread.join()
+        service.close()
+
+    assert not errors, errors[0]
+    assert corpus_service.load_count == 4
+    assert results
+    for result in results:
+        assert "error" not in result, result["error"]
+        for chunk in result["chunks"]:
+            assert chunk["security_level"] <= result["clearance"]
+
+def test_ivf_index_reinserts_edited_chunks_after_restart(workdir):
+    service = make_corpus_service()
+    service.retrieval_engine.index_type = "ivf"
+    service.ensure_loaded()
+
+    # Edit every document and ingest it from the command line, so the restarted service sees no chunk changes
+    rewrite_corpus(seed=1)
+    ingest_corpus(service.document_paths)
+    restarted = make_corpus_service(seed=1)
+    restarted.retrieval_engine.index_type = "ivf"
+    restarted.ensure_loaded()
+    assert not any(entry["changes"]["changed"] for entry in restarted.ingest_metrics["documents"])
+
+    index = restarted.snapshot.vectors["ivf"][0]
+    embeddings = restarted.snapshot.embeddings
+    assert sorted(index.ids) == sorted(embeddings)
+    stale = [
+        chunk_id for chunk_id in index.ids
+        if not np.allclose(index.matrix[index.id_to_row[chunk_id]], normalize_rows(embeddings[chunk_id]), atol=1e-5)
+    ]
+    assert stale == []
+
+def test_reload_keeps_every_index_type_in_use(corpus_service):
+    corpus_service.ensure_loaded()
+    snapshot = corpus_service.snapshot
+    corpus_service.retrieval_engine.retrieve_many(
+        ["Operation Eclipse extraction"], snapshot.chunks, snapshot.embeddings, user_level=3, index_type="ivf"
+    )
+
+    rewrite_corpus(seed=1)
+    corpus_service.ensure_loaded()
+
+    assert corpus_service.snapshot is not snapshot
+    assert set(corpus_service.snapshot.vectors) == {"exact", "ivf"}
@@ -0,0 +1,26 @@
+import random
+
+import pytest
+
+from document_processor import DocumentProcessor
+
+def random_paragraph(rng):
+    sentences = [
+        " ".join(rng.choice(["extraction", "courier", "Eclipse", "relay", "safehouse", "at", "the"])
+                 for _ in range(rng.randint(3, 40))) + rng.choice([".", "!", "?"])
+        for _ in range(rng.randint(1, 12))
+    ]
+    paragraph = rng.choice([" ", "  ", " \t"]).join(sentences)
+    # Leading and trailing whitespace, as python-docx returns for indented or untidy paragraphs
+    return rng.choice(["", " ", "   "]) + paragraph + rng.choice(["", " ", "  \t"])
+
+@pytest.mark.parametrize("overlap_tokens", [0, 20])
+def test_chunk_text_matches_its_offsets(overlap_tokens):
+    rng = random.Random(0)
+    for _ in range(300):
+        paragraphs = [random_paragraph(rng) for _ in range(rng.randint(1, 8))]
+        section = "\n".join(paragraphs)
+        chunks = list(DocumentProcessor.stream_chunks(iter(paragraphs), max_tokens=64, min_tokens=5,
+                                                      overlap_tokens=overlap_tokens))
+        for start, end, text in chunks:
+            assert text == section[start:end]
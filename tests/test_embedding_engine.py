@@ -0,0 +1,63 @@
+import pickle
+
+import numpy as np
+
+from async_client import AsyncClient
+from benchmarks.corpus import generate_chunks
+from embedding_backends import HashingEmbeddingBackend
+from embedding_cache import EmbeddingCache
+from embedding_engine import EmbeddingEngine
+from embedding_store import EmbeddingStore
+
+def make_engine(dim=32):
+    return EmbeddingEngine(backend=HashingEmbeddingBackend(dim), client=AsyncClient("embedding"))
+
+def test_unchanged_chunks_are_not_embedded_again(workdir):
+    engine = make_engine()
+    chunks = generate_chunks(30, documents=1)
+    first = engine.compute_document_embeddings(chunks, "Doc_0")
+    calls = engine.backend.calls
+
+    again = engine.compute_document_embeddings(chunks, "Doc_0")
+    assert engine.backend.calls == calls
+    assert list(again) == list(first)
+    assert engine.last_hashes == {
+        chunk["id"]: EmbeddingCache.make_key(engine.model_name, chunk["text"]) for chunk in chunks
+    }
+
+def test_edited_added_and_removed_chunks_are_detected(workdir):
+    engine = make_engine()
+    chunks = generate_chunks(30, documents=1)
+    before = engine.compute_document_embeddings(chunks, "Doc_0")
+    edited_id = chunks[3]["id"]
+    before_vector = np.array(before[edited_id])
+
+    # Chunk ids are positional, so an edit keeps the id and only the text tells it apart
+    chunks[3] = dict(chunks[3], text="Operation Nightfall moved to the northern safehouse.")
+    removed_id = chunks.pop()["id"]
+    chunks.append(dict(chunks[0], id="Doc_0_Section 9_999", text="A new chunk about courier relays."))
+    after = engine.compute_document_embeddings(chunks, "Doc_0")
+
+    assert set(after) == {chunk["id"] for chunk in chunks}
+    assert removed_id not in after
+    assert not np.allclose(after[edited_id], before_vector)
+    assert np.allclose(after[edited_id], engine.backend.embed_batch([chunks[3]["text"]])[0])
+    store = EmbeddingStore("data/embeddings/Doc_0")
+    hashes = dict(zip(store.load()[0], store.load_hashes()))
+    assert hashes[edited_id] == EmbeddingCache.make_key(engine.model_name, chunks[3]["text"])
+
+def test_migrated_pickle_rows_are_embedded_again(workdir):
+    engine = make_engine()
+    chunks = generate_chunks(20, documents=1)
+    # Written by an older chunker, so the same ids held different text
+    legacy = {chunk["id"]: [float(i)] * 32 for i, chunk in enumerate(chunks, start=1)}
+    with open("data/embeddings/Doc_0_embeddings.pkl", "wb") as f:
+        pickle.dump(legacy, f)
+
+    embeddings = engine.compute_document_embeddings(chunks, "Doc_0")
+
+    expected = engine.backend.embed_batch([chunk["text"] for chunk in chunks])
+    assert all(np.allclose(embeddings[chunk["id"]], vector) for chunk, vector in zip(chunks, expected))
+    store = EmbeddingStore("data/embeddings/Doc_0")
+    hashes = dict(zip(store.load()[0], store.load_hashes()))
+    assert hashes == {chunk["id"]: EmbeddingCache.make_key(engine.model_name, chunk["text"]) for chunk in chunks}
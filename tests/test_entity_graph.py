@@ -0,0 +1,51 @@
+import pytest
+
+from benchmarks.corpus import generate_chunks
+from entity_graph import EntityGraph
+from query_processor import QueryProcessor
+
+@pytest.fixture
+def chunks():
+    return generate_chunks(200, documents=2)
+
+@pytest.fixture
+def graph(workdir, chunks):
+    graph = EntityGraph.build(chunks, QueryProcessor().entity_matcher)
+    graph.save()
+    return EntityGraph.load()
+
+def expected_chunks_near(chunks, chunk_entities, entity, hops):
+    """Chunk hops computed directly from the chunks: mentions are 1 hop, a shared section or entity adds one"""
+    def section(chunk):
+        return chunk["document"], chunk["section"]
+
+    found = {chunk["id"]: 1 for chunk in chunks if entity in chunk_entities[chunk["id"]]}
+    frontier = list(found)
+    for hop in range(2, hops + 1):
+        by_id = {chunk["id"]: chunk for chunk in chunks}
+        sections = {section(by_id[chunk_id]) for chunk_id in frontier}
+        entities = {name for chunk_id in frontier for name in chunk_entities[chunk_id]}
+        frontier = [
+            chunk["id"] for chunk in chunks
+            if chunk["id"] not in found
+            and (section(chunk) in sections or entities.intersection(chunk_entities[chunk["id"]]))
+        ]
+        found.update((chunk_id, hop) for chunk_id in frontier)
+    return found
+
+def test_loading_does_no_traversal(graph):
+    assert graph._entity_table == {}
+
+@pytest.mark.parametrize("hops", [1, 2, 3])
+def test_hops_are_counted_in_chunks(graph, chunks, hops):
+    entities = [node[len("entity:"):] for node in graph.nodes if node.startswith("entity:")]
+    assert entities
+    for name in entities:
+        assert graph.chunks_near([name], hops) == expected_chunks_near(chunks, graph.chunk_entities, name, hops)
+    assert len(graph._entity_table) == (len(entities) if hops <= graph.max_hops else 0)
+
+def test_two_hops_reach_further_than_one(graph):
+    entity = next(node[len("entity:"):] for node in graph.nodes if node.startswith("entity:"))
+    near, further = graph.chunks_near([entity], 1), graph.chunks_near([entity], 2)
+    assert set(near) < set(further)
+    assert set(further.values()) == {1, 2}
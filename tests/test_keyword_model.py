@@ -0,0 +1,11 @@
+import math
+
+from keyword_model import KeywordModel
+
+def test_unseen_terms_get_the_idf_of_a_term_in_no_document():
+    texts = ["Operation Eclipse extraction", "Eclipse relay courier", "safehouse courier"]
+    model = KeywordModel.fit(texts)
+
+    assert math.isclose(model.default_idf, math.log((1 + len(texts)) / (1 + 0)) + 1)
+    assert model.default_idf > max(model.idf.values())
+    assert model.score("nightfall eclipse")["nightfall"] == model.default_idf
@@ -0,0 +1,34 @@
+import pytest
+
+from llm_backends import GeminiLLMBackend
+
+generation_types = pytest.importorskip("google.generativeai.types.generation_types")
+protos = pytest.importorskip("google.generativeai.protos")
+
+def response_chunk(text=None, finish_reason=None):
+    """One streamed response chunk, as the Gemini SDK yields it"""
+    candidate = protos.Candidate(content=protos.Content(parts=[protos.Part(text=text)] if text else []))
+    if finish_reason is not None:
+        candidate.finish_reason = finish_reason
+    return generation_types.GenerateContentResponse.from_response(protos.GenerateContentResponse(candidates=[candidate]))
+
+class FakeModel:
+    def __init__(self, chunks):
+        self.chunks = chunks
+
+    def generate_content(self, user_message, stream=False):
+        return iter(self.chunks)
+
+def test_stream_skips_chunks_without_text(monkeypatch):
+    chunks = [
+        response_chunk("Operation Eclipse "),
+        response_chunk("is on hold."),
+        response_chunk(finish_reason=protos.Candidate.FinishReason.STOP),
+        response_chunk(finish_reason=protos.Candidate.FinishReason.SAFETY)
+    ]
+    with pytest.raises(ValueError):
+        chunks[2].text
+    backend = GeminiLLMBackend()
+    monkeypatch.setattr(backend, "_model", lambda system_prompt: FakeModel(chunks))
+
+    assert list(backend.stream("system", "user")) == ["Operation Eclipse ", "is on hold."]
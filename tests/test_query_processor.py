@@ -0,0 +1,19 @@
+from query_processor import QueryProcessor
+
+def test_corpus_names_are_filtered(workdir):
+    processor = QueryProcessor()
+    added = processor.add_corpus_entities(["Nightfall", "S", "team", "The", "Phantom", "Eclipse"])
+
+    # Only "Nightfall" is new: "S" is too short, "team" is not a proper noun, "The" is a stop word,
+    # "Phantom" is the first word of "Phantom Veil" and "Eclipse" is already known
+    assert added == 1
+    assert "Nightfall" in processor.entity_matcher
+    assert "S" not in processor.entity_matcher
+    assert "Phantom" not in processor.entity_matcher
+
+def test_learned_names_are_matched_in_queries(workdir):
+    processor = QueryProcessor()
+    processor.add_corpus_entities(["Nightfall", "S", "Phantom"])
+
+    entities = processor.analyze_query("Is Operation Phantom Veil linked to Nightfall's assets?")["entities"]
+    assert entities["operations"] == ["Phantom Veil", "Nightfall"]
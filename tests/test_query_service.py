@@ -0,0 +1,70 @@
+import io
+import json
+import asyncio
+
+import pytest
+
+from query_service import QueryService, parse_request, parse_options, run_batch, MAX_TOP_K
+
+@pytest.mark.parametrize("payload", [[1, 2], "query", None, {"query": ""}, {"query": "x"}, {"query": "x", "clearance": 9}])
+def test_parse_request_rejects_invalid_requests(payload):
+    with pytest.raises(ValueError):
+        parse_request(payload)
+
+def test_parse_request():
+    assert parse_request({"query": "Status?", "clearance": "3"}) == ("Status?", 3)
+
+@pytest.mark.parametrize("top_k", [0, -1, 2.5, "5", True, MAX_TOP_K + 1])
+def test_parse_options_rejects_invalid_top_k(top_k):
+    with pytest.raises(ValueError):
+        parse_options({"top_k": top_k})
+
+def test_parse_options():
+    assert parse_options({"query": "x", "top_k": 3, "mode": "hybrid"}) == {"top_k": 3, "mode": "hybrid"}
+    with pytest.raises(ValueError):
+        parse_options({"mode": "semantic"})
+
+def test_batch_keeps_going_past_invalid_lines(corpus_service):
+    service = QueryService(corpus_service, max_concurrency=4)
+    lines = [
+        json.dumps({"query": "What is the status of Operation Eclipse?", "clearance": 4}),
+        "[1, 2]",
+        "not json",
+        json.dumps({"query": "Where is the safehouse?", "clearance": 2})
+    ]
+    output = io.StringIO()
+    try:
+        assert asyncio.run(run_batch(service, lines, output)) == 4
+    finally:
+        service.close()
+
+    results = [json.loads(line) for line in output.getvalue().splitlines()]
+    assert [result.get("line") for result in results] == [None, 2, 3, None]
+    assert "response" in results[0] and "response" in results[3]
+    assert results[1]["error"] == "request must be a JSON object"
+
+def test_http_rejects_invalid_top_k(corpus_service):
+    import threading
+    import urllib.request
+    import urllib.error
+    from http.server import ThreadingHTTPServer
+    from query_service import make_handler
+
+    service = QueryService(corpus_service)
+    loop = asyncio.new_event_loop()
+    server = ThreadingHTTPServer(("127.0.0.1", 0), make_handler(service, loop))
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    try:
+        request = urllib.request.Request(
+            f"http://127.0.0.1:{server.server_address[1]}/query",
+            data=json.dumps({"query": "Status?", "clearance": 2, "top_k": 0}).encode()
+        )
+        with pytest.raises(urllib.error.HTTPError) as error:
+            urllib.request.urlopen(request, timeout=10)
+        assert error.value.code == 400
+        assert "top_k" in json.loads(error.value.read())["error"]
+    finally:
+        server.shutdown()
+        server.server_close()
+        loop.close()
+        service.close()
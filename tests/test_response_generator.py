@@ -0,0 +1,57 @@
+from async_client import AsyncClient, RetryPolicy
+from llm_backends import FakeLLMBackend
+from response_cache import ResponseCache
+from response_generator import ResponseGenerator
+
+QUERY = "What is the status of Operation Eclipse?"
+ANALYSIS = {"entities": {}}
+CHUNKS = [{"id": "Doc_0_chunk_0", "text": "Operation Eclipse is on hold.", "security_level": 1}]
+
+class TruncatedLLMBackend(FakeLLMBackend):
+    """Streams a few words of the answer, then loses the connection"""
+
+    def stream(self, system_prompt, user_message):
+        pieces = super().stream(system_prompt, user_message)
+        for _ in range(3):
+            yield next(pieces)
+        raise ConnectionError("stream reset")
+
+class EmptyLLMBackend(FakeLLMBackend):
+    """Finishes the stream without producing any text"""
+
+    def stream(self, system_prompt, user_message):
+        self.calls += 1
+        return iter(())
+
+def make_generator(backend):
+    return ResponseGenerator(backend=backend, cache=ResponseCache(),
+                             client=AsyncClient("llm", retry=RetryPolicy(base_delay=0)))
+
+def stream(generator):
+    return "".join(generator.generate_response_stream(QUERY, ANALYSIS, CHUNKS, 1))
+
+def test_complete_stream_is_cached():
+    generator = make_generator(FakeLLMBackend())
+    answer = stream(generator)
+    assert stream(generator) == answer
+    assert generator.last_timings["cached"]
+    assert generator.backend.calls == 1
+
+def test_truncated_stream_is_not_cached():
+    generator = make_generator(TruncatedLLMBackend())
+    answer = stream(generator)
+    assert "stream reset" in answer and generator.backend.calls == 1
+    assert generator.cache.get(generator.model_name, 1, QUERY, CHUNKS) is None
+
+def test_abandoned_stream_is_not_cached():
+    generator = make_generator(FakeLLMBackend())
+    pieces = generator.generate_response_stream(QUERY, ANALYSIS, CHUNKS, 1)
+    next(pieces)
+    pieces.close()
+    assert generator.cache.get(generator.model_name, 1, QUERY, CHUNKS) is None
+
+def test_empty_stream_is_not_cached():
+    generator = make_generator(EmptyLLMBackend())
+    assert stream(generator) == ""
+    assert stream(generator) == ""
+    assert generator.backend.calls == 2
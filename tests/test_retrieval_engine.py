@@ -0,0 +1,129 @@
+import threading
+
+import numpy as np
+import pytest
+
+from async_client import AsyncClient
+from ann_index import IVFIndex
+from bm25_index import BM25Index
+from benchmarks.corpus import generate_chunks
+from chunk_store import ChunkStore
+from embedding_backends import HashingEmbeddingBackend
+from embedding_engine import EmbeddingEngine
+from retrieval_engine import RetrievalEngine
+from security_protocol import SecurityProtocol
+from vector_index import VectorIndex
+
+QUERIES = ["Operation Eclipse extraction route", "safehouse perimeter checkpoint", "courier signal relay channel"]
+
+def make_engine(index_type="exact", dim=32):
+    embedding_engine = EmbeddingEngine(backend=HashingEmbeddingBackend(dim), client=AsyncClient("embedding"))
+    return RetrievalEngine(embedding_engine, index_type=index_type, index_path="data/chunks/ann_index.npz",
+                           lexical_index_path="data/chunks/bm25_index.npz")
+
+def make_version(engine, seed, count=200):
+    """A ChunkStore and embeddings; versions share chunk ids but not text or security levels"""
+    chunks = ChunkStore.from_chunks(generate_chunks(count, seed=seed))
+    vectors = engine.embedding_engine.backend.embed_batch(list(chunks.texts()))
+    return chunks, dict(zip(chunks.ids, vectors))
+
+@pytest.mark.parametrize("index_type", ["exact", "ivf"])
+def test_retrieval_during_reloads_sees_one_version(workdir, index_type):
+    engine = make_engine(index_type)
+    if index_type == "ivf":
+        # Small enough to train on the test corpus, so the trained IVF path is exercised
+        IVFIndex(min_train_size=64).save(engine.index_path)
+    chunks, embeddings = make_version(engine, seed=0)
+    engine.prepare(chunks, embeddings)
+
+    done = threading.Event()
+    errors = []
+    checked = [0]
+
+    def reload():
+        try:
+            for i in range(1, 7):
+                chunks, embeddings = make_version(engine, seed=i % 2)
+                # As ingest_corpus does, the BM25 index is re-indexed before the snapshot is prepared
+                engine.lexical_index = engine.lexical_index.synced(chunks, chunks.ids)
+                engine.prepare(chunks, embeddings, changed_ids=chunks.ids)
+        except Exception as e:
+            errors.append(e)
+        finally:
+            done.set()
+
+    def query(user_level):
+        try:
+            while not done.is_set():
+                snapshot = engine.snapshot
+                for mode in ("vector", "lexical", "hybrid"):
+                    relevant_chunks, scores = engine.retrieve_many(
+                        QUERIES, snapshot.chunks, snapshot.embeddings, top_k=10, user_level=user_level,
+                        security_levels=snapshot.security_levels, mode=mode
+                    )
+                    assert relevant_chunks and len(relevant_chunks) == len(scores)
+                    for chunk in relevant_chunks:
+                        assert chunk["security_level"] <= user_level, (mode, chunk["id"])
+                    checked[0] += 1
+        except Exception as e:
+            errors.append(e)
+
+    threads = [threading.Thread(target=reload)] + [threading.Thread(target=query, args=(level,)) for level in (1, 2, 3)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert not errors, errors[0]
+    assert checked[0] > 0
+
+def test_per_call_settings_do_not_rebuild_or_change_shared_indexes(workdir):
+    engine = make_engine()
+    IVFIndex(min_train_size=64).save(engine.index_path)
+    chunks, embeddings = make_version(engine, seed=0)
+    engine.prepare(chunks, embeddings)
+
+    def retrieve(**settings):
+        return engine.retrieve_many(QUERIES, chunks, embeddings, top_k=5, user_level=3, **settings)
+
+    # Two sessions with different settings, taking turns on the shared engine
+    retrieve(index_type="ivf", nprobe=1, hybrid_weight=0.2, mode="hybrid")
+    retrieve(index_type="exact", mode="hybrid")
+    snapshot = engine.snapshot
+    for _ in range(3):
+        retrieve(index_type="ivf", nprobe=2)
+        retrieve(index_type="exact")
+
+    assert engine.snapshot is snapshot
+    assert set(snapshot.vectors) == {"exact", "ivf"}
+    assert snapshot.vectors["ivf"][0].nprobe == engine.nprobe
+    assert (engine.index_type, engine.hybrid_weight) == ("exact", 0.5)
+
+@pytest.mark.parametrize("make_index", ["bm25", "vector"])
+def test_clearance_masks_align_with_index_rows(make_index):
+    chunks = generate_chunks(60)
+    store = ChunkStore.from_chunks(chunks)
+    if make_index == "bm25":
+        index = BM25Index()
+        index.sync(store)
+        # A tombstoned row keeps its position until compaction
+        index.remove([chunks[5]["id"]])
+    else:
+        index = VectorIndex()
+        vectors = np.random.default_rng(0).standard_normal((61, 16)).astype(np.float32)
+        index.add([chunk["id"] for chunk in chunks] + ["orphan"], vectors)
+    # The corpus no longer holds chunk 5, nor (for the vector index) the orphan row
+    current = [chunk for chunk in chunks if chunk["id"] != chunks[5]["id"]]
+    level_of = {chunk["id"]: chunk["security_level"] for chunk in current}
+
+    present_mask, clearance_masks = RetrievalEngine._row_masks(
+        index, ChunkStore.from_chunks(current), list(level_of.values())
+    )
+
+    assert len(present_mask) == clearance_masks.shape[1] == len(index.ids)
+    for user_level in range(SecurityProtocol.MAX_CLEARANCE + 1):
+        allowed = SecurityProtocol.clearance_mask(clearance_masks, user_level)
+        for row, chunk_id in enumerate(index.ids):
+            expected = chunk_id in level_of and level_of[chunk_id] <= user_level
+            assert allowed[row] == expected, (user_level, chunk_id)
+            assert present_mask[row] == (chunk_id in level_of)
@@ -0,0 +1,325 @@
+import os
+import json
+import time
+import uuid
+import bisect
+import functools
+import threading
+import contextlib
+import contextvars
+from collections import deque
+
+TRACE_FILE = "data/traces/traces.jsonl"
+
+# Upper bounds (seconds) of the stage duration histogram buckets
+DURATION_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+# The trace being recorded in this context and the innermost open span in it
+_current_trace = contextvars.ContextVar("shadow_trace", default=None)
+_current_span = contextvars.ContextVar("shadow_span", default=None)
+
+class _NullSpan:
+    """Stand-in returned when no trace is being recorded; every method does nothing"""
+
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        return False
+
+    def set(self, **attributes):
+        pass
+
+    def add(self, name, value=1):
+        pass
+
+NULL_SPAN = _NullSpan()
+
+class Span:
+    """One timed stage of a trace, with numeric or string attributes (counts, bytes, cache hits...)"""
+
+    __slots__ = ("trace", "span_id", "parent_id", "name", "start", "duration", "attributes", "_tokens")
+
+    def __init__(self, trace, name, parent_id=None, attributes=None):
+        self.trace = trace
+        self.span_id = None
+        self.parent_id = parent_id
+        self.name = name
+        self.start = None
+        self.duration = None
+        self.attributes = attributes or {}
+        self._tokens = None
+
+    def set(self, **attributes):
+        self.attributes.update(attributes)
+
+    def add(self, name, value=1):
+        """Add value to a numeric attribute, starting from zero"""
+        self.attributes[name] = self.attributes.get(name, 0) + value
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        self.span_id = self.trace._append(self)
+        self._tokens = _current_span.set(self)
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.start
+        if exc_type is not None:
+            self.attributes["error"] = exc_type.__name__
+        _current_span.reset(self._tokens)
+        return False
+
+    def to_dict(self):
+        return {
+            "id": self.span_id,
+            "parent": self.parent_id,
+            "name": self.name,
+            "offset_ms": (self.start - self.trace.start) * 1000.0,
+            "duration_ms": None if self.duration is None else self.duration * 1000.0,
+            "attributes": self.attributes
+        }
+
+class Trace:
+    """The spans recorded while handling one request"""
+
+    def __init__(self, name, attributes=None):
+        self.trace_id = uuid.uuid4().hex
+        self.name = name
+        self.attributes = attributes or {}
+        self.timestamp = time.time()
+        self.start = time.perf_counter()
+        self.duration = None
+        self.spans = []
+        self._lock = threading.Lock()
+
+    def _append(self, span):
+        # Spans may come from worker threads, e.g. parallel embedding batches
+        with self._lock:
+            self.spans.append(span)
+            return len(self.spans) - 1
+
+    def stage_durations(self):
+        """{span name: total seconds} over the finished spans"""
+        totals = {}
+        for span in self.spans:
+            if span.duration is not None:
+                totals[span.name] = totals.get(span.name, 0.0) + span.duration
+        return totals
+
+    def rows(self):
+        """Finished spans as display rows, indented by nesting depth, in start order"""
+        depth = {}
+        rows = []
+        for span in self.spans:
+            depth[span.span_id] = depth.get(span.parent_id, -1) + 1 if span.parent_id is not None else 0
+            rows.append({
+                "stage": "  " * depth[span.span_id] + span.name,
+                "offset_ms": round((span.start - self.start) * 1000.0, 3),
+                "duration_ms": None if span.duration is None else round(span.duration * 1000.0, 3),
+                "attributes": ", ".join(f"{key}={value}" for key, value in span.attributes.items())
+            })
+        return rows
+
+    def to_dict(self):
+        return {
+            "trace_id": self.trace_id,
+            "name": self.name,
+            "timestamp": self.timestamp,
+            "duration_ms": None if self.duration is None else self.duration * 1000.0,
+            "attributes": self.attributes,
+            "spans": [span.to_dict() for span in self.spans]
+        }
+
+    def to_json(self):
+        return json.dumps(self.to_dict(), default=str)
+
+class _StageMetrics:
+    """Running totals for one span name, for the Prometheus dump"""
+
+    __slots__ = ("count", "errors", "seconds", "buckets", "attributes")
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.seconds = 0.0
+        self.buckets = [0] * (len(DURATION_BUCKETS) + 1)
+        self.attributes = {}
+
+class Tracer:
+    """Span and timer layer for the query pipeline.
+
+    Spans are only recorded inside a trace started with start() or trace(),
+    and only in the context (thread or task) that started it; propagate()
+    carries a trace into worker threads. Everywhere else span() returns a
+    shared no-op object, so instrumentation costs one context variable lookup
+    when tracing is off. Finished traces are kept in a bounded buffer,
+    optionally appended to a JSON-lines file, and aggregated into per-stage
+    counters and duration histograms that can be dumped in Prometheus text
+    format.
+    """
+
+    def __init__(self, max_traces=100, jsonl_path=None):
+        self.traces = deque(maxlen=max_traces)
+        # When set, every finished trace is appended to this JSON-lines file
+        self.jsonl_path = jsonl_path
+        self._metrics = {}
+        self._lock = threading.Lock()
+
+    def start(self, name, **attributes):
+        """Begin recording a trace in the current context and return it"""
+        trace = Trace(name, attributes)
+        trace._tokens = (_current_trace.set(trace), _current_span.set(None))
+        return trace
+
+    def finish(self, trace):
+        """Stop recording trace; safe to call more than once. Returns the trace."""
+        if trace is None or trace.duration is not None:
+            return trace
+        trace.duration = time.perf_counter() - trace.start
+        trace_token, span_token = trace._tokens
+        try:
+            _current_span.reset(span_token)
+            _current_trace.reset(trace_token)
+        except ValueError:
+            # Finished from another context; the trace still ends here
+            pass
+
+        self._aggregate(trace)
+        self.traces.append(trace)
+        if self.jsonl_path:
+            self.export_jsonl(self.jsonl_path, [trace])
+        return trace
+
+    @contextlib.contextmanager
+    def trace(self, name, enabled=True, **attributes):
+        """Record a trace for the duration of the block; yields the Trace, or None when not enabled"""
+        if not enabled:
+            yield None
+            return
+        trace = self.start(name, **attributes)
+        try:
+            yield trace
+        finally:
+            self.finish(trace)
+
+    def span(self, name, **attributes):
+        """A span for use as a context manager, or NULL_SPAN if no trace is being recorded"""
+        trace = _current_trace.get()
+        if trace is None:
+            return NULL_SPAN
+        parent = _current_span.get()
+        return Span(trace, name, parent.span_id if parent is not None else None, attributes)
+
+    def record(self, name, seconds, **attributes):
+        """Add an already-timed span ending now, e.g. for work spread across a generator's yields"""
+        trace = _current_trace.get()
+        if trace is None:
+            return
+        parent = _current_span.get()
+        span = Span(trace, name, parent.span_id if parent is not None else None, attributes)
+        span.start = time.perf_counter() - seconds
+        span.duration = seconds
+        span.span_id = trace._append(span)
+
+    @staticmethod
+    def current_span():
+        """The innermost open span, or NULL_SPAN; lets callees add counts to their caller's span"""
+        if _current_trace.get() is None:
+            return NULL_SPAN
+        return _current_span.get() or NULL_SPAN
+
+    @staticmethod
+    def propagate(fn):
+        """Wrap fn so it records into the current trace when run on another thread"""
+        trace = _current_trace.get()
+        if trace is None:
+            return fn
+        parent = _current_span.get()
+
+        @functools.wraps(fn)
+        def run(*args, **kwargs):
+            trace_token, span_token = _current_trace.set(trace), _current_span.set(parent)
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                _current_span.reset(span_token)
+                _current_trace.reset(trace_token)
+        return run
+
+    def _aggregate(self, trace):
+        with self._lock:
+            for span in trace.spans:
+                if span.duration is None:
+                    continue
+                metrics = self._metrics.get(span.name)
+                if metrics is None:
+                    metrics = self._metrics[span.name] = _StageMetrics()
+                metrics.count += 1
+                metrics.seconds += span.duration
+                metrics.buckets[bisect.bisect_left(DURATION_BUCKETS, span.duration)] += 1
+                for key, value in span.attributes.items():
+                    if key == "error":
+                        metrics.errors += 1
+                    elif isinstance(value, (int, float)):
+                        metrics.attributes[key] = metrics.attributes.get(key, 0) + value
+
+    def reset_metrics(self):
+        with self._lock:
+            self._metrics = {}
+
+    def export_jsonl(self, path, traces=None):
+        """Append traces (default: the buffered ones) to a JSON-lines file, one trace per line"""
+        traces = list(self.traces) if traces is None else traces
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(path, "a") as f:
+            for trace in traces:
+                f.write(trace.to_json() + "\n")
+        return len(traces)
+
+    def prometheus_text(self, prefix="shadow"):
+        """Per-stage counts, errors, duration histograms and attribute totals in Prometheus text format"""
+        with self._lock:
+            stages = sorted(self._metrics.items())
+            lines = [
+                f"# HELP {prefix}_stage_duration_seconds Duration of traced pipeline stages",
+                f"# TYPE {prefix}_stage_duration_seconds histogram"
+            ]
+            for name, metrics in stages:
+                cumulative = 0
+                for bound, count in zip(DURATION_BUCKETS + ("+Inf",), metrics.buckets):
+                    cumulative += count
+                    lines.append(f'{prefix}_stage_duration_seconds_bucket{{stage="{name}",le="{bound}"}} {cumulative}')
+                lines.append(f'{prefix}_stage_duration_seconds_sum{{stage="{name}"}} {metrics.seconds:.6f}')
+                lines.append(f'{prefix}_stage_duration_seconds_count{{stage="{name}"}} {metrics.count}')
+
+            lines.append(f"# HELP {prefix}_stage_errors_total Traced stages that raised an exception")
+            lines.append(f"# TYPE {prefix}_stage_errors_total counter")
+            for name, metrics in stages:
+                lines.append(f'{prefix}_stage_errors_total{{stage="{name}"}} {metrics.errors}')
+
+            lines.append(f"# HELP {prefix}_stage_attribute_total Sum of numeric span attributes (counts, bytes, cache hits)")
+            lines.append(f"# TYPE {prefix}_stage_attribute_total counter")
+            for name, metrics in stages:
+                for key, value in sorted(metrics.attributes.items()):
+                    lines.append(f'{prefix}_stage_attribute_total{{stage="{name}",attribute="{key}"}} {value:g}')
+        return "\n".join(lines) + "\n"
+
+# Process-wide tracer used by the pipeline modules
+tracer = Tracer()
+
+def traced(name):
+    """Decorator running the function inside a span called name"""
+    def decorate(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            if _current_trace.get() is None:
+                return fn(*args, **kwargs)
+            with tracer.span(name):
+                return fn(*args, **kwargs)
+        return wrapper
+    return decorate
@@ -1,26 +1,59 @@
 import os
-import nltk
-import streamlit as st
-import google.generativeai as genai
+import sys
+import logging
+import functools
 from dotenv import load_dotenv
 
+# Heavy dependencies (streamlit, google.generativeai, nltk, sklearn) are imported
+# inside the functions that need them, so headless entry points start quickly
+
+logger = logging.getLogger("shadow")
+
+# API key Gemini was configured with; setup only runs again until a key is found
+_configured_api_key = None
+
 def setup_environment():
-    """Initialize environment variables and configure the application"""
-    # Download NLTK resources if not already downloaded
+    """Initialize environment variables and configure the application.
+
+    Runs once per process: later calls (e.g. Streamlit reruns) return the
+    configured key without reloading anything.
+    """
+    global _configured_api_key
+    if _configured_api_key is None:
+        # Load environment variables
+        load_dotenv()
+
+        # Set Google API key
+        api_key = os.getenv("GOOGLE_API_KEY")
+        if api_key:
+            import google.generativeai as genai
+            genai.configure(api_key=api_key)
+            _configured_api_key = api_key
+
+    return _configured_api_key
+
+@functools.lru_cache(maxsize=None)
+def ensure_nltk_data(resource="tokenizers/punkt", package="punkt"):
+    """Download an NLTK data package if it is not installed yet; checked once per process"""
+    import nltk
     try:
-        nltk.data.find('tokenizers/punkt')
+        nltk.data.find(resource)
     except LookupError:
-        nltk.download('punkt', quiet=True)
+        nltk.download(package, quiet=True)
 
-    # Load environment variables
-    load_dotenv()
+@functools.lru_cache(maxsize=None)
+def english_stop_words():
+    """scikit-learn's English stop word list, imported on first use"""
+    from sklearn.feature_extraction.text import ENGLISH_STOP_WORDS
+    return ENGLISH_STOP_WORDS
 
-    # Set Google API key
-    api_key = os.getenv("GOOGLE_API_KEY")
-    if api_key:
-        genai.configure(api_key=api_key)
-    
-    return api_key
+def report_error(message):
+    """Show an error on the Streamlit page when running under Streamlit, log it otherwise"""
+    st = sys.modules.get("streamlit")
+    if st is not None and st.runtime.exists():
+        st.error(message)
+    else:
+        logger.error(message)
 
 def setup_directories():
     """Create necessary directories for storing data"""
@@ -29,6 +62,7 @@ def setup_directories():
 
 def setup_page():
     """Configure Streamlit page settings"""
+    import streamlit as st
     st.set_page_config(
         page_title="Project SHADOW - Intelligence Retrieval",
         page_icon="",
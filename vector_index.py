@@ -0,0 +1,156 @@
+import copy
+import numpy as np
+
+def top_k_indices(scores, k):
+    """Indices of the k highest scores, best first, without sorting every score"""
+    k = min(k, len(scores))
+    if k <= 0:
+        return np.empty(0, dtype=np.int64)
+    if k < len(scores):
+        candidates = np.argpartition(-scores, k - 1)[:k]
+    else:
+        candidates = np.arange(len(scores))
+    # Stable sort on the row number keeps ties in insertion order
+    candidates.sort()
+    order = np.argsort(-scores[candidates], kind="stable")
+    return candidates[order]
+
+def normalize_rows(vectors):
+    """L2-normalize each row, leaving all-zero rows as zeros"""
+    vectors = np.asarray(vectors, dtype=np.float32)
+    norms = np.linalg.norm(vectors, axis=-1, keepdims=True)
+    norms[norms == 0] = 1.0
+    return vectors / norms
+
+class VectorIndex:
+    """Exact cosine-similarity index over chunk embeddings.
+
+    Embeddings are normalized once on insertion and kept in a single
+    contiguous float32 matrix, so a query is one matrix-vector product
+    followed by a partial sort for the top-k rows.
+    """
+
+    def __init__(self, dim=None):
+        self.dim = dim
+        self.ids = []
+        self.id_to_row = {}
+        self._matrix = np.empty((0, dim or 0), dtype=np.float32)
+        self._size = 0
+
+    @classmethod
+    def from_embeddings(cls, embeddings):
+        """Build an index from a {chunk_id: embedding} dict"""
+        index = cls()
+        if embeddings:
+            index.add(list(embeddings.keys()), list(embeddings.values()))
+        return index
+
+    def copy(self):
+        """An independent copy, so it can be updated while searches keep using this index"""
+        index = copy.copy(self)
+        index.ids = list(self.ids)
+        index.id_to_row = dict(self.id_to_row)
+        index._matrix = self._matrix.copy()
+        return index
+
+    @property
+    def matrix(self):
+        """Normalized embeddings, one row per indexed chunk"""
+        return self._matrix[:self._size]
+
+    def __len__(self):
+        return self._size
+
+    def __contains__(self, chunk_id):
+        return chunk_id in self.id_to_row
+
+    def _reserve(self, capacity):
+        """Grow the backing matrix geometrically so appends stay amortized O(1)"""
+        if capacity <= self._matrix.shape[0]:
+            return
+        new_capacity = max(capacity, 2 * self._matrix.shape[0], 64)
+        matrix = np.empty((new_capacity, self.dim), dtype=np.float32)
+        matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = matrix
+
+    def add(self, ids, vectors):
+        """Insert or replace embeddings for the given chunk ids"""
+        vectors = normalize_rows(vectors)
+        if vectors.ndim != 2 or len(vectors) != len(ids):
+            raise ValueError("Expected one embedding per id")
+        if self.dim is None or self._size == 0:
+            self.dim = vectors.shape[1]
+            self._matrix = np.empty((0, self.dim), dtype=np.float32)
+        elif vectors.shape[1] != self.dim:
+            raise ValueError(f"Embedding dimension {vectors.shape[1]} does not match index dimension {self.dim}")
+
+        self._reserve(self._size + len(ids))
+        for chunk_id, vector in zip(ids, vectors):
+            row = self.id_to_row.get(chunk_id)
+            if row is None:
+                row = self._size
+                self.id_to_row[chunk_id] = row
+                self.ids.append(chunk_id)
+                self._size += 1
+            self._matrix[row] = vector
+
+    def _move_row(self, source, target):
+        """Move the row at source into target (used when compacting after removals)"""
+        self._matrix[target] = self._matrix[source]
+        chunk_id = self.ids[source]
+        self.ids[target] = chunk_id
+        self.id_to_row[chunk_id] = target
+
+    def remove(self, ids):
+        """Remove chunk ids from the index; the last row fills each gap so the matrix stays contiguous"""
+        rows = sorted((self.id_to_row.pop(chunk_id) for chunk_id in set(ids) if chunk_id in self.id_to_row), reverse=True)
+        for row in rows:
+            last = self._size - 1
+            if row != last:
+                self._move_row(last, row)
+            self.ids.pop()
+            self._size -= 1
+        return len(rows)
+
+    def row_mask(self, chunk_ids):
+        """Boolean mask over index rows that selects the given chunk ids"""
+        mask = np.zeros(self._size, dtype=bool)
+        rows = [self.id_to_row[chunk_id] for chunk_id in chunk_ids if chunk_id in self.id_to_row]
+        mask[rows] = True
+        return mask
+
+    def scores(self, query):
+        """Cosine similarity between the query and every indexed chunk"""
+        query = normalize_rows(query)
+        return self.matrix @ query
+
+    def search(self, query, top_k=5, mask=None):
+        """Return [(chunk_id, score)] for the top_k most similar rows allowed by mask"""
+        if self._size == 0:
+            return []
+        scores = self.scores(query)
+        if mask is not None:
+            top_k = min(top_k, int(np.count_nonzero(mask)))
+            scores = np.where(mask, scores, -np.inf)
+        rows = top_k_indices(scores, top_k)
+        return [(self.ids[row], float(scores[row])) for row in rows]
+
+    def search_many(self, queries, top_k=5, mask=None):
+        """Search several queries with one matrix-matrix product.
+
+        Returns one [(chunk_id, score)] list per query, in query order.
+        """
+        queries = normalize_rows(np.atleast_2d(queries))
+        if self._size == 0:
+            return [[] for _ in range(len(queries))]
+        # (rows, queries) score matrix
+        scores = self.matrix @ queries.T
+        if mask is not None:
+            top_k = min(top_k, int(np.count_nonzero(mask)))
+            scores[~mask] = -np.inf
+
+        results = []
+        for column in scores.T:
+            rows = top_k_indices(column, top_k)
+            results.append([(self.ids[row], float(column[row])) for row in rows])
+        return results